@@ -41,6 +41,12 @@ def get_fill_price_test():
     assert (response3['success'] == 1), "get-fill-price failed: API call failed"
     print("Fill price for 100 BTC: " + str(response3['fill-price']))
 
+    # Quotes may ask for a book no older than a given number of seconds
+    testURL7 = testURL0 + "&max-staleness=0.5"
+    response7 = requests.get(testURL7).json()
+    assert (response7['success'] == 1), "get-fill-price failed: API call failed with max-staleness"
+    print("Fill price for 1 ETH (max 0.5s old book): " + str(response7['fill-price']))
+
     # All these API calls should not be successful
     testURL4 = baseURL.format("VOID", "USDT", 1)
     response4 = requests.get(testURL4).json()
@@ -54,8 +60,45 @@ def get_fill_price_test():
     response6 = requests.get(testURL6).json()
     assert (response6['success'] == 0), "get-fill-price failed: success on negative quantity"
 
+    for maxStaleness in ("abc", "-1", "inf", "nan"):
+        response8 = requests.get(testURL0 + "&max-staleness=" + maxStaleness).json()
+        assert (response8['success'] == 0), "get-fill-price failed: success on invalid max-staleness"
+
     print ("get fill price passed all tests!\n")
 
+# Test get_fill_prices
+# The API call get_fill_prices should return a JSON object with the structure
+# {
+#   'success': BOOLEAN,
+#   'quotes': [{
+#       'success': BOOLEAN,
+#       'fill-price': FLOAT
+#   }]
+# }
+def get_fill_prices_test():
+    print ("Testing get fill prices...")
+
+    baseURL = apiURL + "get-fill-prices"
+
+    quotes = [{"base-currency": "ETH", "counter-currency": "USDT", "quantity": 1},
+              {"base-currency": "ETH", "counter-currency": "USDT", "quantity": 100},
+              {"base-currency": "BTC", "counter-currency": "USDT", "quantity": 1,
+               "side": "sell"},
+              {"base-currency": "VOID", "counter-currency": "USDT", "quantity": 1},
+              {"base-currency": "ETH", "counter-currency": "USDT", "quantity": -1}]
+    response = requests.post(baseURL, json=quotes).json()
+    assert (response['success'] == 1), "get-fill-prices failed: API call failed"
+    assert (len(response['quotes']) == 5), "get-fill-prices failed: wrong number of quotes"
+
+    # The first three quotes should be successful, the last two should not
+    for i in range(0, 3):
+        assert (response['quotes'][i]['success'] == 1), "get-fill-prices failed: valid quote failed"
+        print("Fill price for quote " + str(i) + ": " + str(response['quotes'][i]['fill-price']))
+    for i in range(3, 5):
+        assert (response['quotes'][i]['success'] == 0), "get-fill-prices failed: success on invalid quote"
+
+    print ("get fill prices passed all tests!\n")
+
 # Test get_currency_balance
 # The API call get_currency_balance should return a JSON object with the structure:
 # {
@@ -91,6 +134,72 @@ def get_currency_balance_test():
 
     print ("get currency balance passed all tests!\n")
 
+# Test get_slippage_curve
+# The API call get_slippage_curve should return a JSON object with the structure:
+# {
+#   'success': BOOLEAN,
+#   'curves': {EXCHANGE: {'quantity': [FLOAT], 'fill-price': [FLOAT],
+#                         'worst-price': [FLOAT], 'rate': [FLOAT],
+#                         'slippage-bps': [FLOAT]}},
+#   'missing': [EXCHANGE]
+# }
+def get_slippage_curve_test():
+    print ("Testing get slippage curve...")
+
+    # Define the baseURL for all the GET requests
+    baseURL = apiURL + "get-slippage-curve?base-currency={0}&counter-currency={1}&{2}"
+
+    # All these API calls should be successful
+    testURL0 = baseURL.format("ETH", "USDT", "quantities=1,2,5")
+    response0 = requests.get(testURL0).json()
+    assert (response0['success'] == 1), "get-slippage-curve failed: API call failed"
+    for curve in response0['curves'].values():
+        assert (len(curve['fill-price']) == 3), "get-slippage-curve failed: wrong number of points"
+
+    testURL1 = baseURL.format("BTC", "USDT", "max-quantity=10&points=100&side=sell")
+    response1 = requests.get(testURL1).json()
+    assert (response1['success'] == 1), "get-slippage-curve failed: API call failed"
+
+    # All these API calls should not be successful
+    testURL2 = baseURL.format("ETH", "USDT", "quantities=-1")
+    response2 = requests.get(testURL2).json()
+    assert (response2['success'] == 0), "get-slippage-curve failed: success on negative quantity"
+
+    testURL3 = baseURL.format("VOID", "USDT", "quantities=1")
+    response3 = requests.get(testURL3).json()
+    assert (response3['success'] == 0), "get-slippage-curve failed: success on fake market"
+
+    print ("get slippage curve passed all tests!\n")
+
+# Test tickers
+# The API call tickers should return a JSON object with the structure:
+# {
+#   'success': BOOLEAN,
+#   'tickers': {MARKET: {'bid': FLOAT, 'ask': FLOAT, 'last': FLOAT,
+#                        'volume': FLOAT, 'baseVolume': FLOAT}},
+#   'age': FLOAT
+# }
+def tickers_test():
+    print ("Testing tickers...")
+
+    # Define the baseURL for all the GET requests
+    baseURL = apiURL + "tickers"
+
+    # All these API calls should be successful
+    response0 = requests.get(baseURL).json()
+    assert (response0['success'] == 1), "tickers failed: API call failed"
+    assert ("USDT-ETH" in response0['tickers']), "tickers failed: USDT-ETH missing"
+
+    response1 = requests.get(baseURL + "?market=USDT-ETH").json()
+    assert (response1['success'] == 1), "tickers failed: API call failed"
+    print("Last price of USDT-ETH: " + str(response1['tickers']['USDT-ETH']['last']))
+
+    # All these API calls should not be successful
+    response2 = requests.get(baseURL + "?market=VOID").json()
+    assert (response2['success'] == 0), "tickers failed: success on fake market"
+
+    print ("tickers passed all tests!\n")
+
 # Test send_order
 # The API call send_order should return a JSON object with the structure:
 # {
@@ -127,7 +236,10 @@ def main():
 
     # Run all tests
     get_fill_price_test()
+    get_fill_prices_test()
+    get_slippage_curve_test()
     get_currency_balance_test()
+    tickers_test()
     send_order_test()
 
     print ("All api calls passed!\n")
@@ -0,0 +1,190 @@
+# This file contains an asyncio version of the Bittrex wrapper
+
+import asyncio
+
+import aiohttp
+
+import bittrexWrapper
+import compactBook
+import marketRegistry
+import requestSigner
+import serialization
+
+'''
+This class has the quoting, balance and order methods of bittrexWrapper.Wrapper
+with the same responses, but every call is a coroutine. Requests go through one pooled aiohttp session, so a
+single event loop can keep thousands of requests in flight without a thread
+each. Request signing and response parsing are shared with the blocking
+wrapper.
+
+The session is created on first use because aiohttp sessions must be created
+inside a running event loop. Call close() when done with the wrapper.
+'''
+class AsyncWrapper:
+    takerFee = bittrexWrapper.Wrapper.takerFee
+
+    def __init__(self, filename, poolSize=100, connectTimeout=3.05,
+                 readTimeout=10, registryTTL=3600,
+                 baseURL='https://bittrex.com/api/v1.1/'):
+        self.keysFile = filename
+        self.baseURL = baseURL
+        self.url = self.baseURL + '{requestType}/{command}?'
+        self.signer = None
+        self.poolSize = poolSize
+        self.timeout = aiohttp.ClientTimeout(sock_connect=connectTimeout,
+                                             sock_read=readTimeout)
+        self.session = None
+        self.registry = marketRegistry.MarketRegistry(self, registryTTL)
+        self.registryTask = None
+
+    # Return the shared session, creating it on first use
+    def get_session(self):
+        if self.session is None:
+            connector = aiohttp.TCPConnector(limit=self.poolSize,
+                                             keepalive_timeout=30)
+            self.session = aiohttp.ClientSession(connector=connector,
+                                                 timeout=self.timeout)
+        return self.session
+
+    # Return the request signer, reading the keys the first time
+    def get_signer(self):
+        if self.signer is None:
+            apiKey, apiSecret = bittrexWrapper.load_keys(self.keysFile)
+            self.signer = requestSigner.RequestSigner(self.baseURL, apiKey,
+                                                      apiSecret)
+        return self.signer
+
+    async def close(self):
+        if self.registryTask is not None:
+            self.registryTask.cancel()
+        if self.session is not None:
+            await self.session.close()
+
+    # Asyncio version of Wrapper.process_command
+    async def process_command(self, command, requestType, requestArgs={},
+                              objectHook=None):
+        requestURL, headers = self.get_signer().build(command, requestType,
+                                                      requestArgs)
+
+        # Send the request and return the JSON
+        async with self.get_session().get(requestURL, headers=headers) as response:
+            return serialization.loads(await response.read(), objectHook)
+
+    # Format market ticker
+    def format_ticker(self, baseCurrency, counterCurrency):
+        return str(counterCurrency) + "-" + str(baseCurrency)
+
+    # See Wrapper.get_ticker
+    async def get_ticker(self, market):
+        apiResponse = await self.process_command('getticker', 'public',
+                                                 {'market': str(market)})
+        return bittrexWrapper.parse_ticker(apiResponse)
+
+    # See Wrapper.get_orderbook
+    async def get_orderbook(self, market, booktype, compact=False):
+        objectHook = compactBook.object_hook if compact else None
+        apiResponse = await self.process_command('getorderbook', 'public',
+                                                 {'market': str(market),
+                                                  'type': str(booktype)},
+                                                 objectHook)
+        orderbookResponse = bittrexWrapper.parse_orderbook(apiResponse)
+        if compact and orderbookResponse['success'] == True and \
+           not isinstance(orderbookResponse['book'], compactBook.CompactBook):
+            orderbookResponse['book'] = compactBook.CompactBook.from_levels(
+                orderbookResponse['book'])
+        return orderbookResponse
+
+    # See Wrapper.get_balance
+    async def get_balance(self, currency):
+        apiResponse = await self.process_command('getbalance', 'account',
+                                                 {'currency': str(currency)})
+        return bittrexWrapper.parse_balance(apiResponse)
+
+    # See Wrapper.sell_limit
+    async def sell_limit(self, market, amount, price):
+        apiResponse = await self.process_command('selllimit', 'market',
+                                                 {'market': market,
+                                                  'quantity': amount,
+                                                  'rate': price})
+        return bittrexWrapper.parse_order_placed(apiResponse)
+
+    # See Wrapper.buy_limit
+    async def buy_limit(self, market, amount, price):
+        apiResponse = await self.process_command('buylimit', 'market',
+                                                 {'market': market,
+                                                  'quantity': amount,
+                                                  'rate': price})
+        return bittrexWrapper.parse_order_placed(apiResponse)
+
+    # See Wrapper.cancel_order
+    async def cancel_order(self, uuid):
+        apiResponse = await self.process_command('cancel', 'market',
+                                                 {'uuid': uuid})
+        return bittrexWrapper.parse_cancel(apiResponse)
+
+    # See Wrapper.get_order
+    async def get_order(self, uuid):
+        apiResponse = await self.process_command('getorder', 'account',
+                                                 {'uuid': uuid})
+        return bittrexWrapper.parse_order(apiResponse)
+
+    # Load the market registry and keep refreshing it every ttl seconds
+    async def refresh_registry(self):
+        currencyResponse, marketResponse = await asyncio.gather(
+            self.process_command('getcurrencies', 'public'),
+            self.process_command('getmarkets', 'public'))
+        return self.registry.load(currencyResponse, marketResponse)
+
+    async def registry_loop(self):
+        while True:
+            if self.registry.markets is None:
+                await asyncio.sleep(min(self.registry.ttl,
+                                        self.registry.retryInterval))
+            else:
+                await asyncio.sleep(self.registry.ttl)
+
+            try:
+                await self.refresh_registry()
+            except Exception:
+                # Keep serving the last good lists, try again next time
+                pass
+
+    async def start_registry(self):
+        if self.registryTask is not None:
+            return
+
+        self.registryTask = asyncio.ensure_future(self.registry_loop())
+        try:
+            await self.refresh_registry()
+        except Exception:
+            pass
+
+    # Return True/False based on the market registry, only ask the API if the
+    # registry could not be loaded
+    async def is_valid_currency(self, currency):
+        await self.start_registry()
+        isValid = self.registry.has_currency(currency)
+        if isValid is not None:
+            return isValid
+
+        response = await self.process_command('getcurrencies', 'public')
+        for i in response['result']:
+            if (i['Currency'] == currency):
+                return True
+        return False
+
+    # Return True/False based on the market registry, only ask the API if the
+    # registry could not be loaded
+    async def is_valid_market(self, currency0, currency1):
+        market = str(currency1 + '-' + currency0)
+        await self.start_registry()
+        isValid = self.registry.has_market(market)
+        if isValid is not None:
+            return isValid
+
+        response = await self.process_command('getmarketsummary', 'public',
+                                              {'market': market})
+        if response['success'] == 1:
+            return True
+        else:
+            return False
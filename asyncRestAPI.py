@@ -0,0 +1,285 @@
+# This file contains the asyncio version of the REST server
+
+import os
+import asyncio
+
+from aiohttp import web
+
+import asyncBittrexWrapper
+import fillJournal
+import orderSplitter
+import restAPIHelpers as helpers
+import serialization
+
+'''
+This server is a smaller asyncio version of restAPI.py. It runs on a single
+event loop using AsyncWrapper, so a quote waiting on the exchange costs a
+coroutine instead of a thread. It only trades on Bittrex and serves:
+
+    - get-fill-price and get-fill-prices, quoted from a fresh book on every
+      request. 'max-staleness' is accepted but ignored, and the replies have
+      no 'exchange' or 'stale' fields.
+    - get-currency-balance
+    - send-order, placed as one order at the rate of the Bittrex book with
+      the balance checked under a lock per spent currency. Filled orders are
+      polled in memory and written to orders.txt. Reservations, the order
+      store and get-order-status are not part of it, so open orders are
+      forgotten on a restart. A placement that goes unanswered ends the
+      request with an error and the order is not looked for afterwards.
+
+tickers, get-slippage-curve, get-order-status and /metrics are only served by
+restAPI.py, and there are no book replicas, circuit breakers or hedging here.
+
+Run with: python asyncRestAPI.py
+'''
+
+# Seconds between checks of the open orders
+ORDER_POLL_INTERVAL = 10
+
+# Order queue to continously check for filled orders
+orderQueue = asyncio.Queue()
+
+# Filled orders are written to orders.txt by a single background writer
+journal = fillJournal.FillJournal("orders.txt")
+
+# One lock per spent currency, so the balance check and the order placement
+# happen atomically with respect to other orders spending the same currency
+balanceLocks = {}
+
+# Declare an instance of the asyncio Bittrex wrapper
+# The API url can be pointed at a local mockExchange.py for testing
+wrapper = asyncBittrexWrapper.AsyncWrapper("keys.txt",
+    baseURL=os.environ.get('BITTREX_API_URL', 'https://bittrex.com/api/v1.1/'))
+
+# Replies are encoded with the same JSON backend as restAPI.py
+def json_response(data):
+    return web.json_response(data, dumps=serialization.dumps_text)
+
+# Continously checks for new orders
+async def check_orders(app):
+    while True:
+        # If queue is not empty get all orders and check on them at once
+        orderUUIDs = []
+        while not orderQueue.empty():
+            orderUUIDs.append(orderQueue.get_nowait())
+
+        orderResponses = await asyncio.gather(
+            *[wrapper.get_order(orderUUID) for orderUUID in orderUUIDs],
+            return_exceptions=True)
+
+        for orderUUID, orderResponse in zip(orderUUIDs, orderResponses):
+            # If order is filled, print it out to a file
+            if isinstance(orderResponse, dict) and \
+               orderResponse['success'] == True and \
+               orderResponse['isOpen'] == False:
+                fiatTransacted = float('%.2f'%(orderResponse['price'] + orderResponse['commissionPaid']))
+                journal.write(helpers.fill_record(orderResponse['type'],
+                                                  fiatTransacted,
+                                                  "Bittrex",
+                                                  orderResponse['timestamp']))
+            else:
+                # Put the order back on the queue
+                orderQueue.put_nowait(orderUUID)
+
+        await asyncio.sleep(ORDER_POLL_INTERVAL)
+
+async def on_startup(app):
+    await wrapper.start_registry()
+    app['orderTask'] = asyncio.ensure_future(check_orders(app))
+
+async def on_cleanup(app):
+    app['orderTask'].cancel()
+    await wrapper.close()
+    journal.close()
+
+# App route for the 'get-fill-price' api call
+async def get_fill_price(request):
+    arguments = ['base-currency', 'counter-currency', 'quantity']
+    # Accepted for compatibility, every book here is fetched fresh
+    optionalArguments = ['max-staleness']
+
+    # Check that the number of arguments are correct
+    if not all(args in arguments + optionalArguments for args in request.query) or \
+       not all(args in request.query for args in arguments):
+        return json_response({'success': False, 'message': 'invalid arguments'})
+
+    # Check for valid quantity
+    if float(request.query['quantity']) < 0:
+        return json_response({'success': False, 'message': 'invalid quantity'})
+
+    # Check the market and fetch the book at the same time
+    quantityToFill = float(request.query['quantity'])
+    formattedTicker = wrapper.format_ticker(request.query['base-currency'],
+                                            request.query['counter-currency'])
+    isValidMarket, orderbookResponse = await asyncio.gather(
+        wrapper.is_valid_market(request.query['base-currency'],
+                                request.query['counter-currency']),
+        wrapper.get_orderbook(formattedTicker, "buy"))
+
+    if not isValidMarket:
+        return json_response({'success': False, 'message': 'invalid market'})
+    if orderbookResponse['success'] == False:
+        return json_response({'success': False, 'message': 'failed to get orderbook'})
+
+    avgPrice = helpers.get_average_fill_price(orderbookResponse, quantityToFill)
+    return json_response({'success': True, 'fill-price': avgPrice})
+
+# App route for the 'get-fill-prices' api call, see restAPI.get_fill_prices
+async def get_fill_prices(request):
+    try:
+        quotes = await request.json(loads=serialization.loads)
+    except ValueError:
+        quotes = None
+    if not isinstance(quotes, list):
+        return json_response({'success': False, 'message': 'invalid arguments'})
+    if len(quotes) > helpers.MAX_BATCH_QUOTES:
+        return json_response({'success': False, 'message': 'too many quotes'})
+
+    # Validate every quote and collect the distinct books they need
+    results = [None] * len(quotes)
+    sides = [None] * len(quotes)
+    quantities = [None] * len(quotes)
+    books = {}
+    for i, quote in enumerate(quotes):
+        message, side, quantity = helpers.check_quote(quote)
+        if message is not None:
+            results[i] = {'success': False, 'message': message}
+            continue
+        sides[i] = side
+        quantities[i] = quantity
+
+        if not await wrapper.is_valid_market(quote['base-currency'],
+                                             quote['counter-currency']):
+            results[i] = {'success': False, 'message': 'invalid market'}
+            continue
+
+        formattedTicker = wrapper.format_ticker(quote['base-currency'],
+                                                quote['counter-currency'])
+        books[(formattedTicker, side)] = None
+
+    # Fetch each distinct book once, concurrently
+    keys = list(books)
+    responses = await asyncio.gather(
+        *[wrapper.get_orderbook(key[0], key[1]) for key in keys])
+    books = dict(zip(keys, responses))
+
+    # Evaluate every quote against the shared snapshots
+    for i, quote in enumerate(quotes):
+        if results[i] is not None:
+            continue
+
+        formattedTicker = wrapper.format_ticker(quote['base-currency'],
+                                                quote['counter-currency'])
+        orderbookResponse = books[(formattedTicker, sides[i])]
+        if orderbookResponse['success'] == False:
+            results[i] = {'success': False, 'message': 'failed to get orderbook'}
+            continue
+
+        avgPrice = helpers.get_average_fill_price(orderbookResponse,
+                                                  quantities[i])
+        results[i] = {'success': True, 'fill-price': avgPrice}
+
+    return json_response({'success': True, 'quotes': results})
+
+# App route for the 'get-currency-balance' api call
+async def get_currency_balance(request):
+    arguments = ['currency']
+
+    # Check that the argument currency is present, and that it is the only arg
+    if not all(args in arguments for args in request.query) or not len(request.query) == 1:
+        return json_response({'success': False, 'message': 'invalid arguments'})
+
+    # Check for valid currency before asking the exchange for a balance
+    if not await wrapper.is_valid_currency(request.query['currency']):
+        return json_response({'success': False, 'message': 'invalid currency'})
+
+    balanceResponse = await wrapper.get_balance(request.query['currency'])
+
+    return json_response({'success': True, 'balance': balanceResponse['balance']})
+
+# App route for the 'send-order' api call
+async def send_order(request):
+    arguments = ['base-currency', 'counter-currency', 'order-type', 'amount']
+    form = await request.post()
+
+    # Check that all four arguments are present, and only four are present
+    if not all(args in arguments for args in form) or not len(form) == 4:
+        return json_response({'success': False, 'message': 'invalid arguments'})
+
+    # Check for valid amount
+    if float(form['amount']) < 0:
+        return json_response({'success': False, 'message': 'invalid amount'})
+
+    # Check for valid order-type
+    if not (form['order-type'] == 'buy' or form['order-type'] == 'sell'):
+        return json_response({'success': False, 'message': 'invalid order-type'})
+
+    # The currency this order spends
+    if form['order-type'] == 'buy':
+        spentCurrency = form['counter-currency']
+    else:
+        spentCurrency = form['base-currency']
+
+    quantity = float(form['amount'])
+    formattedTicker = wrapper.format_ticker(form['base-currency'],
+                                            form['counter-currency'])
+
+    balanceLock = balanceLocks.setdefault(spentCurrency, asyncio.Lock())
+    async with balanceLock:
+        # The market check, book and balance do not depend on each other
+        isValidMarket, orderbookResponse, balanceResponse = await asyncio.gather(
+            wrapper.is_valid_market(form['base-currency'],
+                                    form['counter-currency']),
+            wrapper.get_orderbook(formattedTicker,
+                                  orderSplitter.book_side(form['order-type'])),
+            wrapper.get_balance(spentCurrency))
+
+        if not isValidMarket:
+            return json_response({'success': False, 'message': 'invalid market'})
+        if orderbookResponse['success'] == False:
+            return json_response({'success': False, 'message': 'failed to get orderbook'})
+
+        # Get rate to send order at
+        orderRate = helpers.get_rate(orderbookResponse, quantity, form['order-type'])
+        if orderRate is None:
+            # Not enough depth in the book to fill the order
+            return json_response({'success': False, 'message': 'failed to get orderbook'})
+
+        # Check that availble balance is high enough
+        balance = balanceResponse['balance']
+        if form['order-type'] == 'buy':
+            # A buy spends quantity * rate of the counter-currency, plus the
+            # exchange's commission on it
+            if balance < quantity * orderRate * (1 + wrapper.takerFee):
+                return json_response({'success': False, 'message': 'insufficient balance'})
+        else:
+            # Check that balance is greater than quantity to sell
+            if balance < quantity:
+                return json_response({'success': False, 'message': 'insufficient balance'})
+
+        # All checks passed, place order
+        if form['order-type'] == 'buy':
+            apiResponse = await wrapper.buy_limit(formattedTicker, quantity, orderRate)
+        else:
+            apiResponse = await wrapper.sell_limit(formattedTicker, quantity, orderRate)
+
+    # If order was successful add order uuid to the orderQueue and return
+    if apiResponse['success'] == True:
+        orderQueue.put_nowait(apiResponse['uuid'])
+        return json_response({'success': True, 'message': 'order placed'})
+    else:
+        # Order request failed
+        return json_response({'success': False, 'message': 'failed to place order'})
+
+def create_app():
+    app = web.Application()
+    app.router.add_get('/api/v1.0/get-fill-price', get_fill_price)
+    app.router.add_post('/api/v1.0/get-fill-prices', get_fill_prices)
+    app.router.add_get('/api/v1.0/get-currency-balance', get_currency_balance)
+    app.router.add_post('/api/v1.0/send-order', send_order)
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+if __name__ == '__main__':
+    web.run_app(create_app(), host='0.0.0.0', port=5000)
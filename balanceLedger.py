@@ -0,0 +1,262 @@
+# This file contains the local ledger of balances and reserved funds
+
+import threading
+import time
+import uuid
+
+import keyedLocks
+
+'''
+This class keeps the balance of every currency on one exchange in memory along
+with the funds reserved by orders that are placed but not yet closed, so the
+pre-trade balance check is a local operation instead of a round trip.
+
+Balances are loaded with one 'getbalances' call and reconciled with the
+exchange every 'reconcileInterval' seconds. A currency missing from the last
+load is fetched on its own the first time it is needed.
+
+An order reserves its funds with reserve() before it is placed, which only
+succeeds if the balance less everything already reserved covers it. The check
+and the reservation happen under the lock of that currency, so two orders can
+never both pass against the same funds while orders spending different
+currencies never wait for each other. Once placed, the reservation is assigned
+to the order uuid; when the order poller sees the order closed settle() takes
+the filled part out of the balance and releases the rest.
+
+A reconcile that was sent before an order on a currency settled is ignored
+for that currency, the balance it carries is already out of date. With a
+store, reservations of open orders are kept on disk and reserved again after a
+restart.
+'''
+class BalanceLedger:
+    def __init__(self, wrapper, store=None, reconcileInterval=30.0,
+                 retryInterval=5.0):
+        self.wrapper = wrapper
+        self.exchange = wrapper.name
+        self.store = store
+        self.reconcileInterval = reconcileInterval
+        self.retryInterval = retryInterval
+        self.locks = keyedLocks.KeyedLocks('ledger')
+
+        # Balance reported by the exchange, adjusted for settled orders
+        self.balances = {}
+        # Total reserved per currency, and (currency, amount) per reservation
+        self.reserved = {}
+        self.reservations = {}
+        # Number of settlements per currency, see reconcile()
+        self.settlements = {}
+
+        self.lastReconcile = 0
+        self.startLock = threading.Lock()
+        self.reconcileThread = None
+
+    # Load the balances once and start reconciling them in the background
+    def start(self):
+        # Cheap check first so reservations do not contend on the lock
+        if self.reconcileThread is not None:
+            return
+
+        with self.startLock:
+            if self.reconcileThread is not None:
+                return
+
+            if self.store is not None:
+                for orderUUID, currency, amount in \
+                        self.store.get_reservations(self.exchange):
+                    self.add_reservation(orderUUID, currency, amount)
+
+            try:
+                self.reconcile()
+            except Exception:
+                pass
+
+            self.reconcileThread = threading.Thread(target=self.reconcile_loop,
+                                                    daemon=True)
+            self.reconcileThread.start()
+
+    # Reconcile every interval, retry sooner while nothing has been loaded
+    def reconcile_loop(self):
+        while True:
+            if self.lastReconcile == 0:
+                time.sleep(min(self.reconcileInterval, self.retryInterval))
+            else:
+                time.sleep(self.reconcileInterval)
+
+            try:
+                self.reconcile()
+            except Exception:
+                # Keep the current balances, try again next time
+                pass
+
+    # Replace the balances with the exchange's, return True on success
+    def reconcile(self):
+        settlements = dict(self.settlements)
+        balanceResponse = self.wrapper.get_balances()
+        if balanceResponse['success'] == False:
+            return False
+
+        for currency, balance in balanceResponse['balances'].items():
+            with self.locks.hold(currency):
+                if self.settlements.get(currency, 0) == \
+                   settlements.get(currency, 0):
+                    self.balances[currency] = balance
+        self.lastReconcile = time.time()
+        return True
+
+    # Fetch one currency that the last load did not include, must hold the
+    # lock of the currency
+    def load_currency(self, currency):
+        balanceResponse = self.wrapper.get_balance(currency)
+        if balanceResponse['success'] == False:
+            return False
+        self.balances[currency] = balanceResponse['balance']
+        return True
+
+    # Balance less everything reserved, None if the balance is not known
+    def available(self, currency):
+        balance = self.balances.get(currency)
+        if balance is None:
+            return None
+        return balance - self.reserved.get(currency, 0.0)
+
+    # Reserve funds for an order, return the reservation id or None if the
+    # available balance does not cover them
+    def reserve(self, currency, amount):
+        self.start()
+        with self.locks.hold(currency):
+            if currency not in self.balances and \
+               not self.load_currency(currency):
+                return None
+            if self.available(currency) < amount:
+                return None
+            reservationId = str(uuid.uuid4())
+            self.reservations[reservationId] = (currency, amount)
+            self.reserved[currency] = self.reserved.get(currency, 0.0) + amount
+            return reservationId
+
+    # Track a reservation under an order uuid
+    def add_reservation(self, orderUUID, currency, amount):
+        with self.locks.hold(currency):
+            self.reservations[orderUUID] = (currency, amount)
+            self.reserved[currency] = self.reserved.get(currency, 0.0) + amount
+
+    # Move a reservation to the uuid of the order that was placed with it
+    def assign(self, reservationId, orderUUID):
+        reservation = self.reservations.pop(reservationId, None)
+        if reservation is None:
+            return
+        self.reservations[orderUUID] = reservation
+        if self.store is not None:
+            self.store.add_reservation(orderUUID, self.exchange,
+                                       reservation[0], reservation[1])
+            # Reservations of orders whose placement went unanswered are
+            # stored under their pending uuid until the order is found
+            self.store.remove_reservation(reservationId)
+
+    # Give back funds that were not spent, for example when placing failed
+    def release(self, reservationId):
+        self.settle_reservation(reservationId, 0.0)
+
+    # Settle the reservation of an order the poller found closed, using the
+    # get_order response to tell how much of it was filled
+    def settle(self, orderResponse):
+        filled = 1.0
+        if orderResponse.get('quantity'):
+            filled = 1.0 - (orderResponse['quantityRemaining'] /
+                            orderResponse['quantity'])
+        self.settle_reservation(orderResponse['uuid'], filled)
+
+    # Remove a reservation, taking 'filled' (0 to 1) of it out of the balance
+    def settle_reservation(self, reservationId, filled):
+        reservation = self.reservations.get(reservationId)
+        if reservation is None:
+            return
+        currency, amount = reservation
+        with self.locks.hold(currency):
+            if self.reservations.pop(reservationId, None) is None:
+                return
+            self.reserved[currency] = max(0.0, self.reserved[currency] - amount)
+            if filled > 0 and currency in self.balances:
+                self.balances[currency] -= amount * filled
+                self.settlements[currency] = \
+                    self.settlements.get(currency, 0) + 1
+        if self.store is not None:
+            self.store.remove_reservation(reservationId)
+
+'''
+This class is a BalanceLedger whose balances and reservations live in a
+shared OrderStore instead of in memory, for running several worker processes
+(see gunicorn.conf.py). Every reservation is checked and made in one store
+transaction, so no two processes can reserve the same funds.
+
+Any process can reserve, assign and release funds. Only the process polling
+orders should call start(), it is the one that settles orders and reconciles
+the balances for everyone. Each reconcile also expires reservations that were
+never assigned to an order within 'reservationTTL' seconds, which happens when
+a process stops between reserving funds and placing the order.
+'''
+class SharedBalanceLedger(BalanceLedger):
+    def __init__(self, wrapper, store, reconcileInterval=30.0,
+                 retryInterval=5.0, reservationTTL=300.0):
+        BalanceLedger.__init__(self, wrapper, store, reconcileInterval,
+                               retryInterval)
+        self.reservationTTL = reservationTTL
+
+    # Start reconciling the balances in the background
+    def start(self):
+        if self.reconcileThread is not None:
+            return
+
+        with self.startLock:
+            if self.reconcileThread is not None:
+                return
+
+            try:
+                self.reconcile()
+            except Exception:
+                pass
+
+            self.reconcileThread = threading.Thread(target=self.reconcile_loop,
+                                                    daemon=True)
+            self.reconcileThread.start()
+
+    def reconcile(self):
+        self.store.expire_reservations(self.exchange,
+                                       time.time() - self.reservationTTL)
+
+        settlements = self.store.get_settlements(self.exchange)
+        balanceResponse = self.wrapper.get_balances()
+        if balanceResponse['success'] == False:
+            return False
+
+        self.store.load_balances(self.exchange, balanceResponse['balances'],
+                                 settlements)
+        self.lastReconcile = time.time()
+        return True
+
+    def available(self, currency):
+        balance = self.store.get_balance(self.exchange, currency)
+        if balance is None:
+            return None
+        return balance[0] - balance[1]
+
+    def reserve(self, currency, amount):
+        reservationId = str(uuid.uuid4())
+        reserved = self.store.reserve(reservationId, self.exchange, currency,
+                                      amount)
+        if reserved is None:
+            # No process has loaded this currency yet
+            balanceResponse = self.wrapper.get_balance(currency)
+            if balanceResponse['success'] == False:
+                return None
+            self.store.add_balance(self.exchange, currency,
+                                   balanceResponse['balance'])
+            reserved = self.store.reserve(reservationId, self.exchange,
+                                          currency, amount)
+        return reservationId if reserved else None
+
+    def assign(self, reservationId, orderUUID):
+        self.store.rename_reservation(reservationId, orderUUID)
+
+    def settle_reservation(self, reservationId, filled):
+        self.store.settle_reservation(reservationId, filled)
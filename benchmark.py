@@ -0,0 +1,236 @@
+# This file contains the load test harness for the REST api
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+'''
+This script drives the router's endpoints at a fixed concurrency and reports
+throughput and p50/p99/p999 latency for each one. Results are saved as JSON
+under benchmarks/ named after the current git commit, and --compare prints the
+change against an earlier result file.
+
+By default it starts a local mockExchange.py and a restAPI.py pointed at it in
+a temporary directory, so no API keys or network access are needed:
+
+    python benchmark.py --concurrency 16 --requests 2000 --depth 1000
+    python benchmark.py --compare benchmarks/<earlier result>.json
+
+Use --url to benchmark a server that is already running instead.
+'''
+
+# Requests sent for each endpoint, keyed by the name used in the results
+ENDPOINTS = {
+    'get-fill-price': ('GET', 'get-fill-price',
+                       {'base-currency': 'ETH', 'counter-currency': 'USDT',
+                        'quantity': 25}),
+    'get-currency-balance': ('GET', 'get-currency-balance',
+                             {'currency': 'USDT'}),
+    'send-order': ('POST', 'send-order',
+                   {'base-currency': 'ETH', 'counter-currency': 'USDT',
+                    'order-type': 'sell', 'amount': 0.01}),
+}
+
+RESULTS_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 'benchmarks')
+
+# Return the value below which 'fraction' of the sorted samples fall
+def percentile(sortedSamples, fraction):
+    if not sortedSamples:
+        return 0.0
+    index = min(len(sortedSamples) - 1, int(fraction * len(sortedSamples)))
+    return sortedSamples[index]
+
+# Send 'count' requests to one endpoint from 'concurrency' threads
+def run_endpoint(apiURL, name, concurrency, count):
+    method, path, arguments = ENDPOINTS[name]
+    url = apiURL + path
+    latencies = []
+    errors = [0]
+    statsLock = threading.Lock()
+    local = threading.local()
+
+    def send_one(i):
+        # One keep-alive session per thread, like a real client pool
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        startTime = time.perf_counter()
+        try:
+            if method == 'GET':
+                response = local.session.get(url, params=arguments)
+            else:
+                response = local.session.post(url, data=arguments)
+            ok = response.status_code == 200 and response.json()['success']
+        except Exception:
+            ok = False
+        elapsed = time.perf_counter() - startTime
+        with statsLock:
+            latencies.append(elapsed)
+            if not ok:
+                errors[0] += 1
+
+    startTime = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(send_one, range(count)))
+    wallTime = time.perf_counter() - startTime
+
+    latencies.sort()
+    return {'requests': count,
+            'errors': errors[0],
+            'concurrency': concurrency,
+            'throughput': count / wallTime,
+            'p50Ms': percentile(latencies, 0.50) * 1000,
+            'p99Ms': percentile(latencies, 0.99) * 1000,
+            'p999Ms': percentile(latencies, 0.999) * 1000,
+            'maxMs': latencies[-1] * 1000 if latencies else 0.0}
+
+# Wait until a server answers on a url
+def wait_for(url, timeout=15):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            requests.get(url, timeout=1)
+            return True
+        except requests.exceptions.RequestException:
+            time.sleep(0.1)
+    return False
+
+# Start mockExchange.py and restAPI.py in a scratch directory
+def spawn_servers(args):
+    repository = os.path.dirname(os.path.abspath(__file__))
+    workDirectory = tempfile.mkdtemp(prefix='exchange_router_bench_')
+    keysFile = open(os.path.join(workDirectory, 'keys.txt'), 'w')
+    keysFile.write('benchmark-key\nbenchmark-secret\n')
+    keysFile.close()
+
+    exchange = subprocess.Popen(
+        [sys.executable, os.path.join(repository, 'mockExchange.py'),
+         '--port', str(args.exchange_port), '--depth', str(args.depth),
+         '--latency-ms', str(args.latency_ms),
+         '--error-rate', str(args.error_rate)],
+        cwd=workDirectory, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    wait_for('http://127.0.0.1:{0}/api/v1.1/public/getmarkets'.format(
+        args.exchange_port))
+
+    # Time from starting the router until it answers, and its first quote
+    environment = dict(os.environ)
+    environment['BITTREX_API_URL'] = \
+        'http://127.0.0.1:{0}/api/v1.1/'.format(args.exchange_port)
+    startTime = time.perf_counter()
+    router = subprocess.Popen(
+        [sys.executable, os.path.join(repository, 'restAPI.py')],
+        cwd=workDirectory, env=environment,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    wait_for('http://127.0.0.1:5000/')
+    coldStart = time.perf_counter() - startTime
+
+    method, path, arguments = ENDPOINTS['get-fill-price']
+    startTime = time.perf_counter()
+    requests.get('http://127.0.0.1:5000/api/v1.0/' + path, params=arguments)
+    firstRequest = time.perf_counter() - startTime
+
+    startup = {'coldStartSeconds': coldStart,
+               'firstRequestMs': firstRequest * 1000}
+    return [exchange, router], startup
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return 'unknown'
+
+def save_results(results):
+    if not os.path.isdir(RESULTS_DIRECTORY):
+        os.makedirs(RESULTS_DIRECTORY)
+    filename = os.path.join(RESULTS_DIRECTORY, '{0}-{1}.json'.format(
+        results['commit'], time.strftime('%Y%m%d-%H%M%S')))
+    resultsFile = open(filename, 'w')
+    json.dump(results, resultsFile, indent=2, sort_keys=True)
+    resultsFile.close()
+    return filename
+
+def print_results(results, baseline=None):
+    print('commit {0}, concurrency {1}'.format(results['commit'],
+                                               results['concurrency']))
+    if results.get('startup') is not None:
+        print('cold start {0:.2f}s, first request {1:.2f}ms'.format(
+            results['startup']['coldStartSeconds'],
+            results['startup']['firstRequestMs']))
+    for name, stats in sorted(results['endpoints'].items()):
+        line = '{0:<22} {1:>9.1f} req/s  p50 {2:>8.2f}ms  p99 {3:>8.2f}ms  ' \
+               'p999 {4:>8.2f}ms  errors {5}'.format(
+                   name, stats['throughput'], stats['p50Ms'], stats['p99Ms'],
+                   stats['p999Ms'], stats['errors'])
+        if baseline is not None and name in baseline['endpoints']:
+            before = baseline['endpoints'][name]
+            line += '  ({0:+.1f}% req/s, {1:+.1f}% p99 vs {2})'.format(
+                (stats['throughput'] / before['throughput'] - 1) * 100,
+                (stats['p99Ms'] / before['p99Ms'] - 1) * 100,
+                baseline['commit'])
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the REST api')
+    parser.add_argument('--url', default=None,
+                        help='api url of a running server, e.g. '
+                             'http://localhost:5000/api/v1.0/')
+    parser.add_argument('--endpoints', default=','.join(sorted(ENDPOINTS)))
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--depth', type=int, default=500)
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--exchange-port', type=int, default=5001)
+    parser.add_argument('--compare', default=None,
+                        help='earlier result file to compare against')
+    parser.add_argument('--no-save', action='store_true')
+    args = parser.parse_args()
+
+    servers = []
+    startup = None
+    apiURL = args.url
+    if apiURL is None:
+        servers, startup = spawn_servers(args)
+        apiURL = 'http://127.0.0.1:5000/api/v1.0/'
+
+    try:
+        results = {'commit': git_commit(),
+                   'timestamp': time.time(),
+                   'concurrency': args.concurrency,
+                   'depth': args.depth,
+                   'latencyMs': args.latency_ms,
+                   'errorRate': args.error_rate,
+                   'startup': startup,
+                   'endpoints': {}}
+        for name in args.endpoints.split(','):
+            results['endpoints'][name] = run_endpoint(apiURL, name,
+                                                      args.concurrency,
+                                                      args.requests)
+    finally:
+        for server in servers:
+            server.terminate()
+
+    baseline = None
+    if args.compare is not None:
+        baselineFile = open(args.compare, 'r')
+        baseline = json.load(baselineFile)
+        baselineFile.close()
+
+    print_results(results, baseline)
+    if not args.no_save:
+        print('saved ' + save_results(results))
+
+if __name__ == '__main__':
+    main()
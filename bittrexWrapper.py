@@ -3,17 +3,250 @@
 # For the Stably team
 
 import urllib.request
-from urllib.parse import urlencode
-import hmac
-import hashlib
+from array import array
 import json
+import math
 import requests
+import threading
 import time
+import urllib3
 from flask import jsonify
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import exchangeAdapter
+import compactBook
+import marketRegistry
+import metrics
+import requestSigner
+import resilience
+import serialization
+import singleFlight
+import tickerSnapshot
+
+metrics.registry.describe('exchange_request_seconds',
+                          'Time to send an exchange command and decode the reply')
+
+# Bytes read at a time by get_orderbook_depth
+STREAM_CHUNK_SIZE = 16384
+
+# Read timeouts (seconds) of commands that give up sooner than 'readTimeout',
+# a book or ticker is of little use once it is a few seconds late. Placing and
+# cancelling orders keep the full timeout, their outcome is unknown after one.
+COMMAND_READ_TIMEOUTS = {'getorderbook': 3, 'getticker': 2,
+                         'getmarketsummary': 3, 'getmarketsummaries': 5,
+                         'getbalance': 5, 'getbalances': 5, 'getorder': 5,
+                         'getopenorders': 5, 'getorderhistory': 5}
+
+# Commands whose last good reply is served, marked stale, while the exchange
+# is failing. 'getorderbook-depth' is the streamed fetch of
+# Wrapper.get_orderbook_depth.
+STALE_COMMANDS = ('getorderbook', 'getorderbook-depth', 'getticker',
+                  'getmarketsummary')
+
+'''
+This class is the HTTP transport used by the wrapper. It keeps one pooled,
+keep-alive requests session so repeated calls reuse open TCP/TLS connections
+instead of paying for a new handshake on every request. A single instance is
+shared by the Flask worker threads and the order polling thread.
+
+Public requests are idempotent so they are retried on connection errors and
+gateway errors, but not after a read timeout: the guard in front of the
+transport (see resilience.Guard) hedges slow reads and serves a stale reply
+once they fail, which it can only do if a timeout reaches it in time instead
+of being retried for several times the read timeout. Market and account
+requests (order placement, cancels) are only retried when the connection could
+not be established, since a retried read could place the same order twice.
+'''
+class Transport:
+    def __init__(self, baseURL, poolSize=10, connectTimeout=3.05,
+                 readTimeout=10, retries=3, backoff=0.3,
+                 commandTimeouts=COMMAND_READ_TIMEOUTS):
+        self.timeout = (connectTimeout, readTimeout)
+        self.commandTimeouts = dict((command, (connectTimeout, timeout))
+                                    for command, timeout in
+                                    commandTimeouts.items())
+        self.poolSize = poolSize
+        self.session = requests.Session()
+
+        # Adapter for requests that are safe to resend
+        publicRetry = Retry(total=retries, connect=retries, read=0,
+                            status=retries, backoff_factor=backoff,
+                            status_forcelist=(500, 502, 503, 504),
+                            allowed_methods=frozenset(['GET']))
+        publicAdapter = HTTPAdapter(pool_connections=1, pool_maxsize=poolSize,
+                                    max_retries=publicRetry)
+
+        # Adapter for requests that must never be sent twice
+        privateRetry = Retry(total=retries, connect=retries, read=0, status=0,
+                             backoff_factor=backoff)
+        privateAdapter = HTTPAdapter(pool_connections=1, pool_maxsize=poolSize,
+                                     max_retries=privateRetry)
+
+        # requests picks the adapter with the longest matching prefix
+        self.session.mount(baseURL, privateAdapter)
+        self.session.mount(baseURL + 'public/', publicAdapter)
+
+        # Per endpoint latency counters, guarded by a lock since the session
+        # is used by many threads at once
+        self.statsLock = threading.Lock()
+        self.latency = {}
+
+    # Send a GET request over the pooled session and record its latency. With
+    # stream=True only the headers have been read when it returns.
+    def get(self, command, url, headers, stream=False):
+        startTime = time.perf_counter()
+        try:
+            timeout = self.commandTimeouts.get(command, self.timeout)
+            return self.session.get(url, headers=headers, timeout=timeout,
+                                    stream=stream)
+        finally:
+            self.record_latency(command, time.perf_counter() - startTime)
+
+    # Add a single sample to the counters for a command
+    def record_latency(self, command, seconds):
+        with self.statsLock:
+            stats = self.latency.get(command)
+            if stats is None:
+                stats = {'count': 0, 'totalSeconds': 0.0, 'maxSeconds': 0.0}
+                self.latency[command] = stats
+            stats['count'] += 1
+            stats['totalSeconds'] += seconds
+            stats['maxSeconds'] = max(stats['maxSeconds'], seconds)
+
+    '''
+    Return a copy of the latency counters for every command seen so far
+    Response:
+    {
+        'COMMAND': {
+            'count': INT,
+            'totalSeconds': FLOAT,
+            'maxSeconds': FLOAT,
+            'avgSeconds': FLOAT
+        }
+    }
+    '''
+    def get_latency_stats(self):
+        with self.statsLock:
+            stats = {}
+            for command, counters in self.latency.items():
+                stats[command] = dict(counters)
+                stats[command]['avgSeconds'] = (counters['totalSeconds'] /
+                                                counters['count'])
+            return stats
+
+    def close(self):
+        self.session.close()
+
+# Read the API key and secret from the first two lines of a .txt file
+def load_keys(filename):
+    privateData = open(filename, "r")
+    apiKey = privateData.readline().rstrip('\n')
+    apiSecret = privateData.readline().rstrip('\n')
+    privateData.close()
+    return apiKey, apiSecret
+
+# The functions below turn raw API responses into the dictionaries returned by
+# the wrapper, see the matching Wrapper methods for the response formats
+
+# Mark a parsed response stale when the API response was a last good reply
+# served by the guard (see resilience.Guard)
+def copy_staleness(apiResponse, response):
+    if apiResponse.get('stale'):
+        response['stale'] = True
+        response['age'] = apiResponse['age']
+    return response
+
+def parse_ticker(apiResponse):
+    # If the API call was successful return the corresponding dictionary
+    if apiResponse['success'] == True:
+        return {'success': True,
+                'bid': float(apiResponse['result']['Bid']),
+                'ask': float(apiResponse['result']['Ask']),
+                'last': float(apiResponse['result']['Last'])}
+    else:
+        return {'success': False}
+
+def parse_orderbook(apiResponse):
+    # If the API call was successful return the corresponding dictionary
+    if apiResponse['success'] == True:
+        return {'success': True,
+                'book': apiResponse['result']}
+    else:
+        return {'success': False}
+
+def parse_balance(apiResponse):
+    # If the API call was successful return the corresponding dictionary
+    if apiResponse['success'] == True:
+        return {'success': True,
+                'balance': float(apiResponse['result']['Balance'])}
+    else:
+        return {'success': False}
+
+def parse_balances(apiResponse):
+    # If the API call was successful return the corresponding dictionary
+    if apiResponse['success'] == True:
+        return {'success': True,
+                'balances': dict((balance['Currency'], float(balance['Balance']))
+                                 for balance in apiResponse['result'])}
+    else:
+        return {'success': False}
+
+def parse_order_placed(apiResponse):
+    # If the API call was successful return the corresponding dictionary
+    if apiResponse['success'] == True:
+        return {'success': True,
+                'uuid': apiResponse['result']['uuid']}
+    else:
+        return {'success': False}
+
+def parse_cancel(apiResponse):
+    # If the API call was successful return the corresponding dictionary
+    if apiResponse['success'] == True:
+        return {'success': True}
+    else:
+        return {'success': False}
+
+def parse_order(apiResponse):
+    # If the API call was successful return the corresponding dictionary
+    if apiResponse['success'] == True:
+        # Set the type to a uniform type
+        type = ''
+        if apiResponse['result']['Type'] == 'LIMIT_BUY':
+            type = "Repurchase"
+        else:
+            type = "Issue"
+
+        return {'success': True,
+                'uuid': apiResponse['result']['OrderUuid'],
+                'market': apiResponse['result']['Exchange'],
+                'type': type,
+                'price': float(apiResponse['result']['Price']),
+                'commissionPaid': float(apiResponse['result']['CommissionPaid']),
+                'timestamp': apiResponse['result']['Opened'],
+                'isOpen': apiResponse['result']['IsOpen'],
+                'quantity': float(apiResponse['result'].get('Quantity') or 0),
+                'quantityRemaining': float(apiResponse['result'].get('QuantityRemaining') or 0)}
+    else:
+        return {'success': False}
+
+# Return True if two amounts are equal to the 8 decimals Bittrex keeps
+def same_amount(amount0, amount1):
+    return math.isclose(float(amount0), float(amount1), rel_tol=1e-9,
+                        abs_tol=1e-8)
+
+def parse_open_orders(apiResponse):
+    # If the API call was successful return the corresponding dictionary
+    if apiResponse['success'] == True:
+        return {'success': True,
+                'uuids': [order['OrderUuid'] for order in apiResponse['result']]}
+    else:
+        return {'success': False}
 
 '''
 This class is used to make requests to the Bittrex API. It abstracts away the
-url request formatting from the user.
+url request formatting from the user, and is the Bittrex implementation of
+exchangeAdapter.ExchangeAdapter.
 
 Function calls to this wrapper will come in the following form as a dictionary
 {
@@ -22,42 +255,136 @@ Function calls to this wrapper will come in the following form as a dictionary
     'field2': TYPE
 }
 '''
-class Wrapper:
+class Wrapper(exchangeAdapter.ExchangeAdapter):
+    name = 'Bittrex'
+    takerFee = 0.0025
+
     '''
     Requires a filename which must be the name of a .txt file the first line
-    must be the API 'key', and the second line the API 'secret'.
+    must be the API 'key', and the second line the API 'secret'. The remaining
+    arguments configure the pooled HTTP transport, timeouts are in seconds, how
+    often the market/currency registry and the ticker snapshot are refreshed,
+    and the API url (for example a local mockExchange.py).
+
+    Identical public requests made at the same time are sent once and the
+    response is shared by every caller. 'coalesceTTL' (milliseconds) also
+    reuses a public response for that long after it arrives, 0 turns reuse off.
+
+    Requests go through a resilience.Guard: every command has a circuit
+    breaker that fails fast while the exchange keeps failing, books and
+    tickers fall back to their last good reply marked 'stale', and public
+    requests slower than usual are hedged with a second one.
+
+    Creating a wrapper does no I/O. The keys are read on the first request and
+    connections are opened as they are needed, call warm_up() to do both
+    before the wrapper is used.
+
+    'nonces' is the requestSigner.NonceGenerator of signed requests. Wrappers
+    in several processes that share the keys must share one backed by an
+    OrderStore, by default each wrapper counts its own.
     '''
-    def __init__(self, filename):
-        privateData = open(filename, "r")
-        self.apiKey = privateData.readline().rstrip('\n')
-        self.apiSecret = privateData.readline().rstrip('\n')
-        self.url = 'https://bittrex.com/api/v1.1/{requestType}/{command}?'
+    def __init__(self, filename, poolSize=10, connectTimeout=3.05,
+                 readTimeout=10, retries=3, backoff=0.3, registryTTL=3600,
+                 baseURL='https://bittrex.com/api/v1.1/', coalesceTTL=0,
+                 tickerInterval=5.0, nonces=None):
+        self.keysFile = filename
+        self.nonces = nonces
+        self.baseURL = baseURL
+        self.url = self.baseURL + '{requestType}/{command}?'
+        self.signer = None
+        self.signerLock = threading.Lock()
+        self.transport = Transport(self.baseURL, poolSize, connectTimeout,
+                                   readTimeout, retries, backoff)
+        self.registry = marketRegistry.MarketRegistry(self, registryTTL)
+        self.publicFlight = singleFlight.SingleFlight(coalesceTTL)
+        self.tickers = tickerSnapshot.TickerSnapshot(self, tickerInterval)
+        # Identical public requests are merged before they reach the guard,
+        # so a failing command records far fewer failures than it has callers
+        self.guard = resilience.Guard(STALE_COMMANDS, minRequests=5)
+
+    # Return the request signer, reading the keys the first time
+    def get_signer(self):
+        # Cheap check first so requests do not contend on the lock
+        if self.signer is not None:
+            return self.signer
+
+        with self.signerLock:
+            if self.signer is None:
+                apiKey, apiSecret = load_keys(self.keysFile)
+                self.signer = requestSigner.RequestSigner(self.baseURL, apiKey,
+                                                          apiSecret,
+                                                          self.nonces)
+            return self.signer
+
+    # Read the keys, load the market registry and the ticker snapshot, and
+    # open 'connections' pooled connections at once so the first requests
+    # served do not pay for any of it. Errors other than unreadable keys are
+    # left for the background refreshes to retry.
+    def warm_up(self, connections=4):
+        self.get_signer()
+
+        warmers = [self.registry.start, self.tickers.start]
+        while len(warmers) < min(connections, self.transport.poolSize):
+            warmers.append(self.open_connection)
+        threads = [threading.Thread(target=warmer) for warmer in warmers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    # Send one public request outside the coalescing so it opens a connection
+    # of its own, which then stays in the pool
+    def open_connection(self):
+        try:
+            self.send_command('getmarkets', 'public')
+        except Exception:
+            pass
 
     '''
     This function acts as an abstraction for the api functions, it will take
     in the arguments for the command and created the API request.
     It will handle HMAC signatures, urlencoding, and request headers.
     '''
-    def process_command(self, command, requestType, requestArgs={}):
-        # Create a nonce by using the current time
-        nonce = str(int(time.time() * 10))
-        requestURL = self.url.format(requestType=requestType, command=command)
+    def process_command(self, command, requestType, requestArgs={},
+                        objectHook=None):
+        # Public requests do not depend on the nonce, identical ones in flight
+        # at the same time are merged into one. They are safe to send twice so
+        # they are hedged.
+        if requestType == 'public':
+            key = (command, tuple(sorted(requestArgs.items())), objectHook)
+            return self.publicFlight.do(key, self.guard.call, command, key,
+                                        True, self.send_command, command,
+                                        requestType, requestArgs, objectHook)
+        return self.guard.call(command, None, False, self.send_command,
+                               command, requestType, requestArgs, objectHook)
 
-        # Public requests do not require api keys to be encoded in the url
-        if requestType != 'public':
-            requestURL = "{0}apikey={1}&nonce={2}&".format(
-                requestURL, self.apiKey, nonce)
+    # Sign and send a single request, 'objectHook' is passed to the JSON decoder
+    def send_command(self, command, requestType, requestArgs={},
+                     objectHook=None):
+        startTime = time.perf_counter()
+        requestURL, headers = self.get_signer().build(command, requestType,
+                                                      requestArgs)
 
-        # Encode the arguments into the url
-        requestURL += urlencode(requestArgs)
+        # Send the request and return the JSON
+        try:
+            response = self.transport.get(command, requestURL, headers)
+            return serialization.loads(response.content, objectHook)
+        finally:
+            metrics.registry.observe('exchange_request_seconds',
+                                     time.perf_counter() - startTime,
+                                     command=command)
 
-        # Sign the API request with secret key using HMAC
-        apiSignature = hmac.new(self.apiSecret.encode(),
-                           requestURL.encode(),
-                           hashlib.sha512).hexdigest()
+    # Return the per endpoint latency counters of the transport
+    def get_latency_stats(self):
+        return self.transport.get_latency_stats()
 
-        # Send the request and return the JSON
-        return requests.get(requestURL, headers={"apisign": apiSignature}).json()
+    # Return how many public requests were sent, merged or reused
+    def get_coalesce_stats(self):
+        return self.publicFlight.get_stats()
+
+    # Return the circuit states and the fallback and hedging counters
+    def get_resilience_stats(self):
+        return self.guard.get_stats()
 
     # Format market ticker
     def format_ticker(self, baseCurrency, counterCurrency):
@@ -72,19 +399,53 @@ class Wrapper:
         'ask': FLOAT,
         'last': FLOAT
     }
+    Prices come from the ticker snapshot while it is no more than two refresh
+    intervals old, and from a 'getticker' call otherwise. While 'getticker'
+    is failing the last good prices are returned with 'stale': True and their
+    'age' in seconds.
     '''
     def get_ticker(self, market):
+        self.tickers.start()
+        ticker = self.tickers.get(market)
+        if ticker is not None and ticker['bid'] is not None and \
+           ticker['ask'] is not None and ticker['last'] is not None and \
+           self.tickers.age() <= 2 * self.tickers.interval:
+            return {'success': True,
+                    'bid': ticker['bid'],
+                    'ask': ticker['ask'],
+                    'last': ticker['last']}
+
         apiResponse = self.process_command('getticker', 'public',
                                            {'market': str(market)})
+        return copy_staleness(apiResponse, parse_ticker(apiResponse))
 
-        # If the API call was successful return the corresponding dictionary
-        if apiResponse['success'] == True:
-            return {'success': True,
-                    'bid': float(apiResponse['result']['Bid']),
-                    'ask': float(apiResponse['result']['Ask']),
-                    'last': float(apiResponse['result']['Last'])}
-        else:
+    '''
+    Return the ticker of every market from the snapshot
+    Response:
+    {
+        'success': BOOLEAN,
+        'tickers': {
+            MARKET: {
+                'bid': FLOAT,
+                'ask': FLOAT,
+                'last': FLOAT,
+                'volume': FLOAT,
+                'baseVolume': FLOAT
+            }
+        },
+        'age': FLOAT
+    }
+    'tickers' is a read-only view shared by every caller. Prices of inactive
+    markets can be None.
+    '''
+    def get_tickers(self):
+        self.tickers.start()
+        table = self.tickers.get_all()
+        if table is None:
             return {'success': False}
+        return {'success': True,
+                'tickers': table,
+                'age': self.tickers.age()}
 
     '''
     Return the list of open orders for a given market
@@ -99,18 +460,102 @@ class Wrapper:
                     'Rate': FLOAT
                  }]
     }
+    With compact=True 'book' is a compactBook.CompactBook built while the
+    response is decoded, with no dictionary per level. While the exchange is
+    failing the last good book is returned with 'stale': True and its 'age'
+    in seconds. See also get_orderbook_depth.
     '''
-    def get_orderbook(self, market, booktype):
+    def get_orderbook(self, market, booktype, compact=False):
+        objectHook = compactBook.object_hook if compact else None
         apiResponse = self.process_command('getorderbook', 'public',
                                            {'market': str(market),
-                                            'type': str(booktype)})
+                                            'type': str(booktype)},
+                                           objectHook)
+        orderbookResponse = copy_staleness(apiResponse,
+                                           parse_orderbook(apiResponse))
+        if compact and orderbookResponse['success'] == True and \
+           not isinstance(orderbookResponse['book'], compactBook.CompactBook):
+            # An empty book decodes as an empty list
+            orderbookResponse['book'] = compactBook.CompactBook.from_levels(
+                orderbookResponse['book'])
+        return orderbookResponse
+
+    '''
+    Return the best levels of one side of a market's book, reading only as
+    much of the response as is needed to cover 'quantity' * 'margin'.
+    Response:
+    {
+        'success': BOOLEAN,
+        'book': CompactBook,
+        'partial': BOOLEAN
+    }
+    The response is streamed and its levels decoded as they arrive. Once the
+    levels read hold enough quantity the rest of the response is not read and
+    'partial' is True; the connection is then closed instead of going back to
+    the pool, so this is worth it on deep books only. If the response ends
+    before the book does, the whole book is fetched instead.
+
+    The fetch goes through the guard like every other request: while it
+    fails, the last good reply for the same quantity is returned marked
+    'stale' with its 'age', and CIRCUIT_OPEN while its circuit is open and
+    there is none.
+    '''
+    def get_orderbook_depth(self, market, booktype, quantity, margin=1.5):
+        key = ('getorderbook-depth', str(market), str(booktype), quantity,
+               margin)
+        return self.publicFlight.do(key, self.guard.call, 'getorderbook-depth',
+                                    key, False, self.stream_orderbook, market,
+                                    booktype, quantity * margin)
 
-        # If the API call was successful return the corresponding dictionary
-        if apiResponse['success'] == True:
+    # Stream a book until it holds 'targetQuantity', raises if the request
+    # fails so the guard can count it
+    def stream_orderbook(self, market, booktype, targetQuantity):
+        startTime = time.perf_counter()
+        decoder = serialization.ArrayDecoder('result')
+        rates = array('d')
+        quantities = array('d')
+        totalQuantity = 0.0
+        try:
+            requestURL, headers = self.get_signer().build(
+                'getorderbook', 'public',
+                {'market': str(market), 'type': str(booktype)})
+            response = self.transport.get('getorderbook', requestURL, headers,
+                                          stream=True)
+            try:
+                for chunk in response.iter_content(STREAM_CHUNK_SIZE):
+                    for order in decoder.feed(chunk):
+                        rates.append(float(order['Rate']))
+                        quantities.append(float(order['Quantity']))
+                        totalQuantity += quantities[-1]
+                    if decoder.done or totalQuantity >= targetQuantity:
+                        break
+            finally:
+                response.close()
+        finally:
+            metrics.registry.observe('exchange_request_seconds',
+                                     time.perf_counter() - startTime,
+                                     command='getorderbook-depth')
+
+        if decoder.done or totalQuantity >= targetQuantity:
             return {'success': True,
-                    'book': apiResponse['result']}
-        else:
-            return {'success': False}
+                    'book': compactBook.CompactBook(rates, quantities),
+                    'partial': not decoder.done}
+
+        # No book in the response, an error reply is read in full
+        if not decoder.inArray:
+            try:
+                return parse_orderbook(serialization.loads(decoder.text()))
+            except ValueError:
+                pass
+
+        # The response ended before the book did
+        return self.get_full_orderbook(market, booktype)
+
+    # Fetch the whole book in the format of get_orderbook_depth
+    def get_full_orderbook(self, market, booktype):
+        orderbookResponse = self.get_orderbook(market, booktype, compact=True)
+        orderbookResponse['partial'] = False
+        return orderbookResponse
 
     '''
     Return the availble balance for a given currency
@@ -123,55 +568,67 @@ class Wrapper:
     def get_balance(self, currency):
         apiResponse = self.process_command('getbalance', 'account',
                                            {'currency': str(currency)})
+        return parse_balance(apiResponse)
 
-        # If the API call was successful return the corresponding dictionary
-        if apiResponse['success'] == True:
-            return {'success': True,
-                    'balance': float(apiResponse['result']['Balance'])}
-        else:
-            return {'success': False}
+    '''
+    Return the balance of every currency in the account
+    Response:
+    {
+        'success': BOOLEAN,
+        'balances': {CURRENCY: FLOAT}
+    }
+    '''
+    def get_balances(self):
+        apiResponse = self.process_command('getbalances', 'account')
+        return parse_balances(apiResponse)
 
     '''
     Place a sell order for a given market with a set price and amount
     Response:
     {
         'success': BOOLEAN,
-        'uuid': STRING
+        'uuid': STRING,
+        'unknown': BOOLEAN
     }
+    'unknown' is True when the request was sent but not answered, the order
+    may have been placed (see find_orders).
     '''
     def sell_limit(self, market, amount, price):
-        apiResponse = self.process_command('selllimit', 'market',
-                                           {'market': market,
-                                            'quantity': amount,
-                                            'rate': price})
-
-        # If the API call was successful return the corresponding dictionary
-        if apiResponse['success'] == True:
-            return {'success': True,
-                    'uuid': apiResponse['result']['uuid']}
-        else:
-            return {'success': False}
+        return self.place_order('selllimit', market, amount, price)
 
     '''
     Place a buy order for a given market with a set price and amount
     Response:
     {
         'success': BOOLEAN,
-        'uuid': STRING
+        'uuid': STRING,
+        'unknown': BOOLEAN
     }
     '''
     def buy_limit(self, market, amount, price):
-        apiResponse = self.process_command('buylimit', 'market',
-                                            {'market': market,
-                                             'quantity': amount,
-                                             'rate': price})
+        return self.place_order('buylimit', market, amount, price)
 
-        # If the API call was successful return the corresponding dictionary
-        if apiResponse['success'] == True:
-            return {'success': True,
-                    'uuid': apiResponse['result']['uuid']}
-        else:
-            return {'success': False}
+    # Send a buylimit or selllimit request. Orders are never resent, so after
+    # a read timeout or a dropped connection the outcome is unknown rather
+    # than failed. Only a connection that could not be opened is a failure,
+    # and so is a request the circuit breaker did not send.
+    def place_order(self, command, market, amount, price):
+        try:
+            apiResponse = self.process_command(command, 'market',
+                                               {'market': market,
+                                                'quantity': amount,
+                                                'rate': price})
+        except requests.exceptions.ConnectionError as error:
+            reason = getattr(error.args[0] if error.args else None, 'reason',
+                             None)
+            neverSent = isinstance(error, requests.exceptions.ConnectTimeout) or \
+                isinstance(reason, urllib3.exceptions.ConnectTimeoutError)
+            return {'success': False, 'unknown': not neverSent}
+        except Exception:
+            return {'success': False, 'unknown': True}
+        orderResponse = parse_order_placed(apiResponse)
+        orderResponse['unknown'] = False
+        return orderResponse
 
     '''
     Cancel an order with the specific uuid
@@ -182,12 +639,7 @@ class Wrapper:
     def cancel_order(self, uuid):
         apiResponse = self.process_command('cancel', 'market',
                                            {'uuid': uuid})
-
-        # If the API call was successful return the corresponding dictionary
-        if apiResponse['success'] == True:
-            return {'success': True}
-        else:
-            return {'success': False}
+        return parse_cancel(apiResponse)
 
     '''
     Return the details of a specfic order
@@ -199,44 +651,85 @@ class Wrapper:
         'price': FLOAT,
         'commissionPaid': FLOAT,
         'timestamp': FLOAT,
-        'isOpen': BOOLEAN
+        'isOpen': BOOLEAN,
+        'quantity': FLOAT,
+        'quantityRemaining': FLOAT
     }
     '''
     def get_order(self, uuid):
         apiResponse = self.process_command('getorder', 'account',
                                            {'uuid': uuid})
+        return parse_order(apiResponse)
 
-        # If the API call was successful return the corresponding dictionary
-        if apiResponse['success'] == True:
-            # Set the type to a uniform type
-            type = ''
-            if apiResponse['result']['Type'] == 'LIMIT_BUY':
-                type = "Repurchase"
-            else:
-                type = "Issue"
+    '''
+    Return the uuids of every open order, optionally only for one market
+    Response:
+    {
+        'success': BOOLEAN,
+        'uuids': [STRING]
+    }
+    '''
+    def get_open_orders(self, market=None):
+        requestArgs = {}
+        if market is not None:
+            requestArgs['market'] = str(market)
+        apiResponse = self.process_command('getopenorders', 'market',
+                                           requestArgs)
+        return parse_open_orders(apiResponse)
 
-            return {'success': True,
-                    'uuid': apiResponse['result']['OrderUuid'],
-                    'market': apiResponse['result']['Exchange'],
-                    'type': type,
-                    'price': float(apiResponse['result']['Price']),
-                    'commissionPaid': float(apiResponse['result']['CommissionPaid']),
-                    'timestamp': apiResponse['result']['Opened'],
-                    'isOpen': apiResponse['result']['IsOpen']}
+    '''
+    Return the uuids of the open and recently closed orders on a market that
+    match a 'buy' or 'sell' of 'amount' at 'price', open orders first
+    Response:
+    {
+        'success': BOOLEAN,
+        'uuids': [STRING]
+    }
+    '''
+    def find_orders(self, market, orderType, amount, price):
+        if orderType == 'buy':
+            bittrexType = 'LIMIT_BUY'
         else:
-            return {'success': False}
+            bittrexType = 'LIMIT_SELL'
 
-    # Return True/False based on API response
+        uuids = []
+        for command, requestType in (('getopenorders', 'market'),
+                                     ('getorderhistory', 'account')):
+            apiResponse = self.process_command(command, requestType,
+                                               {'market': str(market)})
+            if apiResponse['success'] != True:
+                return {'success': False}
+            uuids.extend(order['OrderUuid'] for order in apiResponse['result']
+                         if order['OrderType'] == bittrexType and
+                         same_amount(order['Quantity'], amount) and
+                         same_amount(order['Limit'], price))
+        return {'success': True, 'uuids': uuids}
+
+    # Return True/False based on the market registry, only ask the API if the
+    # registry could not be loaded
     def is_valid_currency(self, currency):
+        self.registry.start()
+        isValid = self.registry.has_currency(currency)
+        if isValid is not None:
+            return isValid
+
         response = self.process_command('getcurrencies', 'public')
         for i in response['result']:
             if (i['Currency'] == currency):
                 return True
         return False
 
-    # Return True/False based on API response
+    # Return True/False based on the market registry, only ask the API if the
+    # registry could not be loaded
     def is_valid_market(self, currency0, currency1):
         market = str(currency1 + '-' + currency0)
+        self.registry.start()
+        isValid = self.registry.has_market(market)
+        if isValid is None:
+            isValid = self.tickers.has_market(market)
+        if isValid is not None:
+            return isValid
+
         response = self.process_command('getmarketsummary', 'public',
                                         {'market': market})
         if response['success'] == 1:
@@ -1,6 +1,11 @@
 # This file will be used to test the Bittrex API wrapper.
 # Created by Izak Fritz 04-07-18
 # For the Stably team
+#
+# The tests place and cancel orders, point them at a local mockExchange.py with
+# "BITTREX_API_URL=http://127.0.0.1:5001/api/v1.1/ python bittrexWrapperTests.py"
+
+import os
 
 import bittrexWrapper
 
@@ -38,6 +43,11 @@ def test_get_orderbook(wrapperInstance):
     output4 = wrapperInstance.get_orderbook("VOID", "both")
     assert (output4['success'] == 0), "get_orderbook failed: Success on fake market"
 
+    output5 = wrapperInstance.get_orderbook("USDT-ETH", "sell", compact=True)
+    assert (output5['success'] == 1), "get_orderbook compact failed: valid API call failed"
+    assert (len(output5['book']) == 0 or isinstance(output5['book'][0]['Rate'], float)), \
+        "get_orderbook compact failed: levels are not floats"
+
     print ("'get_orderbook' passed all tests\n")
 
 # Test get_balance by checking that success is true
@@ -91,15 +101,30 @@ def test_orders(wrapperInstance):
 
     print ("'buy_limit', 'sell_limit', 'cancel_order', and 'get_order' passed all tests\n")
 
+# Test get_open_orders by checking that success is true and a list is returned
+def test_get_open_orders(wrapperInstance):
+    print ("Testing 'get_open_orders'...")
+
+    output0 = wrapperInstance.get_open_orders()
+    assert (output0['success'] == 1), "get_open_orders failed: API call failed"
+    assert (isinstance(output0['uuids'], list)), "get_open_orders failed: uuids is not a list"
+
+    output1 = wrapperInstance.get_open_orders("USDT-ETH")
+    assert (output1['success'] == 1), "get_open_orders failed: API call failed on valid market"
+
+    print ("'get_open_orders' passed all tests\n")
+
 # Main function will call all of the tests
 def main():
     print ("Running Bittrex wrapper tests...\n")
-    wrapperInstance = bittrexWrapper.Wrapper("keys.txt")
+    wrapperInstance = bittrexWrapper.Wrapper("keys.txt",
+        baseURL=os.environ.get('BITTREX_API_URL', 'https://bittrex.com/api/v1.1/'))
 
     test_get_ticker(wrapperInstance)
     test_get_orderbook(wrapperInstance)
     test_get_balance(wrapperInstance)
     test_orders(wrapperInstance)
+    test_get_open_orders(wrapperInstance)
 
     print ("All tests passed successfully!")
 
@@ -0,0 +1,95 @@
+# This file contains the compact order book returned by get_orderbook
+
+from array import array
+
+import depthIndex
+
+# NumPy is optional, without it the columns stay as arrays of doubles
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+'''
+This class holds one side of an order book (best level first) as two parallel
+columns of doubles instead of a list of {'Quantity': ..., 'Rate': ...}
+dictionaries. A level costs 16 bytes instead of a dictionary and two floats,
+and every rate and quantity is converted to a float exactly once, while the
+JSON is decoded.
+
+'rates' and 'quantities' are NumPy arrays when NumPy is installed (sharing the
+memory of the arrays they were decoded into) and array('d') otherwise. The
+book can still be indexed and iterated like the list format, each level is
+then built as a dictionary on demand.
+
+get_index() returns a DepthIndex over the columns, built on first use and
+kept for the life of the book.
+'''
+class CompactBook:
+    __slots__ = ('rates', 'quantities', 'size', 'index')
+
+    def __init__(self, rates, quantities):
+        if numpy is not None:
+            self.rates = numpy.frombuffer(rates, dtype=float)
+            self.quantities = numpy.frombuffer(quantities, dtype=float)
+        else:
+            self.rates = rates
+            self.quantities = quantities
+        self.size = len(rates)
+        self.index = None
+
+    # Build a book from levels in the list format
+    @classmethod
+    def from_levels(cls, levels):
+        rates = array('d')
+        quantities = array('d')
+        for order in levels:
+            rates.append(float(order['Rate']))
+            quantities.append(float(order['Quantity']))
+        return cls(rates, quantities)
+
+    # Build a book from the (rate, quantity) pairs made by object_hook
+    @classmethod
+    def from_pairs(cls, pairs):
+        rates = array('d', [pair[0] for pair in pairs])
+        quantities = array('d', [pair[1] for pair in pairs])
+        return cls(rates, quantities)
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, level):
+        return {'Quantity': float(self.quantities[level]),
+                'Rate': float(self.rates[level])}
+
+    def __iter__(self):
+        for level in range(self.size):
+            yield self[level]
+
+    def get_index(self):
+        if self.index is None:
+            self.index = depthIndex.DepthIndex.from_columns(self.rates,
+                                                            self.quantities)
+        return self.index
+
+# A decoded level, plain tuples never come out of JSON on their own
+class Level(tuple):
+    __slots__ = ()
+
+'''
+object_hook for json.loads that builds compact books while the response is
+decoded. Each {'Quantity': ..., 'Rate': ...} level is turned into a
+(rate, quantity) pair as soon as it is parsed and the enclosing object turns a
+list of pairs into a CompactBook, so no level dictionary outlives the decode.
+
+Usage:
+    json.loads(text, object_hook=compactBook.object_hook)
+'''
+def object_hook(obj):
+    if len(obj) == 2 and 'Rate' in obj and 'Quantity' in obj:
+        return Level((float(obj['Rate']), float(obj['Quantity'])))
+
+    for key, value in obj.items():
+        if isinstance(value, list) and value and isinstance(value[0], Level):
+            obj[key] = CompactBook.from_pairs(value)
+    return obj
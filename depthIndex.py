@@ -0,0 +1,193 @@
+# This file contains the depth index used to answer fill price queries
+
+import bisect
+
+# NumPy is optional, without it the index falls back to plain lists
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+'''
+This class indexes one side of an order book (best level first) with running
+totals of quantity and notional (quantity * rate). It is built once per book
+snapshot, after which the fill price or limit rate for any quantity is a binary
+search instead of a walk over the book.
+
+The answers match restAPIHelpers.get_average_fill_price and get_rate:
+    fill_price(q) is the average rate paid to fill q, or the average of the
+    whole book if it is not deep enough
+    rate(q, side) is the rate of the level that completes q moved 0.5% deeper
+    into the book, or None if the book is not deep enough
+'''
+class DepthIndex:
+    def __init__(self, book):
+        # A compactBook.CompactBook already holds the columns
+        if hasattr(book, 'rates'):
+            self.build(book.rates, book.quantities)
+            return
+        rates = [float(order['Rate']) for order in book]
+        quantities = [float(order['Quantity']) for order in book]
+        self.build(rates, quantities)
+
+    # Build the index from parallel columns of rates and quantities
+    @classmethod
+    def from_columns(cls, rates, quantities):
+        index = cls.__new__(cls)
+        index.build(rates, quantities)
+        return index
+
+    def build(self, rates, quantities):
+        self.size = len(rates)
+        if numpy is not None:
+            self.rates = numpy.asarray(rates, dtype=float)
+            self.quantities = numpy.asarray(quantities, dtype=float)
+            self.cumQuantity = numpy.cumsum(self.quantities)
+            self.cumNotional = numpy.cumsum(self.quantities * self.rates)
+        else:
+            self.rates = list(rates)
+            self.quantities = list(quantities)
+            self.cumQuantity = []
+            self.cumNotional = []
+            totalQuantity = 0.0
+            totalNotional = 0.0
+            for rate, quantity in zip(self.rates, self.quantities):
+                totalQuantity += quantity
+                totalNotional += quantity * rate
+                self.cumQuantity.append(totalQuantity)
+                self.cumNotional.append(totalNotional)
+
+    # Total quantity resting on this side of the book
+    def total_quantity(self):
+        if self.size == 0:
+            return 0.0
+        return float(self.cumQuantity[-1])
+
+    # Index of the first level whose running total is above the quantity,
+    # this is the level that the quantity only partially fills
+    def level_for(self, quantity):
+        if numpy is not None:
+            return int(numpy.searchsorted(self.cumQuantity, quantity,
+                                          side='right'))
+        return bisect.bisect_right(self.cumQuantity, quantity)
+
+    # Return the average fill price for a quantity
+    def fill_price(self, quantity):
+        if self.size == 0 or quantity <= 0:
+            return 0
+        level = self.level_for(quantity)
+        if level >= self.size:
+            return float(self.cumNotional[-1] / self.cumQuantity[-1])
+
+        filledQuantity = 0.0
+        filledNotional = 0.0
+        if level > 0:
+            filledQuantity = float(self.cumQuantity[level - 1])
+            filledNotional = float(self.cumNotional[level - 1])
+        remaining = quantity - filledQuantity
+        return (filledNotional + remaining * float(self.rates[level])) / quantity
+
+    # Return the limit rate needed to fully fill a quantity
+    def rate(self, quantity, marketSide):
+        multiplicationFactor = 1.005 if marketSide == 'buy' else .995
+        level = self.level_for(quantity)
+        if level >= self.size:
+            return None
+        return float('%.8f'%(float(self.rates[level]) * multiplicationFactor))
+
+    # Return the average fill price for every quantity in a sequence
+    def fill_prices(self, quantities):
+        if numpy is None or self.size == 0:
+            return [self.fill_price(quantity) for quantity in quantities]
+
+        quantities = numpy.asarray(quantities, dtype=float)
+        levels = numpy.searchsorted(self.cumQuantity, quantities, side='right')
+        partial = numpy.minimum(levels, self.size - 1)
+
+        # Running totals of the fully consumed levels before the partial one
+        filledQuantity = numpy.where(levels > 0,
+                                     self.cumQuantity[numpy.maximum(levels - 1, 0)],
+                                     0.0)
+        filledNotional = numpy.where(levels > 0,
+                                     self.cumNotional[numpy.maximum(levels - 1, 0)],
+                                     0.0)
+        remaining = quantities - filledQuantity
+
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            prices = (filledNotional + remaining * self.rates[partial]) / quantities
+            wholeBook = self.cumNotional[-1] / self.cumQuantity[-1]
+        prices = numpy.where(levels >= self.size, wholeBook, prices)
+        prices = numpy.where(quantities <= 0, 0.0, prices)
+        return prices.tolist()
+
+    '''
+    Return the fill price curve of the book for a sequence of quantities, in
+    one pass over all of them
+    Response:
+    {
+        'quantity': [FLOAT],
+        'fill-price': [FLOAT],      same as fill_price()
+        'worst-price': [FLOAT],     rate of the level that completes the
+                                    quantity, None if the book is not deep enough
+        'rate': [FLOAT],            same as rate()
+        'slippage-bps': [FLOAT]     distance of the fill price from the best
+                                    level, in basis points
+    }
+    '''
+    def slippage_curve(self, quantities, marketSide):
+        multiplicationFactor = 1.005 if marketSide == 'buy' else .995
+        quantities = [float(quantity) for quantity in quantities]
+        fillPrices = self.fill_prices(quantities)
+        if self.size == 0:
+            return {'quantity': quantities,
+                    'fill-price': fillPrices,
+                    'worst-price': [None] * len(quantities),
+                    'rate': [None] * len(quantities),
+                    'slippage-bps': [None] * len(quantities)}
+
+        # The worst level is the one the quantity ends in, the limit rate is
+        # taken from the level after it when a level is used up exactly (as
+        # rate() does)
+        bestRate = float(self.rates[0])
+        if numpy is not None:
+            worstLevels = numpy.searchsorted(self.cumQuantity, quantities,
+                                             side='left')
+            rateLevels = numpy.searchsorted(self.cumQuantity, quantities,
+                                            side='right')
+            lastLevel = self.size - 1
+            worstRates = self.rates[numpy.minimum(worstLevels, lastLevel)].tolist()
+            limitRates = self.rates[numpy.minimum(rateLevels, lastLevel)].tolist()
+            worstLevels = worstLevels.tolist()
+            rateLevels = rateLevels.tolist()
+            slippage = (numpy.abs(numpy.asarray(fillPrices) - bestRate) /
+                        bestRate * 10000).tolist()
+        else:
+            worstLevels = [bisect.bisect_left(self.cumQuantity, quantity)
+                           for quantity in quantities]
+            rateLevels = [self.level_for(quantity) for quantity in quantities]
+            lastLevel = self.size - 1
+            worstRates = [float(self.rates[min(level, lastLevel)])
+                          for level in worstLevels]
+            limitRates = [float(self.rates[min(level, lastLevel)])
+                          for level in rateLevels]
+            slippage = [abs(price - bestRate) / bestRate * 10000
+                        for price in fillPrices]
+
+        worstPrices = []
+        rates = []
+        for i in range(len(quantities)):
+            if quantities[i] <= 0:
+                worstPrices.append(None)
+                rates.append(None)
+                slippage[i] = 0.0
+                continue
+            worstPrices.append(worstRates[i] if worstLevels[i] < self.size
+                               else None)
+            rates.append(float('%.8f'%(limitRates[i] * multiplicationFactor))
+                         if rateLevels[i] < self.size else None)
+
+        return {'quantity': quantities,
+                'fill-price': fillPrices,
+                'worst-price': worstPrices,
+                'rate': rates,
+                'slippage-bps': slippage}
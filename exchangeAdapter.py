@@ -0,0 +1,74 @@
+# This file contains the interface every exchange wrapper implements
+
+'''
+This class is the interface the router uses to talk to an exchange. Each
+exchange wrapper (bittrexWrapper.Wrapper, and later Gemini etc.) subclasses it
+and returns responses in the formats documented on bittrexWrapper.Wrapper, so
+the REST api and the router never depend on one exchange's API.
+
+'name' is the exchange name used in responses and in the fill journal, and
+'takerFee' the commission charged on the value of an order that takes
+liquidity, which is reserved on top of the cost of a buy.
+'''
+class ExchangeAdapter:
+    name = 'Exchange'
+    takerFee = 0.0
+
+    # Prepare the adapter to serve requests (credentials, connections,
+    # caches), called once at startup. Adapters without any return at once.
+    def warm_up(self):
+        pass
+
+    # Return the market name for a pair in this exchange's format
+    def format_ticker(self, baseCurrency, counterCurrency):
+        raise NotImplementedError
+
+    # Return True/False if the exchange lists the market
+    def is_valid_market(self, currency0, currency1):
+        raise NotImplementedError
+
+    # Return True/False if the exchange lists the currency
+    def is_valid_currency(self, currency):
+        raise NotImplementedError
+
+    # Return one side ('buy' or 'sell') of a market's book, best level first,
+    # as a compactBook.CompactBook when 'compact' is True
+    def get_orderbook(self, market, booktype, compact=False):
+        raise NotImplementedError
+
+    # Return at least enough of the best levels of a book to fill
+    # 'quantity' * 'margin', as a compact book with a 'partial' flag.
+    # Exchanges that can not read a book part way return the whole book.
+    def get_orderbook_depth(self, market, booktype, quantity, margin=1.5):
+        orderbookResponse = self.get_orderbook(market, booktype, compact=True)
+        orderbookResponse['partial'] = False
+        return orderbookResponse
+
+    def get_balance(self, currency):
+        raise NotImplementedError
+
+    def get_balances(self):
+        raise NotImplementedError
+
+    # Place a limit order, a reply with 'unknown' True means the request was
+    # sent but not answered and the order may have been placed
+    def buy_limit(self, market, amount, price):
+        raise NotImplementedError
+
+    def sell_limit(self, market, amount, price):
+        raise NotImplementedError
+
+    def cancel_order(self, uuid):
+        raise NotImplementedError
+
+    def get_order(self, uuid):
+        raise NotImplementedError
+
+    def get_open_orders(self, market=None):
+        raise NotImplementedError
+
+    # Return the uuids of the open and recent orders on a market matching a
+    # 'buy' or 'sell' of 'amount' at 'price', used to find an order whose
+    # placement went unanswered
+    def find_orders(self, market, orderType, amount, price):
+        raise NotImplementedError
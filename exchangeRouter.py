@@ -0,0 +1,180 @@
+# This file contains the router that quotes and routes across exchanges
+
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import orderSplitter
+import resilience
+import restAPIHelpers as helpers
+
+'''
+This class is one exchange the router can use: the adapter that trades on it
+and, optionally, the source of its order books (an OrderBookEngine replica).
+Without a book source books are fetched from the adapter directly.
+'''
+class Venue:
+    def __init__(self, adapter, bookSource=None):
+        self.adapter = adapter
+        self.bookSource = bookSource
+        self.name = adapter.name
+
+    # Return one side of a market's book for a currency pair on this venue,
+    # with 'quantity' only as much of the book as is needed to fill it
+    def get_orderbook(self, baseCurrency, counterCurrency, side,
+                      maxStaleness=None, quantity=None):
+        if not self.adapter.is_valid_market(baseCurrency, counterCurrency):
+            return {'success': False}
+
+        market = self.adapter.format_ticker(baseCurrency, counterCurrency)
+        if self.bookSource is not None:
+            response = self.bookSource.get_orderbook(market, side, maxStaleness,
+                                                     quantity)
+        elif quantity is not None:
+            response = self.adapter.get_orderbook_depth(market, side, quantity)
+        else:
+            response = self.adapter.get_orderbook(market, side, compact=True)
+        response['market'] = market
+        return response
+
+'''
+This class fans requests out to every venue in parallel and picks the best
+answer. Each venue gets at most 'timeout' seconds; a venue that is slow or
+fails is left out and reported in 'missing' rather than holding up the quote.
+The default timeout is a second longer than a guarded request waits
+(resilience.MAX_WAIT), so a venue whose exchange is failing still answers with
+its stale book instead of being left out.
+
+For a 'buy' book (bids, what we get when selling) the highest price is best,
+for a 'sell' book (asks) the lowest. Venues whose book is deep enough to fill
+the whole quantity are always preferred over venues that are not.
+'''
+class ExchangeRouter:
+    def __init__(self, venues, timeout=resilience.MAX_WAIT + 1.0,
+                 maxWorkers=16):
+        self.venues = list(venues)
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(max_workers=maxWorkers)
+
+    # Return the venue with a given name, None if there is none
+    def get_venue(self, name):
+        for venue in self.venues:
+            if venue.name == name:
+                return venue
+        return None
+
+    # Return True if any venue lists the market
+    def is_valid_market(self, currency0, currency1):
+        return any(venue.adapter.is_valid_market(currency0, currency1)
+                   for venue in self.venues)
+
+    # Return True if any venue lists the currency
+    def is_valid_currency(self, currency):
+        return any(venue.adapter.is_valid_currency(currency)
+                   for venue in self.venues)
+
+    '''
+    Fetch one side of a pair's book from every venue at once. With
+    'quantity' a venue may return only the best levels that cover it.
+    Response:
+    (
+        {VENUE_NAME: ORDERBOOK_RESPONSE},   venues that answered in time
+        [VENUE_NAME]                        venues that failed or timed out
+    )
+    '''
+    def get_orderbooks(self, baseCurrency, counterCurrency, side,
+                       maxStaleness=None, quantity=None):
+        futures = {}
+        for venue in self.venues:
+            futures[self.executor.submit(venue.get_orderbook, baseCurrency,
+                                         counterCurrency, side, maxStaleness,
+                                         quantity)] = venue.name
+
+        done, notDone = wait(futures, timeout=self.timeout)
+
+        books = {}
+        missing = [futures[future] for future in notDone]
+        for future in done:
+            try:
+                response = future.result()
+            except Exception:
+                response = {'success': False}
+            if response['success'] == True:
+                books[futures[future]] = response
+            else:
+                missing.append(futures[future])
+        return books, missing
+
+    # Return the name of the best candidate, preferring venues that fill fully
+    def pick_best(self, candidates, highestIsBest):
+        if not candidates:
+            return None
+        filled = [candidate for candidate in candidates if candidate[2]]
+        if filled:
+            candidates = filled
+        if highestIsBest:
+            return max(candidates, key=lambda candidate: candidate[1])[0]
+        return min(candidates, key=lambda candidate: candidate[1])[0]
+
+    '''
+    Return the best average fill price for a quantity across the books
+    fetched by get_orderbooks
+    Response:
+    {
+        'success': BOOLEAN,
+        'exchange': STRING,
+        'fill-price': FLOAT,
+        'quotes': {VENUE_NAME: FLOAT},
+        'missing': [VENUE_NAME],
+        'stale': BOOLEAN
+    }
+    'stale' is True when the chosen venue's book is a last good copy served
+    while that exchange is failing.
+    '''
+    def best_fill_price_from(self, books, missing, quantity, side='buy'):
+        quotes = {}
+        candidates = []
+        for name, orderbookResponse in books.items():
+            price = helpers.get_average_fill_price(orderbookResponse, quantity)
+            quotes[name] = price
+            fillsFully = helpers.get_book_depth(orderbookResponse) >= quantity
+            candidates.append((name, price, fillsFully))
+
+        best = self.pick_best(candidates, side == 'buy')
+        if best is None:
+            return {'success': False, 'quotes': quotes, 'missing': missing}
+        return {'success': True,
+                'exchange': best,
+                'fill-price': quotes[best],
+                'quotes': quotes,
+                'missing': missing,
+                'stale': bool(books[best].get('stale'))}
+
+    '''
+    Split an order into child orders across the venues' books, taking the
+    best levels of every venue until the quantity is filled
+    Response:
+    {
+        'success': BOOLEAN,
+        'children': [{
+            'exchange': STRING,
+            'venue': Venue,
+            'market': STRING,
+            'quantity': FLOAT,
+            'rate': FLOAT,
+            'averagePrice': FLOAT
+        }],
+        'averagePrice': FLOAT,
+        'missing': [VENUE_NAME]
+    }
+    '''
+    def split_order(self, baseCurrency, counterCurrency, quantity, orderType,
+                    maxStaleness=None):
+        books, missing = self.get_orderbooks(baseCurrency, counterCurrency,
+                                             orderSplitter.book_side(orderType),
+                                             maxStaleness)
+        split = orderSplitter.split_order(books, quantity, orderType)
+        split['missing'] = missing
+        if split['success'] == True:
+            for child in split['children']:
+                child['venue'] = self.get_venue(child['exchange'])
+                child['market'] = books[child['exchange']]['market']
+        return split
@@ -0,0 +1,193 @@
+# This file contains the journal that filled orders are written to
+
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from queue import Queue, Empty
+
+logger = logging.getLogger(__name__)
+
+'''
+This class appends filled orders to a file, one JSON object per line, in the
+same format as restAPIHelpers.output_to_file.
+
+Callers only put records on a queue. A single writer thread owns the open file
+and writes everything that arrives within 'flushInterval' seconds as one batch
+(group commit), so a large batch of fills costs one write and flush instead of
+an open/append/close per fill, and lines from different threads never
+interleave.
+
+fsyncPolicy controls durability:
+    'always'   - fsync after every batch
+    'interval' - fsync at most once every 'fsyncInterval' seconds
+    'never'    - leave it to the operating system
+
+When the file grows past 'maxBytes' it is rotated to file.1, file.2, ... and
+at most 'backupCount' old files are kept. A maxBytes of 0 disables rotation.
+
+A batch that can not be written is logged and dropped, the writer reopens the
+file and carries on with the next one. flush() raises IOError if a batch
+failed while it waited, so callers that need their records on disk (see
+restAPI.order_recorder) can report them again.
+'''
+class FillJournal:
+    def __init__(self, filename, flushInterval=0.05, fsyncPolicy='interval',
+                 fsyncInterval=1.0, maxBytes=10 * 1024 * 1024, backupCount=5):
+        if fsyncPolicy not in ('always', 'interval', 'never'):
+            raise ValueError('invalid fsync policy: ' + str(fsyncPolicy))
+
+        self.filename = filename
+        self.flushInterval = flushInterval
+        self.fsyncPolicy = fsyncPolicy
+        self.fsyncInterval = fsyncInterval
+        self.maxBytes = maxBytes
+        self.backupCount = backupCount
+
+        self.records = Queue()
+        self.openFile = None
+        self.failures = 0
+        self.lastSync = time.monotonic()
+        self.writerThread = None
+        self.startLock = threading.Lock()
+
+    # Queue a record to be written, never blocks on disk
+    def write(self, record):
+        self.start()
+        self.records.put(record)
+
+    # Block until every record queued so far is written, raise IOError if a
+    # batch failed in the meantime
+    def flush(self):
+        failures = self.failures
+        self.records.join()
+        if self.failures != failures:
+            raise IOError('failed to write to ' + self.filename)
+
+    # Write everything still queued and stop the writer thread
+    def close(self):
+        if self.writerThread is None:
+            return
+        self.records.put(None)
+        self.writerThread.join()
+        self.writerThread = None
+
+    def start(self):
+        if self.writerThread is not None:
+            return
+        with self.startLock:
+            if self.writerThread is None:
+                self.writerThread = threading.Thread(target=self.write_loop,
+                                                     daemon=True)
+                self.writerThread.start()
+
+    def write_loop(self):
+        running = True
+        while running:
+            # Wait for the first record, then gather everything that arrives
+            # within the flush interval into the same batch
+            batch = [self.records.get()]
+            deadline = time.monotonic() + self.flushInterval
+            while batch[-1] is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.records.get(timeout=remaining))
+                except Empty:
+                    break
+
+            if batch[-1] is None:
+                running = False
+
+            lines = [json.dumps(record) + "\n"
+                     for record in batch if record is not None]
+            try:
+                if lines:
+                    self.commit(lines)
+            except Exception:
+                # Counted before task_done() so flush() sees it
+                self.failures += 1
+                logger.exception('dropped %d records not written to %s',
+                                 len(lines), self.filename)
+                self.close_file()
+            finally:
+                for record in batch:
+                    self.records.task_done()
+
+        try:
+            if self.openFile is not None:
+                self.sync()
+        except Exception:
+            logger.exception('failed to sync %s', self.filename)
+        self.close_file()
+
+    # Close the file quietly, the next batch opens it again
+    def close_file(self):
+        if self.openFile is not None:
+            try:
+                self.openFile.close()
+            except Exception:
+                pass
+            self.openFile = None
+
+    # Write one batch of lines, sync and rotate as configured
+    def commit(self, lines):
+        if self.openFile is None:
+            self.openFile = open(self.filename, 'a')
+        self.openFile.write(''.join(lines))
+        self.openFile.flush()
+
+        if self.fsyncPolicy == 'always':
+            self.sync()
+        elif self.fsyncPolicy == 'interval' and \
+             time.monotonic() - self.lastSync >= self.fsyncInterval:
+            self.sync()
+
+        if self.maxBytes > 0 and self.openFile.tell() >= self.maxBytes:
+            self.rotate()
+
+    def sync(self):
+        if self.fsyncPolicy != 'never':
+            self.openFile.flush()
+            os.fsync(self.openFile.fileno())
+        self.lastSync = time.monotonic()
+
+    # Move file -> file.1 -> file.2 ... and start a new file
+    def rotate(self):
+        self.sync()
+        self.openFile.close()
+
+        for i in range(self.backupCount - 1, 0, -1):
+            source = '{0}.{1}'.format(self.filename, i)
+            if os.path.exists(source):
+                os.replace(source, '{0}.{1}'.format(self.filename, i + 1))
+        if self.backupCount > 0:
+            os.replace(self.filename, self.filename + '.1')
+        else:
+            os.remove(self.filename)
+
+        self.openFile = open(self.filename, 'a')
+
+# Return the journal files for a filename oldest first, rotated files included
+def journal_files(filename):
+    backups = []
+    for path in glob.glob(glob.escape(filename) + '.*'):
+        suffix = path[len(filename) + 1:]
+        if suffix.isdigit():
+            backups.append((int(suffix), path))
+    files = [path for number, path in sorted(backups, reverse=True)]
+    if os.path.exists(filename):
+        files.append(filename)
+    return files
+
+# Lazily yield every record in a journal, oldest first
+def read_records(filename):
+    for path in journal_files(filename):
+        with open(path, 'r') as journalFile:
+            for line in journalFile:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
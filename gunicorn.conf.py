@@ -0,0 +1,30 @@
+# This file contains the gunicorn settings for running restAPI in production
+#
+# Run with: gunicorn -c gunicorn.conf.py "restAPI:create_app()"
+
+import multiprocessing
+import os
+
+# One listener shared by every worker process
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+
+# One worker per core by default, each with a pool of threads so a request
+# waiting on the exchange does not hold up the rest of the worker
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+worker_class = 'gthread'
+threads = int(os.environ.get('THREADS', 8))
+
+# Every worker builds its own wrapper, sessions and book caches after the fork,
+# nothing with open connections or threads is shared with the master. Each
+# worker warms up in create_app() before it accepts its first connection.
+preload_app = False
+
+# Workers share open orders and balances through orders.db, and elect one of
+# them to poll orders (see restAPI.py). Each worker also needs the number of
+# workers to take its share of the order book refresh rate.
+raw_env = ['EXCHANGE_ROUTER_SHARED_STATE=1',
+           'EXCHANGE_ROUTER_WORKERS={0}'.format(workers)]
+
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
@@ -0,0 +1,50 @@
+# This file contains a set of locks keyed by resource name
+
+import threading
+import time
+from contextlib import contextmanager
+
+import metrics
+
+metrics.registry.describe('lock_wait_seconds', 'Time spent waiting for a lock')
+
+'''
+This class hands out one lock per key (for example per currency), so work on
+different resources runs in parallel and only work on the same resource is
+serialized. Locks are created on first use and kept for the life of the
+process, the set of keys (currencies, markets) is small. The time spent
+waiting for a lock is recorded under the 'name' of the set.
+
+Usage:
+    with locks.hold('USDT'):
+        ...
+'''
+class KeyedLocks:
+    def __init__(self, name='keyed'):
+        self.name = name
+        self.locks = {}
+        self.guard = threading.Lock()
+
+    # Return the lock for a key, creating it if needed
+    def get_lock(self, key):
+        lock = self.locks.get(key)
+        if lock is None:
+            with self.guard:
+                lock = self.locks.get(key)
+                if lock is None:
+                    lock = threading.Lock()
+                    self.locks[key] = lock
+        return lock
+
+    @contextmanager
+    def hold(self, key):
+        lock = self.get_lock(key)
+        startTime = time.perf_counter()
+        lock.acquire()
+        metrics.registry.observe('lock_wait_seconds',
+                                 time.perf_counter() - startTime,
+                                 lock=self.name)
+        try:
+            yield
+        finally:
+            lock.release()
@@ -0,0 +1,65 @@
+# This file contains the election of the one process that polls orders
+
+import fcntl
+import os
+import threading
+import time
+
+'''
+This class elects one leader among the worker processes serving the API, using
+an exclusive flock on 'filename'. The process holding the lock is the leader
+and calls 'onElected' once; the others keep trying every 'retryInterval'
+seconds. The operating system releases the lock when the leader exits for any
+reason, so another process takes over within one retry interval.
+
+A single process is elected on its first attempt, so the same code runs
+unchanged with one process or many.
+'''
+class LeaderElection:
+    def __init__(self, filename, onElected, retryInterval=1.0):
+        self.filename = filename
+        self.onElected = onElected
+        self.retryInterval = retryInterval
+        self.lockFile = None
+        self.leader = False
+        self.electionThread = None
+        self.startLock = threading.Lock()
+
+    # Try to become the leader now, then keep trying in the background
+    def start(self):
+        with self.startLock:
+            if self.electionThread is not None:
+                return
+            if self.try_elect():
+                self.electionThread = threading.current_thread()
+                return
+            self.electionThread = threading.Thread(target=self.election_loop,
+                                                   daemon=True)
+            self.electionThread.start()
+
+    def election_loop(self):
+        while not self.try_elect():
+            time.sleep(self.retryInterval)
+
+    # Take the lock if no other process holds it, return True if elected
+    def try_elect(self):
+        lockFile = open(self.filename, 'a')
+        try:
+            fcntl.flock(lockFile.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lockFile.close()
+            return False
+
+        # Keep the file open for as long as the process lives
+        self.lockFile = lockFile
+        lockFile.seek(0)
+        lockFile.truncate()
+        lockFile.write(str(os.getpid()) + '\n')
+        lockFile.flush()
+
+        self.leader = True
+        self.onElected()
+        return True
+
+    def is_leader(self):
+        return self.leader
@@ -0,0 +1,95 @@
+# This file contains the registry of valid markets and currencies
+
+import threading
+import time
+
+'''
+This class keeps the list of currencies and markets that Bittrex supports in
+memory so validation does not need a round trip to the exchange. Both lists are
+loaded with one 'getcurrencies' and one 'getmarkets' call into sets, and are
+refreshed by a background thread every 'ttl' seconds.
+
+If the registry has never loaded successfully the lookups return None so the
+caller can fall back to asking the exchange directly.
+'''
+class MarketRegistry:
+    def __init__(self, wrapper, ttl=3600, retryInterval=30):
+        self.wrapper = wrapper
+        self.ttl = ttl
+        self.retryInterval = retryInterval
+        self.currencies = None
+        self.markets = None
+        self.lastRefresh = 0
+        self.refreshLock = threading.Lock()
+        self.startLock = threading.Lock()
+        self.refreshThread = None
+
+    # Download both lists and swap in the new sets, return True on success
+    def refresh(self):
+        with self.refreshLock:
+            currencyResponse = self.wrapper.process_command('getcurrencies',
+                                                            'public')
+            marketResponse = self.wrapper.process_command('getmarkets',
+                                                          'public')
+            return self.load(currencyResponse, marketResponse)
+
+    # Build the sets from 'getcurrencies' and 'getmarkets' API responses
+    def load(self, currencyResponse, marketResponse):
+        if not (currencyResponse['success'] and marketResponse['success']):
+            return False
+
+        currencies = frozenset(i['Currency']
+                               for i in currencyResponse['result'])
+        markets = frozenset(i['MarketName']
+                            for i in marketResponse['result'])
+
+        # Assigning a new set is atomic, readers never need the lock
+        self.currencies = currencies
+        self.markets = markets
+        self.lastRefresh = time.time()
+        return True
+
+    # Load the registry once and start refreshing it in the background
+    def start(self):
+        # Cheap check first so validation calls do not contend on the lock
+        if self.refreshThread is not None:
+            return
+
+        with self.startLock:
+            if self.refreshThread is not None:
+                return
+
+            try:
+                self.refresh()
+            except Exception:
+                pass
+
+            self.refreshThread = threading.Thread(target=self.refresh_loop,
+                                                  daemon=True)
+            self.refreshThread.start()
+
+    # Refresh every ttl seconds, retry sooner while nothing has been loaded
+    def refresh_loop(self):
+        while True:
+            if self.markets is None:
+                time.sleep(min(self.ttl, self.retryInterval))
+            else:
+                time.sleep(self.ttl)
+
+            try:
+                self.refresh()
+            except Exception:
+                # Keep serving the last good lists, try again next time
+                pass
+
+    # Return True/False if the currency exists, None if not loaded yet
+    def has_currency(self, currency):
+        if self.currencies is None:
+            return None
+        return currency in self.currencies
+
+    # Return True/False if the market exists, None if not loaded yet
+    def has_market(self, market):
+        if self.markets is None:
+            return None
+        return market in self.markets
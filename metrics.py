@@ -0,0 +1,164 @@
+# This file contains the latency histograms and gauges exposed at /metrics
+
+import bisect
+import threading
+import time
+
+# Default histogram buckets in seconds, from 100us to 10s
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+'''
+This class is a thread safe histogram with fixed buckets, in the same shape as
+a Prometheus histogram: a count per bucket, a total count and a sum.
+'''
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+
+    # Return (cumulative bucket counts, count, sum)
+    def snapshot(self):
+        with self.lock:
+            counts = list(self.counts)
+            count = self.count
+            total = self.sum
+        cumulative = []
+        runningTotal = 0
+        for bucketCount in counts[:-1]:
+            runningTotal += bucketCount
+            cumulative.append(runningTotal)
+        return cumulative, count, total
+
+'''
+This class holds every metric of the process and renders them in the
+Prometheus text format. Histograms are created on first use per set of label
+values. Gauges are functions called when the metrics are rendered, so a gauge
+such as a queue depth costs nothing until it is scraped.
+'''
+class MetricsRegistry:
+    def __init__(self):
+        self.histograms = {}
+        self.gauges = {}
+        self.help = {}
+        self.lock = threading.Lock()
+
+    # Return the histogram for a metric name and label values
+    def histogram(self, name, **labels):
+        key = tuple(sorted(labels.items()))
+        family = self.histograms.get(name)
+        if family is None or key not in family:
+            with self.lock:
+                family = self.histograms.setdefault(name, {})
+                if key not in family:
+                    family[key] = Histogram()
+        return family[key]
+
+    # Set the help text shown for a metric
+    def describe(self, name, help):
+        with self.lock:
+            self.help[name] = help
+
+    # Record one sample in seconds
+    def observe(self, name, value, **labels):
+        self.histogram(name, **labels).observe(value)
+
+    # Register a function returning the current value of a gauge
+    def gauge(self, name, function, help=''):
+        with self.lock:
+            self.gauges[name] = function
+            if help:
+                self.help[name] = help
+
+    def format_labels(self, key, extra=()):
+        pairs = list(key) + list(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join('{0}="{1}"'.format(label, str(value).replace('"', '\\"'))
+                              for label, value in pairs) + '}'
+
+    # Render every metric in the Prometheus text exposition format
+    def render(self):
+        lines = []
+        with self.lock:
+            histograms = dict((name, dict(family))
+                              for name, family in self.histograms.items())
+            gauges = dict(self.gauges)
+
+        for name in sorted(histograms):
+            if name in self.help:
+                lines.append('# HELP {0} {1}'.format(name, self.help[name]))
+            lines.append('# TYPE {0} histogram'.format(name))
+            for key, histogram in sorted(histograms[name].items()):
+                cumulative, count, total = histogram.snapshot()
+                for bucket, bucketCount in zip(histogram.buckets, cumulative):
+                    lines.append('{0}_bucket{1} {2}'.format(
+                        name, self.format_labels(key, [('le', repr(bucket))]),
+                        bucketCount))
+                lines.append('{0}_bucket{1} {2}'.format(
+                    name, self.format_labels(key, [('le', '+Inf')]), count))
+                lines.append('{0}_sum{1} {2}'.format(
+                    name, self.format_labels(key), total))
+                lines.append('{0}_count{1} {2}'.format(
+                    name, self.format_labels(key), count))
+
+        for name in sorted(gauges):
+            try:
+                value = gauges[name]()
+            except Exception:
+                continue
+            if name in self.help:
+                lines.append('# HELP {0} {1}'.format(name, self.help[name]))
+            lines.append('# TYPE {0} gauge'.format(name))
+            lines.append('{0} {1}'.format(name, value))
+
+        return '\n'.join(lines) + '\n'
+
+# The registry used by the whole process
+registry = MetricsRegistry()
+registry.describe('router_request_seconds', 'Time spent serving a route')
+registry.describe('router_stage_seconds', 'Time spent in each stage of a route')
+
+'''
+This class times the stages of one request. Each call to mark() records the
+time since the previous mark (or since the timer was created) as one stage in
+the 'router_stage_seconds' histogram, and finish() records the whole request
+in 'router_request_seconds'. header() returns the breakdown in the
+Server-Timing header format, in milliseconds.
+'''
+class StageTimer:
+    def __init__(self, route):
+        self.route = route
+        self.startTime = time.perf_counter()
+        self.lastMark = self.startTime
+        self.stages = []
+
+    def mark(self, stage):
+        now = time.perf_counter()
+        elapsed = now - self.lastMark
+        self.lastMark = now
+        self.stages.append((stage, elapsed))
+        registry.observe('router_stage_seconds', elapsed, route=self.route,
+                         stage=stage)
+
+    def finish(self):
+        elapsed = time.perf_counter() - self.startTime
+        registry.observe('router_request_seconds', elapsed, route=self.route)
+        return elapsed
+
+    def header(self):
+        parts = ['{0};dur={1:.3f}'.format(stage, elapsed * 1000)
+                 for stage, elapsed in self.stages]
+        parts.append('total;dur={0:.3f}'.format(
+            (time.perf_counter() - self.startTime) * 1000))
+        return ', '.join(parts)
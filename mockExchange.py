@@ -0,0 +1,203 @@
+# This file contains a local mock of the Bittrex v1.1 API used for benchmarks
+
+import argparse
+import random
+import threading
+import time
+import uuid
+
+from flask import Flask
+from flask import jsonify
+from flask import request
+
+'''
+This server answers the public, market and account routes that
+bittrexWrapper.Wrapper uses, with synthetic data, so the router can be tested
+and benchmarked offline and reproducibly. Point the router at it with:
+
+    python mockExchange.py --port 5001 --depth 500 --latency-ms 20
+    BITTREX_API_URL=http://localhost:5001/api/v1.1/ python restAPI.py
+
+Every book has 'depth' levels per side around a fixed mid price. Each request
+sleeps 'latency-ms' milliseconds (plus up to 'jitter-ms' more) and fails with
+probability 'error-rate', so slow or flaky exchange behaviour can be injected.
+Placed orders close with probability 'fill-rate' each time they are looked up.
+API keys and signatures are not checked.
+'''
+
+app = Flask(__name__)
+
+# Markets served and their mid prices, the currencies are derived from these
+MARKETS = {'USDT-BTC': 8000.0, 'USDT-ETH': 400.0, 'BTC-ETH': 0.05,
+           'USDT-LTC': 120.0, 'BTC-LTC': 0.015}
+
+config = {'depth': 500, 'latency': 0.0, 'jitter': 0.0, 'errorRate': 0.0,
+          'fillRate': 0.5, 'balance': 1000000.0}
+
+books = {}
+orders = {}
+ordersLock = threading.Lock()
+
+# Build 'depth' levels for both sides of every market, best level first
+def build_books(depth, seed=0):
+    generator = random.Random(seed)
+    books.clear()
+    for market, mid in MARKETS.items():
+        tick = mid * 0.0005
+        books[market] = {
+            'buy': [{'Quantity': round(generator.uniform(0.1, 5.0), 8),
+                     'Rate': round(mid - tick * (i + 1), 8)}
+                    for i in range(depth)],
+            'sell': [{'Quantity': round(generator.uniform(0.1, 5.0), 8),
+                      'Rate': round(mid + tick * (i + 1), 8)}
+                     for i in range(depth)]}
+
+def currencies():
+    names = set()
+    for market in MARKETS:
+        names.update(market.split('-'))
+    return sorted(names)
+
+def success(result):
+    return jsonify({'success': True, 'message': '', 'result': result})
+
+def failure(message):
+    return jsonify({'success': False, 'message': message, 'result': None})
+
+def market_summary(market):
+    return {'MarketName': market,
+            'Bid': books[market]['buy'][0]['Rate'],
+            'Ask': books[market]['sell'][0]['Rate'],
+            'Last': MARKETS[market],
+            'Volume': 1000.0,
+            'BaseVolume': 1000.0 * MARKETS[market]}
+
+def place_order(orderType):
+    market = request.args.get('market')
+    if market not in MARKETS:
+        return failure('INVALID_MARKET')
+    orderUUID = str(uuid.uuid4())
+    with ordersLock:
+        orders[orderUUID] = {'OrderUuid': orderUUID,
+                             'Exchange': market,
+                             'Type': orderType,
+                             'OrderType': orderType,
+                             'Limit': float(request.args.get('rate', 0)),
+                             'Quantity': float(request.args.get('quantity', 0)),
+                             'Price': float(request.args.get('quantity', 0)) *
+                                      float(request.args.get('rate', 0)),
+                             'QuantityRemaining': float(request.args.get('quantity', 0)),
+                             'CommissionPaid': 0.0,
+                             'Opened': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                             'IsOpen': True}
+    return success({'uuid': orderUUID})
+
+@app.route('/api/v1.1/<requestType>/<command>', methods=['GET'])
+def api(requestType, command):
+    # Inject latency and errors before answering
+    delay = config['latency'] + random.random() * config['jitter']
+    if delay > 0:
+        time.sleep(delay)
+    if random.random() < config['errorRate']:
+        return jsonify({'success': False, 'message': 'INJECTED_ERROR',
+                        'result': None}), 503
+
+    market = request.args.get('market')
+
+    if requestType == 'public':
+        if command == 'getcurrencies':
+            return success([{'Currency': name, 'IsActive': True}
+                            for name in currencies()])
+        if command == 'getmarkets':
+            return success([{'MarketName': name, 'IsActive': True}
+                            for name in MARKETS])
+        if command == 'getmarketsummaries':
+            return success([market_summary(name) for name in MARKETS])
+        if market not in MARKETS:
+            return failure('INVALID_MARKET')
+        if command == 'getmarketsummary':
+            return success([market_summary(market)])
+        if command == 'getticker':
+            summary = market_summary(market)
+            return success({'Bid': summary['Bid'], 'Ask': summary['Ask'],
+                            'Last': summary['Last']})
+        if command == 'getorderbook':
+            bookType = request.args.get('type')
+            if bookType == 'both':
+                return success(books[market])
+            if bookType not in ('buy', 'sell'):
+                return failure('TYPE_INVALID')
+            return success(books[market][bookType])
+
+    elif requestType == 'market':
+        if command == 'buylimit':
+            return place_order('LIMIT_BUY')
+        if command == 'selllimit':
+            return place_order('LIMIT_SELL')
+        if command == 'cancel':
+            with ordersLock:
+                order = orders.get(request.args.get('uuid'))
+                if order is None:
+                    return failure('INVALID_ORDER')
+                order['IsOpen'] = False
+            return success(None)
+        if command == 'getopenorders':
+            with ordersLock:
+                return success([dict(order) for order in orders.values()
+                                if order['IsOpen'] and
+                                (market is None or order['Exchange'] == market)])
+
+    elif requestType == 'account':
+        if command == 'getorderhistory':
+            with ordersLock:
+                return success([dict(order) for order in orders.values()
+                                if not order['IsOpen'] and
+                                (market is None or order['Exchange'] == market)])
+        if command == 'getbalance':
+            if request.args.get('currency') not in currencies():
+                return failure('INVALID_CURRENCY')
+            return success({'Currency': request.args.get('currency'),
+                            'Balance': config['balance'],
+                            'Available': config['balance']})
+        if command == 'getbalances':
+            return success([{'Currency': name, 'Balance': config['balance'],
+                             'Available': config['balance']}
+                            for name in currencies()])
+        if command == 'getorder':
+            with ordersLock:
+                order = orders.get(request.args.get('uuid'))
+                if order is None:
+                    return failure('INVALID_ORDER')
+                if order['IsOpen'] and random.random() < config['fillRate']:
+                    order['IsOpen'] = False
+                    order['QuantityRemaining'] = 0.0
+                return success(dict(order))
+
+    return failure('APIKEY_INVALID' if requestType != 'public' else
+                   'INVALID_COMMAND')
+
+def main():
+    parser = argparse.ArgumentParser(description='Mock Bittrex v1.1 API')
+    parser.add_argument('--port', type=int, default=5001)
+    parser.add_argument('--depth', type=int, default=500)
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    parser.add_argument('--jitter-ms', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--fill-rate', type=float, default=0.5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    config['depth'] = args.depth
+    config['latency'] = args.latency_ms / 1000.0
+    config['jitter'] = args.jitter_ms / 1000.0
+    config['errorRate'] = args.error_rate
+    config['fillRate'] = args.fill_rate
+    random.seed(args.seed)
+    build_books(args.depth, args.seed)
+
+    app.run(host='127.0.0.1', port=args.port, threaded=True)
+
+build_books(config['depth'])
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,369 @@
+# This file tests the modules that need no exchange or server, run it with
+# "python offlineTests.py"
+
+import json
+import threading
+import time
+
+import balanceLedger
+import depthIndex
+import exchangeAdapter
+import exchangeRouter
+import orderBookEngine
+import orderSplitter
+import resilience
+import serialization
+import singleFlight
+import tokenBucket
+
+# Build an orderbook response from a list of (rate, quantity)
+def make_book(levels):
+    return {'success': True,
+            'book': [{'Rate': rate, 'Quantity': quantity}
+                     for rate, quantity in levels]}
+
+# Exchange adapter serving fixed books and balances, 'books' maps a book side
+# to its levels
+class FakeAdapter(exchangeAdapter.ExchangeAdapter):
+    def __init__(self, name, books, balances=None):
+        self.name = name
+        self.books = books
+        self.balances = balances if balances is not None else {}
+
+    def format_ticker(self, baseCurrency, counterCurrency):
+        return counterCurrency + '-' + baseCurrency
+
+    def is_valid_market(self, currency0, currency1):
+        return True
+
+    def get_orderbook(self, market, booktype, compact=False):
+        return make_book(self.books[booktype])
+
+    def get_balances(self):
+        return {'success': True, 'balances': dict(self.balances)}
+
+    def get_balance(self, currency):
+        if currency not in self.balances:
+            return {'success': False}
+        return {'success': True, 'balance': self.balances[currency]}
+
+# Test orderSplitter.split_order across several exchanges
+def split_order_test():
+    print ("Testing split order...")
+
+    # A buy takes the asks, lowest rate first on every exchange
+    asks = {'A': make_book([(100, 1), (101, 1), (102, 1)]),
+            'B': make_book([(99, 1), (103, 1)])}
+    split0 = orderSplitter.split_order(asks, 2, 'buy')
+    assert (split0['success'] == True), "split order failed: buy not filled"
+    filled0 = dict((child['exchange'], child['quantity'])
+                   for child in split0['children'])
+    assert (filled0 == {'A': 1, 'B': 1}), "split order failed: buy did not take the lowest asks"
+    assert (abs(split0['averagePrice'] - 99.5) < 1e-9), "split order failed: wrong buy average price"
+
+    # A sell takes the bids, highest rate first on every exchange
+    bids = {'A': make_book([(100, 1), (99, 1), (98, 1)]),
+            'B': make_book([(101, 1), (97, 1)])}
+    split1 = orderSplitter.split_order(bids, 2, 'sell')
+    assert (split1['success'] == True), "split order failed: sell not filled"
+    filled1 = dict((child['exchange'], child['quantity'])
+                   for child in split1['children'])
+    assert (filled1 == {'A': 1, 'B': 1}), "split order failed: sell did not take the highest bids"
+    assert (abs(split1['averagePrice'] - 100.5) < 1e-9), "split order failed: wrong sell average price"
+
+    # Limit rates sit past the deepest level used on each exchange
+    rates1 = dict((child['exchange'], child['rate'])
+                  for child in split1['children'])
+    assert (rates1['B'] < 101 and rates1['A'] < 100), "split order failed: sell limit rate above the level used"
+
+    # Not enough depth on all exchanges together
+    split2 = orderSplitter.split_order(bids, 10, 'sell')
+    assert (split2['success'] == False), "split order failed: success on a book too shallow"
+
+    assert (orderSplitter.book_side('buy') == 'sell'), "split order failed: buy should take the asks"
+    assert (orderSplitter.book_side('sell') == 'buy'), "split order failed: sell should take the bids"
+
+    # The router fetches the side each order takes from
+    router = exchangeRouter.ExchangeRouter([
+        exchangeRouter.Venue(FakeAdapter('A', {'buy': [(100, 1), (99, 1), (98, 1)],
+                                               'sell': [(102, 1), (103, 1)]})),
+        exchangeRouter.Venue(FakeAdapter('B', {'buy': [(101, 1), (97, 1)],
+                                               'sell': [(101, 1), (104, 1)]}))])
+    split3 = router.split_order('ETH', 'USDT', 2, 'buy')
+    assert (split3['success'] == True), "split order failed: routed buy not filled"
+    assert (abs(split3['averagePrice'] - 101.5) < 1e-9), "split order failed: routed buy did not take the lowest asks"
+    split4 = router.split_order('ETH', 'USDT', 2, 'sell')
+    assert (abs(split4['averagePrice'] - 100.5) < 1e-9), "split order failed: routed sell did not take the highest bids"
+    assert (split4['children'][0]['market'] == 'USDT-ETH'), "split order failed: wrong market"
+
+    print ("split order passed all tests!\n")
+
+# Test that the book engine drops books nobody reads and refreshes the rest
+# no faster than its refresh rate
+def book_engine_test():
+    print ("Testing book engine...")
+
+    adapter = FakeAdapter('A', {'buy': [(100, 1), (99, 2)], 'sell': [(101, 1)]})
+    requests = []
+    def get_orderbook(market, booktype, compact=False):
+        requests.append(time.monotonic())
+        return make_book(adapter.books[booktype])
+    adapter.get_orderbook = get_orderbook
+
+    engine = orderBookEngine.OrderBookEngine(adapter, refreshInterval=0.01,
+                                             refreshRate=20, idleTimeout=0.5)
+    response = engine.get_orderbook('USDT-ETH', 'buy')
+    assert (response['success'] == True), "book engine failed: no book"
+    assert (response['book'][0]['Rate'] == 100), "book engine failed: bids not best first"
+    assert (response['index'].total_quantity() == 3), "book engine failed: index does not match the book"
+
+    engine.get_orderbook('USDT-ETH', 'sell')
+    engine.start()
+    time.sleep(1)
+    assert (len(engine.replicas) == 0), "book engine failed: unread books kept"
+
+    # One token to start with, then at most 20 per second
+    assert (len(requests) <= 2 + 1 + 20 * (requests[-1] - requests[2])), "book engine failed: refreshed faster than the refresh rate"
+
+    print ("book engine passed all tests!\n")
+
+# Test that quotes are served from the last good book, marked stale, while
+# the exchange is down
+def stale_fallback_test():
+    print ("Testing stale fallback...")
+
+    # The guard answers a failing request with its last good reply
+    guard = resilience.Guard(('getorderbook',))
+    outage = [False]
+    def fetch():
+        if outage[0]:
+            raise IOError('exchange down')
+        return make_book([(100, 1)])
+    guard.call('getorderbook', 'key', False, fetch)
+    outage[0] = True
+    response = guard.call('getorderbook', 'key', False, fetch)
+    assert (response['success'] == True and response['stale'] == True), "stale fallback failed: guard did not serve the last good reply"
+
+    # The engine serves the replica it holds once the venue fails
+    adapter = FakeAdapter('A', {'buy': [(100, 1), (99, 2)]})
+    def get_orderbook(market, booktype, compact=False):
+        if outage[0]:
+            raise IOError('exchange down')
+        return make_book(adapter.books[booktype])
+    def get_orderbook_depth(market, booktype, quantity):
+        raise IOError('exchange down')
+    adapter.get_orderbook = get_orderbook
+    adapter.get_orderbook_depth = get_orderbook_depth
+
+    outage[0] = False
+    engine = orderBookEngine.OrderBookEngine(adapter, refreshInterval=0.01)
+    router = exchangeRouter.ExchangeRouter(
+        [exchangeRouter.Venue(adapter, engine)])
+    books, missing = router.get_orderbooks('ETH', 'USDT', 'buy')
+    assert (books['A']['stale'] == False), "stale fallback failed: fresh book marked stale"
+
+    outage[0] = True
+    time.sleep(0.05)
+    books, missing = router.get_orderbooks('ETH', 'USDT', 'buy', 0.01)
+    assert (missing == []), "stale fallback failed: venue left out during an outage"
+    assert (books['A']['stale'] == True and books['A']['age'] > 0.01), "stale fallback failed: old book not marked stale"
+    assert (books['A']['book'][0]['Rate'] == 100), "stale fallback failed: wrong book served"
+
+    # The depth fetch falls back to the replica as well
+    engine.start()
+    books, missing = router.get_orderbooks('ETH', 'USDT', 'buy', 0.01, 1)
+    assert (books['A']['stale'] == True), "stale fallback failed: depth fetch not served from the replica"
+
+    # A market never loaded has no book to fall back to
+    books, missing = router.get_orderbooks('LTC', 'BTC', 'buy')
+    assert (missing == ['A']), "stale fallback failed: served a book never loaded"
+    books, missing = router.get_orderbooks('LTC', 'BTC', 'buy', 1e10)
+    assert (missing == ['A']), "stale fallback failed: served a book never loaded with a large max staleness"
+
+    print ("stale fallback passed all tests!\n")
+
+# Test the fill prices and limit rates of a depth index
+def depth_index_test():
+    print ("Testing depth index...")
+
+    index = depthIndex.DepthIndex.from_columns([100, 101, 102], [1, 2, 3])
+    assert (index.total_quantity() == 6), "depth index failed: wrong total quantity"
+    assert (abs(index.fill_price(3) - 302.0 / 3) < 1e-9), "depth index failed: wrong fill price across levels"
+    assert (abs(index.fill_price(0.5) - 100) < 1e-9), "depth index failed: wrong fill price within the best level"
+    assert (abs(index.fill_price(10) - 608.0 / 6) < 1e-9), "depth index failed: wrong fill price past the book"
+    assert (index.fill_price(0) == 0), "depth index failed: fill price of nothing"
+
+    # The limit rate is taken past the level the quantity ends in
+    assert (index.rate(0.5, 'buy') == float('%.8f'%(100 * 1.005))), "depth index failed: wrong buy rate"
+    assert (index.rate(0.5, 'sell') == float('%.8f'%(100 * .995))), "depth index failed: wrong sell rate"
+    assert (index.rate(7, 'buy') is None), "depth index failed: rate on a book too shallow"
+
+    # The vectorised path matches one quantity at a time
+    quantities = [0, 0.5, 1, 2.5, 6, 10]
+    prices = index.fill_prices(quantities)
+    assert (all(abs(price - index.fill_price(quantity)) < 1e-9
+                for price, quantity in zip(prices, quantities))), "depth index failed: fill_prices differs from fill_price"
+
+    # Built from a book in the Bittrex format
+    fromBook = depthIndex.DepthIndex(make_book([(100, 1), (101, 2)])['book'])
+    assert (abs(fromBook.fill_price(3) - 302.0 / 3) < 1e-9), "depth index failed: wrong fill price from a book"
+
+    empty = depthIndex.DepthIndex.from_columns([], [])
+    assert (empty.total_quantity() == 0 and empty.fill_price(1) == 0), "depth index failed: empty book"
+
+    print ("depth index passed all tests!\n")
+
+# Test that the streaming decoder returns the same levels however the response
+# is split into chunks
+def array_decoder_test():
+    print ("Testing array decoder...")
+
+    levels = [{'Quantity': 1.5, 'Rate': 100.25}, {'Quantity': 2, 'Rate': 99},
+              {'Quantity': 0.001, 'Rate': 98.123456789}]
+    data = json.dumps({'success': True, 'message': 'ünïcode',
+                       'result': levels}).encode()
+
+    for chunkSize in (1, 2, 3, 7, 16, len(data)):
+        decoder = serialization.ArrayDecoder('result')
+        items = []
+        for start in range(0, len(data), chunkSize):
+            items.extend(decoder.feed(data[start:start + chunkSize]))
+        assert (items == levels), "array decoder failed: wrong levels in chunks of " + str(chunkSize)
+        assert (decoder.done), "array decoder failed: end of the array not seen"
+
+    # A reply without the array is kept whole to be parsed as an error
+    error = b'{"success": false, "message": "INVALID_MARKET", "result": null}'
+    decoder = serialization.ArrayDecoder('result')
+    assert (decoder.feed(error) == []), "array decoder failed: levels in an error reply"
+    assert (not decoder.inArray and json.loads(decoder.text())['success'] == False), "array decoder failed: error reply not kept"
+
+    print ("array decoder passed all tests!\n")
+
+# Test that the token bucket allows its burst and then waits for tokens
+def token_bucket_test():
+    print ("Testing token bucket...")
+
+    bucket = tokenBucket.TokenBucket(50, 2)
+    assert (bucket.try_acquire() and bucket.try_acquire()), "token bucket failed: burst not allowed"
+    assert (not bucket.try_acquire()), "token bucket failed: more than the burst allowed"
+
+    startTime = time.monotonic()
+    bucket.acquire()
+    waited = time.monotonic() - startTime
+    assert (0.01 <= waited < 0.5), "token bucket failed: did not wait for a token"
+
+    print ("token bucket passed all tests!\n")
+
+# Test that identical calls in flight at once are sent once
+def single_flight_test():
+    print ("Testing single flight...")
+
+    flight = singleFlight.SingleFlight()
+    calls = []
+    release = threading.Event()
+    def fetch():
+        calls.append(1)
+        release.wait()
+        return {'success': True}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do('book', fetch)))
+               for i in range(5)]
+    for thread in threads:
+        thread.start()
+    while flight.get_stats()['sent'] + flight.get_stats()['merged'] < 5:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert (len(calls) == 1), "single flight failed: identical calls sent more than once"
+    assert (results == [{'success': True}] * 5), "single flight failed: result not shared"
+
+    # Errors reach every caller and are never reused
+    def fail():
+        raise ValueError('exchange down')
+    try:
+        flight.do('book', fail)
+        assert False, "single flight failed: error not raised"
+    except ValueError:
+        pass
+
+    # Successful results are reused for the ttl, failed ones are not
+    cached = singleFlight.SingleFlight(ttl=1000)
+    cached.do('ticker', lambda: {'success': True})
+    cached.do('ticker', lambda: {'success': True})
+    cached.do('bad', lambda: {'success': False})
+    cached.do('bad', lambda: {'success': False})
+    assert (cached.get_stats() == {'sent': 3, 'merged': 0, 'reused': 1}), "single flight failed: wrong reuse"
+
+    print ("single flight passed all tests!\n")
+
+# Test that a circuit breaker opens on failures and closes after a trial
+def circuit_breaker_test():
+    print ("Testing circuit breaker...")
+
+    breaker = resilience.CircuitBreaker(errorThreshold=0.5, minRequests=4,
+                                        window=30, openSeconds=0.05)
+    for success in (True, False, True):
+        assert (breaker.allow()), "circuit breaker failed: closed circuit refused a request"
+        breaker.record(success)
+    assert (breaker.get_state() == 'closed'), "circuit breaker failed: opened before minRequests"
+    breaker.record(False)
+    assert (breaker.get_state() == 'open' and not breaker.allow()), "circuit breaker failed: did not open"
+
+    # One trial request once the circuit has been open for openSeconds
+    time.sleep(0.06)
+    assert (breaker.allow()), "circuit breaker failed: no trial request"
+    assert (not breaker.allow()), "circuit breaker failed: more than one trial request"
+    breaker.record(False)
+    assert (breaker.get_state() == 'open'), "circuit breaker failed: failed trial did not reopen"
+
+    time.sleep(0.06)
+    assert (breaker.allow()), "circuit breaker failed: no second trial request"
+    breaker.record(True)
+    assert (breaker.get_state() == 'closed' and breaker.allow()), "circuit breaker failed: successful trial did not close"
+
+    print ("circuit breaker passed all tests!\n")
+
+# Test that reservations hold funds until they are released or settled
+def balance_ledger_test():
+    print ("Testing balance ledger...")
+
+    adapter = FakeAdapter('A', {}, {'USDT': 1000.0, 'ETH': 5.0})
+    ledger = balanceLedger.BalanceLedger(adapter)
+    reservation0 = ledger.reserve('USDT', 600)
+    assert (reservation0 is not None), "balance ledger failed: reservation within the balance refused"
+    assert (ledger.reserve('USDT', 500) is None), "balance ledger failed: reserved more than available"
+    assert (ledger.reserve('BTC', 1) is None), "balance ledger failed: reserved an unknown currency"
+
+    # Released funds can be reserved again
+    ledger.release(reservation0)
+    assert (ledger.available('USDT') == 1000), "balance ledger failed: release did not free the funds"
+
+    # A settled order takes the filled part out of the balance
+    reservation1 = ledger.reserve('ETH', 4)
+    ledger.assign(reservation1, 'order1')
+    ledger.settle({'uuid': 'order1', 'quantity': 4, 'quantityRemaining': 1})
+    assert (ledger.available('ETH') == 2), "balance ledger failed: wrong balance after a partial fill"
+    ledger.settle({'uuid': 'order1', 'quantity': 4, 'quantityRemaining': 1})
+    assert (ledger.available('ETH') == 2), "balance ledger failed: order settled twice"
+
+    print ("balance ledger passed all tests!\n")
+
+def main():
+    print ("Running offline tests...\n")
+
+    depth_index_test()
+    array_decoder_test()
+    token_bucket_test()
+    single_flight_test()
+    circuit_breaker_test()
+    balance_ledger_test()
+    split_order_test()
+    book_engine_test()
+    stale_fallback_test()
+
+    print ("All offline tests passed!")
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,260 @@
+# This file contains the in-process order book engine
+
+import bisect
+import threading
+import time
+
+import depthIndex
+import tokenBucket
+
+'''
+This class is a sorted replica of one side of a market's order book. Levels are
+kept in a sorted list of keys plus a dictionary of rate -> quantity so a single
+level can be inserted, changed or removed without rebuilding the whole book.
+
+Bids ('buy' side) are best when highest and asks ('sell' side) are best when
+lowest, so bid keys are stored negated and both sides sort ascending.
+'''
+class BookReplica:
+    def __init__(self, market, side):
+        self.market = market
+        self.side = side
+        self.sign = -1 if side == 'buy' else 1
+        self.keys = []
+        self.levels = {}
+        self.lastUpdate = 0
+        self.lastRead = time.time()
+        self.lock = threading.Lock()
+
+        # Snapshot in the Bittrex list format and its depth index, both are
+        # rebuilt lazily after changes and shared by every request until then
+        self.book = None
+        self.index = None
+
+    # Replace every level with a full snapshot from the exchange, either in
+    # the list format or a compactBook.CompactBook, taken 'age' seconds ago
+    def load_snapshot(self, levels, age=0.0):
+        if hasattr(levels, 'rates'):
+            newLevels = dict(zip(levels.rates.tolist(),
+                                 levels.quantities.tolist()))
+        else:
+            newLevels = {}
+            for order in levels:
+                newLevels[float(order['Rate'])] = float(order['Quantity'])
+
+        with self.lock:
+            self.levels = newLevels
+            self.keys = sorted(self.sign * rate for rate in newLevels)
+            self.book = None
+            self.index = None
+            self.lastUpdate = time.time() - age
+
+    # Set the quantity resting at a rate, a quantity of 0 removes the level
+    def apply_update(self, rate, quantity):
+        rate = float(rate)
+        quantity = float(quantity)
+        key = self.sign * rate
+
+        with self.lock:
+            if quantity <= 0:
+                if rate in self.levels:
+                    del self.levels[rate]
+                    index = bisect.bisect_left(self.keys, key)
+                    del self.keys[index]
+            else:
+                if rate not in self.levels:
+                    bisect.insort(self.keys, key)
+                self.levels[rate] = quantity
+            self.book = None
+            self.index = None
+            self.lastUpdate = time.time()
+
+    # Seconds since the replica was last updated
+    def age(self):
+        return time.time() - self.lastUpdate
+
+    # Return the levels best first as [{'Quantity': FLOAT, 'Rate': FLOAT}],
+    # the depth index and the age of one snapshot, read under a single lock
+    # so the book and index always describe the same levels
+    def get_snapshot(self):
+        with self.lock:
+            self.lastRead = time.time()
+            if self.book is None:
+                self.book = [{'Quantity': self.levels[self.sign * key],
+                              'Rate': self.sign * key}
+                             for key in self.keys]
+            if self.index is None:
+                rates = [self.sign * key for key in self.keys]
+                quantities = [self.levels[rate] for rate in rates]
+                self.index = depthIndex.DepthIndex.from_columns(rates,
+                                                                quantities)
+            return self.book, self.index, self.lastRead - self.lastUpdate
+
+    # Seconds since the replica was last returned to a caller
+    def idle(self):
+        return time.time() - self.lastRead
+
+'''
+This class keeps a replica of every order book that has been requested and
+keeps it current, so fill price queries can be answered from memory instead of
+one exchange round trip per HTTP request.
+
+By default a background thread re-downloads every subscribed book once every
+'refreshInterval' seconds, sending at most 'refreshRate' requests per second
+between all of them so the exchange's rate limit is not used up by refreshes.
+A book that has not been read for 'idleTimeout' seconds is dropped and no
+longer refreshed, it is subscribed again by the next request for it. A feed (for example a websocket client) can be passed
+to start() instead; it is given the engine and calls load_snapshot() and
+apply_update() as data arrives.
+
+Callers pass the oldest book they will accept as 'maxStaleness' in seconds. A
+replica older than that is refreshed synchronously before it is returned. If
+the exchange fails, the replica already held is returned as it is, marked
+'stale' with its 'age'.
+Callers that only need enough of the book to fill a 'quantity' get a depth
+limited fetch instead (see Wrapper.get_orderbook_depth) and the replica itself
+is left to the background refresh.
+'''
+class OrderBookEngine:
+    def __init__(self, wrapper, refreshInterval=1.0, maxStaleness=2.0,
+                 refreshRate=1.0, idleTimeout=60.0):
+        self.wrapper = wrapper
+        self.refreshInterval = refreshInterval
+        self.maxStaleness = maxStaleness
+        self.idleTimeout = idleTimeout
+        self.refreshBucket = tokenBucket.TokenBucket(refreshRate, 1)
+        self.replicas = {}
+        self.replicasLock = threading.Lock()
+        self.refreshThread = None
+        self.feed = None
+
+    # Start keeping subscribed books current, either by polling or from a feed
+    def start(self, feed=None):
+        if self.refreshThread is not None or self.feed is not None:
+            return
+
+        if feed is not None:
+            self.feed = feed
+            feed.start(self)
+            return
+
+        self.refreshThread = threading.Thread(target=self.refresh_loop,
+                                              daemon=True)
+        self.refreshThread.start()
+
+    # Drop the books nobody reads, then refresh every other book that is
+    # older than the refresh interval, no faster than the refresh rate
+    def refresh_loop(self):
+        while True:
+            self.evict_idle()
+            with self.replicasLock:
+                replicas = list(self.replicas.values())
+
+            for replica in replicas:
+                if replica.age() >= self.refreshInterval and \
+                   replica.idle() < self.idleTimeout:
+                    self.refreshBucket.acquire()
+                    # A failed refresh leaves the old replica in place, it
+                    # will be retried
+                    self.refresh(replica)
+
+            time.sleep(self.refreshInterval)
+
+    # Download a full book and load it into the replica, return False if the
+    # exchange failed or rejected the request
+    def refresh(self, replica):
+        try:
+            response = self.wrapper.get_orderbook(replica.market, replica.side,
+                                                  compact=True)
+        except Exception:
+            return False
+        if response['success'] == True:
+            # A stale book is the wrapper's last good copy, it keeps its age
+            # and never replaces a newer one
+            age = response['age'] if response.get('stale') else 0.0
+            if time.time() - age > replica.lastUpdate:
+                replica.load_snapshot(response['book'], age)
+        return response['success']
+
+    # Return the replica for a market side, creating it if needed
+    def subscribe(self, market, side):
+        with self.replicasLock:
+            replica = self.replicas.get((market, side))
+            if replica is None:
+                replica = BookReplica(market, side)
+                self.replicas[(market, side)] = replica
+            return replica
+
+    # Drop the replicas that have not been read for 'idleTimeout' seconds
+    def evict_idle(self):
+        with self.replicasLock:
+            for key, replica in list(self.replicas.items()):
+                if replica.idle() >= self.idleTimeout:
+                    del self.replicas[key]
+
+    def unsubscribe(self, market, side):
+        with self.replicasLock:
+            self.replicas.pop((market, side), None)
+
+    # Entry points for a pluggable feed
+    def load_snapshot(self, market, side, levels):
+        self.subscribe(market, side).load_snapshot(levels)
+
+    def apply_update(self, market, side, rate, quantity):
+        self.subscribe(market, side).apply_update(rate, quantity)
+
+    '''
+    Return one side of the order book for a market no older than maxStaleness
+    seconds, in the same format as Wrapper.get_orderbook
+    Response:
+    {
+        'success': BOOLEAN,
+        'book': [{
+                    'Quantity': FLOAT
+                    'Rate': FLOAT
+                 }],
+        'index': DepthIndex,
+        'age': FLOAT,
+        'stale': BOOLEAN
+    }
+    'stale' is True when the exchange could not provide a book as recent as
+    maxStaleness and an older one is returned instead.
+    '''
+    def get_orderbook(self, market, side, maxStaleness=None, quantity=None):
+        if maxStaleness is None:
+            maxStaleness = self.maxStaleness
+
+        # A replica never loaded has no book to serve, however old a book the
+        # caller accepts
+        replica = self.subscribe(market, side)
+        if replica.lastUpdate == 0 or replica.age() > maxStaleness:
+            if quantity is not None and self.refreshThread is not None:
+                try:
+                    response = self.wrapper.get_orderbook_depth(market, side,
+                                                                quantity)
+                except Exception:
+                    response = {'success': False}
+                if response['success'] == True:
+                    if not response.get('stale'):
+                        response['stale'] = False
+                        response['age'] = 0.0
+                    # A stale depth fetch only wins over an older replica
+                    if not response.get('stale') or \
+                       response['age'] <= replica.age():
+                        return response
+                refreshed = False
+            else:
+                refreshed = self.refresh(replica)
+
+            if not refreshed and replica.lastUpdate == 0:
+                # Do not keep polling markets the exchange rejects
+                self.unsubscribe(market, side)
+                return {'success': False}
+
+        # Only older than asked for when the exchange is failing
+        book, index, age = replica.get_snapshot()
+        return {'success': True,
+                'book': book,
+                'index': index,
+                'age': age,
+                'stale': age > maxStaleness}
@@ -0,0 +1,231 @@
+# This file contains the scheduler that watches placed orders until they close
+
+import threading
+import time
+import uuid as uuidlib
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+import orderStore
+import tokenBucket
+
+metrics.registry.describe('poller_sweep_seconds',
+                          'Time for one sweep over the orders that are due')
+
+# Orders whose placement was sent but never answered are tracked under a
+# pending uuid starting with this until they are found on the exchange
+UNKNOWN_PREFIX = 'unknown-'
+
+# Return a new pending uuid for an order whose placement went unanswered
+def unknown_uuid():
+    return UNKNOWN_PREFIX + str(uuidlib.uuid4())
+
+'''
+This class replaces the old check_orders loop. Every tracked order has its own
+next poll time: new orders are checked after 'minInterval' seconds and every
+check that finds the order still open doubles its interval up to
+'maxInterval', so fresh orders are noticed quickly while old resting orders
+cost very little.
+
+When at least 'bulkThreshold' orders are due at once a single 'getopenorders'
+call replaces the individual lookups. Only the orders missing from that list
+(the ones that closed) are then fetched one by one to get their fill details.
+
+Lookups run on a bounded worker pool and every exchange call takes a token
+from a token bucket, so a large backlog is spread out to the exchange's rate
+limit instead of tripping it. 'onClosed' is called with the get_order response
+of every order that is no longer open, and the order is only marked closed
+once it returns. An order can therefore be reported twice (after a crash
+between the two) but never lost, so 'onClosed' must tolerate repeats.
+
+The schedule lives in an OrderStore. With a store on disk, orders placed
+before a restart are picked up again as soon as their next poll time passes.
+Several pollers, one per exchange, can share a store: each only polls the
+orders placed on its own exchange.
+
+Child orders of a split order are tracked with the uuid of their parent.
+'onParentClosed' is called with the parent uuid once the last of its children
+is closed, whichever exchange it was on.
+
+An order whose placement timed out may or may not have been placed. It is
+tracked with track_unknown() under a pending uuid (see unknown_uuid()) and,
+when due, looked for among the exchange's open and recent orders with
+Wrapper.find_orders(). 'onUnknown' is called with the pending uuid and the
+uuid of the order found, and the order is then polled as usual under its real
+uuid. If it is not found within 'resolveTimeout' seconds of being sent it was
+never placed: 'onUnknown' is called with None and the order is marked
+'failed'.
+'''
+class OrderPoller:
+    def __init__(self, wrapper, onClosed, store=None, maxWorkers=4,
+                 requestRate=1.0, requestBurst=10, minInterval=1.0,
+                 maxInterval=60.0, bulkThreshold=5, tickInterval=0.5,
+                 onParentClosed=None, onUnknown=None, resolveTimeout=60.0):
+        self.wrapper = wrapper
+        self.exchange = wrapper.name
+        self.onClosed = onClosed
+        self.onParentClosed = onParentClosed
+        self.onUnknown = onUnknown
+        self.resolveTimeout = resolveTimeout
+        self.minInterval = minInterval
+        self.maxInterval = maxInterval
+        self.bulkThreshold = bulkThreshold
+        self.tickInterval = tickInterval
+        self.limiter = tokenBucket.TokenBucket(requestRate, requestBurst)
+        self.executor = ThreadPoolExecutor(max_workers=maxWorkers)
+
+        if store is None:
+            store = orderStore.OrderStore(':memory:')
+        self.store = store
+        self.pollThread = None
+
+    # Start watching an order
+    def track(self, uuid, market=None, side=None, parent=None):
+        self.store.add(uuid, market, side, self.minInterval, self.exchange,
+                       parent)
+
+    # Start looking for an order whose placement went unanswered, 'uuid' is a
+    # pending uuid from unknown_uuid()
+    def track_unknown(self, uuid, market, side, parent, quantity, rate):
+        self.store.add(uuid, market, side, self.minInterval, self.exchange,
+                       parent, quantity, rate)
+
+    # Number of orders currently being watched
+    def size(self):
+        return self.store.open_count(self.exchange)
+
+    # Back off an order that is still open
+    def back_off(self, uuid):
+        interval = self.store.get_interval(uuid)
+        if interval is None:
+            interval = self.minInterval
+        self.store.reschedule(uuid, min(interval * 2, self.maxInterval))
+
+    # Return every order whose poll time has passed
+    def pop_due(self):
+        return self.store.due(exchange=self.exchange)
+
+    def start(self):
+        if self.pollThread is not None:
+            return
+        self.pollThread = threading.Thread(target=self.poll_loop, daemon=True)
+        self.pollThread.start()
+
+    def poll_loop(self):
+        while True:
+            try:
+                self.sweep()
+            except Exception:
+                # Orders stay scheduled, try again on the next tick
+                pass
+            time.sleep(self.tickInterval)
+
+    # Check every order that is due, return the number checked
+    def sweep(self):
+        startTime = time.perf_counter()
+        try:
+            return self.check_due()
+        finally:
+            metrics.registry.observe('poller_sweep_seconds',
+                                     time.perf_counter() - startTime)
+
+    def check_due(self):
+        due = self.pop_due()
+        if not due:
+            return 0
+
+        toLookUp = due
+        if len(due) >= self.bulkThreshold:
+            self.limiter.acquire()
+            try:
+                openOrders = self.wrapper.get_open_orders()
+            except Exception:
+                # Fall back to looking up every due order
+                openOrders = {'success': False}
+            if openOrders['success'] == True:
+                stillOpen = set(openOrders['uuids'])
+                toLookUp = []
+                for uuid in due:
+                    if uuid in stillOpen:
+                        self.back_off(uuid)
+                    else:
+                        toLookUp.append(uuid)
+
+        # Look up the remaining orders on the worker pool and wait for them
+        for future in [self.executor.submit(self.check_order, uuid)
+                       for uuid in toLookUp]:
+            future.result()
+        return len(due)
+
+    # Fetch one order and either report it closed or back it off
+    def check_order(self, uuid):
+        if uuid.startswith(UNKNOWN_PREFIX):
+            return self.resolve_order(uuid)
+
+        self.limiter.acquire()
+        try:
+            orderResponse = self.wrapper.get_order(uuid)
+        except Exception:
+            orderResponse = {'success': False}
+
+        if orderResponse['success'] == True and \
+           orderResponse['isOpen'] == False:
+            # Record the fill before marking the order closed. If recording
+            # fails, or the process stops in between, the order is still open
+            # in the store and is reported again on a later poll.
+            try:
+                self.onClosed(orderResponse)
+            except Exception:
+                self.back_off(uuid)
+                raise
+            closedParent = self.close_order(uuid)
+            if closedParent is not None and self.onParentClosed is not None:
+                self.onParentClosed(closedParent)
+        else:
+            self.back_off(uuid)
+
+    # Look for an order whose placement went unanswered and either move it to
+    # the uuid it was placed with, mark it failed or back it off
+    def resolve_order(self, uuid):
+        order = self.store.get(uuid)
+        if order is None:
+            return
+
+        # One request for the open orders and one for the recent ones
+        self.limiter.acquire(2)
+        try:
+            found = self.wrapper.find_orders(order['market'], order['side'],
+                                             order['quantity'], order['rate'])
+        except Exception:
+            found = {'success': False}
+
+        if found['success'] == True:
+            # An order already tracked belongs to another placement
+            for orderUUID in found['uuids']:
+                if self.store.get(orderUUID) is None:
+                    if self.onUnknown is not None:
+                        self.onUnknown(uuid, orderUUID)
+                    self.store.rename(uuid, orderUUID, self.minInterval)
+                    return
+
+            if time.time() - order['created'] >= self.resolveTimeout:
+                if self.onUnknown is not None:
+                    self.onUnknown(uuid, None)
+                closedParent = self.close_order(uuid, 'failed')
+                if closedParent is not None and \
+                   self.onParentClosed is not None:
+                    self.onParentClosed(closedParent)
+                return
+        self.back_off(uuid)
+
+    # Mark an order closed (or 'status'), return its parent uuid if it was the
+    # last open child of a split order and None otherwise
+    def close_order(self, uuid, status='closed'):
+        order = self.store.get(uuid)
+        parent = order['parent'] if order is not None else None
+        if parent is None:
+            self.store.set_status(uuid, status)
+            return None
+        if self.store.close_child(uuid, parent, status) == 0:
+            return parent
+        return None
@@ -0,0 +1,99 @@
+# This file contains the routine that splits an order across exchanges
+
+import heapq
+
+import restAPIHelpers as helpers
+
+'''
+Split 'quantity' into child orders across the books of several exchanges at
+the least total cost.
+
+'books' maps an exchange name to an orderbook response for the side the
+order takes from, best level first: the asks ('sell' book, lowest rate first)
+for a buy and the bids ('buy' book, highest rate first) for a sell, see
+book_side(). A limit order can only take levels from the top of a book down,
+so the cheapest way to fill is to repeatedly take the best level at the head
+of any book: a k-way merge of the books by rate. Only the levels actually
+used are visited, so deep books cost no more than shallow ones.
+
+Each exchange gets one child order for everything taken from it, with a limit
+rate 0.5% past the deepest level used (as restAPIHelpers.get_rate does) so it
+still fills if the book moves slightly.
+Response:
+{
+    'success': BOOLEAN,
+    'children': [{
+        'exchange': STRING,
+        'quantity': FLOAT,
+        'rate': FLOAT,
+        'averagePrice': FLOAT
+    }],
+    'averagePrice': FLOAT
+}
+'success' is False if all the books together are not deep enough.
+'''
+def split_order(books, quantity, orderType):
+    if quantity <= 0:
+        return {'success': False}
+
+    multiplicationFactor = 1.005 if orderType == 'buy' else .995
+
+    # Asks are best when lowest, bids when highest. The heap pops the lowest
+    # key so bid rates are negated.
+    sign = 1 if book_side(orderType) == 'sell' else -1
+
+    # Read the levels of each book as parallel rate/quantity columns
+    columns = {}
+    for name, orderbookResponse in books.items():
+        index = helpers.get_index(orderbookResponse)
+        if index is not None:
+            columns[name] = (index.rates, index.quantities, index.size)
+        else:
+            book = orderbookResponse['book']
+            columns[name] = ([float(order['Rate']) for order in book],
+                             [float(order['Quantity']) for order in book],
+                             len(book))
+
+    # Heap of the head level of every book, cheapest first
+    heads = []
+    for name, (rates, quantities, size) in columns.items():
+        if size > 0:
+            heads.append((sign * float(rates[0]), name, 0))
+    heapq.heapify(heads)
+
+    filled = {}
+    notional = {}
+    worstRate = {}
+    remaining = quantity
+    while remaining > 0 and heads:
+        key, name, level = heapq.heappop(heads)
+        rates, quantities, size = columns[name]
+        rate = sign * key
+        taken = min(remaining, float(quantities[level]))
+
+        filled[name] = filled.get(name, 0.0) + taken
+        notional[name] = notional.get(name, 0.0) + taken * rate
+        worstRate[name] = rate
+        remaining -= taken
+
+        if level + 1 < size:
+            heapq.heappush(heads, (sign * float(rates[level + 1]), name,
+                                   level + 1))
+
+    if remaining > 1e-12:
+        return {'success': False}
+
+    children = []
+    for name in filled:
+        children.append({'exchange': name,
+                         'quantity': filled[name],
+                         'rate': float('%.8f'%(worstRate[name] * multiplicationFactor)),
+                         'averagePrice': notional[name] / filled[name]})
+    return {'success': True,
+            'children': children,
+            'averagePrice': sum(notional.values()) / quantity}
+
+# Return the side of the book ('buy' or 'sell') an order of 'orderType' takes
+# its levels from, a buy fills against the asks and a sell against the bids
+def book_side(orderType):
+    return 'sell' if orderType == 'buy' else 'buy'
@@ -0,0 +1,393 @@
+# This file contains the durable store of orders being tracked
+
+import sqlite3
+import threading
+import time
+
+'''
+This class stores every placed order in SQLite so open orders survive a
+restart. The database runs in WAL mode, so a write is one append to the log
+and readers never block the writer.
+
+Each row records the order's uuid, exchange, market, side, status ('open' or
+'closed'), current poll interval and next poll time. The child orders of a
+split order share the uuid of their parent order in 'parent'. An order whose
+placement went unanswered also keeps the quantity and rate it was sent with,
+so it can be found on the exchange (see orderPoller.OrderPoller). A partial index
+over the open orders keyed by next poll time means the poller only ever reads
+the orders that are due, and recovering after a restart is the same indexed
+query rather than a scan of every order ever placed.
+
+The funds reserved by each open order (see balanceLedger.BalanceLedger) are
+kept in a second table, so they are reserved again after a restart. When
+several processes share the store (balanceLedger.SharedBalanceLedger) the
+balances are kept in a third table and every reservation is checked and made
+in one transaction, so processes can not reserve the same funds twice. They
+also take the nonces of their signed requests from a counter in the store,
+see next_nonce().
+
+Pass ':memory:' as the filename for a store that is not kept on disk.
+'''
+class OrderStore:
+    def __init__(self, filename):
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(filename, check_same_thread=False,
+                                          isolation_level=None)
+        with self.lock:
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('PRAGMA synchronous=NORMAL')
+            self.connection.execute('''
+                CREATE TABLE IF NOT EXISTS orders (
+                    uuid TEXT PRIMARY KEY,
+                    market TEXT,
+                    side TEXT,
+                    status TEXT NOT NULL,
+                    pollInterval REAL NOT NULL,
+                    nextPoll REAL NOT NULL,
+                    created REAL NOT NULL,
+                    updated REAL NOT NULL)''')
+
+            # Add the columns missing from stores created by older versions
+            columns = [row[1] for row in
+                       self.connection.execute('PRAGMA table_info(orders)')]
+            if 'exchange' not in columns:
+                self.connection.execute('ALTER TABLE orders ADD COLUMN exchange TEXT')
+            if 'parent' not in columns:
+                self.connection.execute('ALTER TABLE orders ADD COLUMN parent TEXT')
+            if 'quantity' not in columns:
+                self.connection.execute('ALTER TABLE orders ADD COLUMN quantity REAL')
+            if 'rate' not in columns:
+                self.connection.execute('ALTER TABLE orders ADD COLUMN rate REAL')
+
+            self.connection.execute('''
+                CREATE INDEX IF NOT EXISTS openOrdersByNextPoll
+                ON orders (nextPoll) WHERE status = 'open' ''')
+            self.connection.execute('''
+                CREATE INDEX IF NOT EXISTS ordersByParent
+                ON orders (parent) WHERE parent IS NOT NULL''')
+            self.connection.execute('''
+                CREATE TABLE IF NOT EXISTS reservations (
+                    uuid TEXT PRIMARY KEY,
+                    exchange TEXT,
+                    currency TEXT NOT NULL,
+                    amount REAL NOT NULL)''')
+
+            # 'assigned' is 0 while a reservation has not been moved to the
+            # uuid of an order yet, see expire_reservations()
+            columns = [row[1] for row in
+                       self.connection.execute('PRAGMA table_info(reservations)')]
+            if 'created' not in columns:
+                self.connection.execute('ALTER TABLE reservations ADD COLUMN created REAL')
+            if 'assigned' not in columns:
+                self.connection.execute('''
+                    ALTER TABLE reservations
+                    ADD COLUMN assigned INTEGER NOT NULL DEFAULT 1''')
+
+            self.connection.execute('''
+                CREATE TABLE IF NOT EXISTS balances (
+                    exchange TEXT NOT NULL,
+                    currency TEXT NOT NULL,
+                    balance REAL NOT NULL,
+                    settlements INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (exchange, currency))''')
+            self.connection.execute('''
+                CREATE TABLE IF NOT EXISTS nonces (
+                    id INTEGER PRIMARY KEY CHECK (id = 0),
+                    nonce INTEGER NOT NULL)''')
+            self.connection.execute('''
+                INSERT OR IGNORE INTO nonces (id, nonce) VALUES (0, 0)''')
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    # Return a nonce greater than every nonce returned before by any process
+    # sharing the store, and no smaller than 'now'
+    def next_nonce(self, now):
+        with self.lock:
+            # fetchall() runs the statement to the end, which commits it
+            return self.connection.execute('''
+                UPDATE nonces SET nonce = MAX(nonce + 1, ?) WHERE id = 0
+                RETURNING nonce''', (now,)).fetchall()[0][0]
+
+    # Start tracking an order, poll it after 'interval' seconds
+    def add(self, uuid, market, side, interval, exchange=None, parent=None,
+            quantity=None, rate=None):
+        now = time.time()
+        with self.lock:
+            self.connection.execute('''
+                INSERT OR REPLACE INTO orders
+                (uuid, exchange, market, side, status, pollInterval, nextPoll,
+                 created, updated, parent, quantity, rate)
+                VALUES (?, ?, ?, ?, 'open', ?, ?, ?, ?, ?, ?, ?)''',
+                (uuid, exchange, market, side, interval, now + interval, now,
+                 now, parent, quantity, rate))
+
+    # Give an open order a new uuid and poll it again after 'interval' seconds
+    def rename(self, uuid, newUUID, interval):
+        now = time.time()
+        with self.lock:
+            self.connection.execute('''
+                UPDATE orders
+                SET uuid = ?, pollInterval = ?, nextPoll = ?, updated = ?
+                WHERE uuid = ? AND status = 'open' ''',
+                (newUUID, interval, now + interval, now, uuid))
+
+    # Set a new poll interval for an open order, starting from now
+    def reschedule(self, uuid, interval):
+        now = time.time()
+        with self.lock:
+            self.connection.execute('''
+                UPDATE orders SET pollInterval = ?, nextPoll = ?, updated = ?
+                WHERE uuid = ? AND status = 'open' ''',
+                (interval, now + interval, now, uuid))
+
+    # Mark an order as no longer open
+    def set_status(self, uuid, status):
+        with self.lock:
+            self.connection.execute('''
+                UPDATE orders SET status = ?, updated = ? WHERE uuid = ?''',
+                (status, time.time(), uuid))
+
+    '''
+    Mark a child order as no longer open and return how many children of its
+    parent are still open. Both happen under one lock, so when several pollers
+    close the last children at once exactly one of them sees 0.
+    '''
+    def close_child(self, uuid, parent, status='closed'):
+        with self.lock:
+            self.connection.execute('''
+                UPDATE orders SET status = ?, updated = ? WHERE uuid = ?''',
+                (status, time.time(), uuid))
+            return self.connection.execute('''
+                SELECT COUNT(*) FROM orders
+                WHERE parent = ? AND status = 'open' ''',
+                (parent,)).fetchone()[0]
+
+    # Return the stored details of every child of a parent order
+    def get_children(self, parent):
+        with self.lock:
+            rows = self.connection.execute('''
+                SELECT uuid FROM orders WHERE parent = ?''',
+                (parent,)).fetchall()
+        return [self.get(row[0]) for row in rows]
+
+    # Return the uuids of open orders whose next poll time has passed,
+    # optionally only the ones on one exchange
+    def due(self, now=None, limit=1000, exchange=None):
+        if now is None:
+            now = time.time()
+        with self.lock:
+            if exchange is None:
+                rows = self.connection.execute('''
+                    SELECT uuid FROM orders
+                    WHERE status = 'open' AND nextPoll <= ?
+                    ORDER BY nextPoll LIMIT ?''', (now, limit)).fetchall()
+            else:
+                rows = self.connection.execute('''
+                    SELECT uuid FROM orders
+                    WHERE status = 'open' AND nextPoll <= ? AND exchange = ?
+                    ORDER BY nextPoll LIMIT ?''',
+                    (now, exchange, limit)).fetchall()
+        return [row[0] for row in rows]
+
+    # Return the poll interval of an order, None if it is not tracked
+    def get_interval(self, uuid):
+        with self.lock:
+            row = self.connection.execute('''
+                SELECT pollInterval FROM orders WHERE uuid = ?''',
+                (uuid,)).fetchone()
+        return None if row is None else row[0]
+
+    '''
+    Return the stored details of an order, None if it is not tracked
+    Response:
+    {
+        'uuid': STRING,
+        'exchange': STRING,
+        'parent': STRING,
+        'market': STRING,
+        'side': STRING,
+        'status': STRING,
+        'pollInterval': FLOAT,
+        'nextPoll': FLOAT,
+        'created': FLOAT,
+        'quantity': FLOAT,
+        'rate': FLOAT
+    }
+    'quantity' and 'rate' are None unless they were given to add().
+    '''
+    def get(self, uuid):
+        with self.lock:
+            row = self.connection.execute('''
+                SELECT uuid, market, side, status, pollInterval, nextPoll,
+                       exchange, parent, created, quantity, rate
+                FROM orders WHERE uuid = ?''', (uuid,)).fetchone()
+        if row is None:
+            return None
+        return {'uuid': row[0], 'market': row[1], 'side': row[2],
+                'status': row[3], 'pollInterval': row[4], 'nextPoll': row[5],
+                'exchange': row[6], 'parent': row[7], 'created': row[8],
+                'quantity': row[9], 'rate': row[10]}
+
+    # Number of orders that are still open, optionally on one exchange
+    def open_count(self, exchange=None):
+        with self.lock:
+            if exchange is None:
+                return self.connection.execute('''
+                    SELECT COUNT(*) FROM orders WHERE status = 'open' ''').fetchone()[0]
+            return self.connection.execute('''
+                SELECT COUNT(*) FROM orders
+                WHERE status = 'open' AND exchange = ?''',
+                (exchange,)).fetchone()[0]
+
+    # Record the funds reserved by an order
+    def add_reservation(self, uuid, exchange, currency, amount):
+        with self.lock:
+            self.connection.execute('''
+                INSERT OR REPLACE INTO reservations
+                (uuid, exchange, currency, amount, created, assigned)
+                VALUES (?, ?, ?, ?, ?, 1)''',
+                (uuid, exchange, currency, amount, time.time()))
+
+    def remove_reservation(self, uuid):
+        with self.lock:
+            self.connection.execute('''
+                DELETE FROM reservations WHERE uuid = ?''', (uuid,))
+
+    # Return (uuid, currency, amount) for every reservation on an exchange
+    def get_reservations(self, exchange):
+        with self.lock:
+            return self.connection.execute('''
+                SELECT uuid, currency, amount FROM reservations
+                WHERE exchange = ?''', (exchange,)).fetchall()
+
+    # Return the (balance, reserved) of a currency, None if it has no balance
+    def get_balance(self, exchange, currency):
+        with self.lock:
+            row = self.connection.execute('''
+                SELECT balance FROM balances
+                WHERE exchange = ? AND currency = ?''',
+                (exchange, currency)).fetchone()
+            if row is None:
+                return None
+            reserved = self.connection.execute('''
+                SELECT COALESCE(SUM(amount), 0) FROM reservations
+                WHERE exchange = ? AND currency = ?''',
+                (exchange, currency)).fetchone()[0]
+        return row[0], reserved
+
+    # Return the number of settlements per currency of an exchange
+    def get_settlements(self, exchange):
+        with self.lock:
+            rows = self.connection.execute('''
+                SELECT currency, settlements FROM balances
+                WHERE exchange = ?''', (exchange,)).fetchall()
+        return dict(rows)
+
+    # Add the balance of a currency that has none yet
+    def add_balance(self, exchange, currency, balance):
+        with self.lock:
+            self.connection.execute('''
+                INSERT OR IGNORE INTO balances (exchange, currency, balance)
+                VALUES (?, ?, ?)''', (exchange, currency, balance))
+
+    '''
+    Store the balances reported by an exchange. 'settlements' is the result of
+    get_settlements() from before the balances were requested, a currency
+    that has settled an order since keeps its balance.
+    '''
+    def load_balances(self, exchange, balances, settlements):
+        with self.lock:
+            self.connection.execute('BEGIN IMMEDIATE')
+            try:
+                for currency, balance in balances.items():
+                    self.connection.execute('''
+                        UPDATE balances SET balance = ?
+                        WHERE exchange = ? AND currency = ? AND settlements = ?''',
+                        (balance, exchange, currency,
+                         settlements.get(currency, 0)))
+                    self.connection.execute('''
+                        INSERT OR IGNORE INTO balances (exchange, currency, balance)
+                        VALUES (?, ?, ?)''', (exchange, currency, balance))
+                self.connection.execute('COMMIT')
+            except Exception:
+                self.connection.execute('ROLLBACK')
+                raise
+
+    '''
+    Reserve 'amount' of a currency if the balance less everything reserved
+    covers it. Returns True/False, or None if the currency has no balance.
+    '''
+    def reserve(self, reservationId, exchange, currency, amount):
+        with self.lock:
+            # Take the write lock first so no other process can reserve in
+            # between the check and the insert
+            self.connection.execute('BEGIN IMMEDIATE')
+            try:
+                row = self.connection.execute('''
+                    SELECT balance FROM balances
+                    WHERE exchange = ? AND currency = ?''',
+                    (exchange, currency)).fetchone()
+                if row is None:
+                    self.connection.execute('ROLLBACK')
+                    return None
+                reserved = self.connection.execute('''
+                    SELECT COALESCE(SUM(amount), 0) FROM reservations
+                    WHERE exchange = ? AND currency = ?''',
+                    (exchange, currency)).fetchone()[0]
+                if row[0] - reserved < amount:
+                    self.connection.execute('ROLLBACK')
+                    return False
+                self.connection.execute('''
+                    INSERT INTO reservations
+                    (uuid, exchange, currency, amount, created, assigned)
+                    VALUES (?, ?, ?, ?, ?, 0)''',
+                    (reservationId, exchange, currency, amount, time.time()))
+                self.connection.execute('COMMIT')
+                return True
+            except Exception:
+                self.connection.execute('ROLLBACK')
+                raise
+
+    # Move a reservation to a new id, the uuid of the order placed with it
+    def rename_reservation(self, uuid, newUUID):
+        with self.lock:
+            self.connection.execute('''
+                UPDATE reservations SET uuid = ?, assigned = 1 WHERE uuid = ?''',
+                (newUUID, uuid))
+
+    '''
+    Remove the reservations of an exchange made before 'createdBefore' that
+    were never assigned to an order, left behind by a process that stopped
+    between reserving and placing. Returns how many were removed.
+    '''
+    def expire_reservations(self, exchange, createdBefore):
+        with self.lock:
+            return self.connection.execute('''
+                DELETE FROM reservations
+                WHERE exchange = ? AND assigned = 0 AND created < ?''',
+                (exchange, createdBefore)).rowcount
+
+    # Remove a reservation and take 'filled' (0 to 1) of it out of the balance
+    def settle_reservation(self, uuid, filled):
+        with self.lock:
+            self.connection.execute('BEGIN IMMEDIATE')
+            try:
+                row = self.connection.execute('''
+                    SELECT exchange, currency, amount FROM reservations
+                    WHERE uuid = ?''', (uuid,)).fetchone()
+                if row is not None:
+                    self.connection.execute('''
+                        DELETE FROM reservations WHERE uuid = ?''', (uuid,))
+                    if filled > 0:
+                        self.connection.execute('''
+                            UPDATE balances
+                            SET balance = balance - ?, settlements = settlements + 1
+                            WHERE exchange = ? AND currency = ?''',
+                            (row[2] * filled, row[0], row[1]))
+                self.connection.execute('COMMIT')
+            except Exception:
+                self.connection.execute('ROLLBACK')
+                raise
@@ -0,0 +1,302 @@
+# This file contains the circuit breakers and hedging around exchange requests
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures import as_completed
+
+# Reply given instead of sending a request while its circuit is open, in the
+# same shape as an error reply from the exchange
+CIRCUIT_OPEN = {'success': False, 'message': 'CIRCUIT_OPEN', 'result': None}
+
+# Default seconds a hedged request waits for a reply, callers waiting on a
+# guarded request (see exchangeRouter.ExchangeRouter) must wait longer to see
+# the stale reply the guard falls back to
+MAX_WAIT = 5.0
+
+'''
+This class is a circuit breaker for one kind of request. It counts the requests
+that failed (raised, for example on a timeout) over the last 'window' seconds;
+once at least 'minRequests' were sent and 'errorThreshold' of them failed the
+circuit opens and allow() returns False for 'openSeconds'. After that one trial
+request is let through: the circuit closes if it succeeds and opens again if it
+fails.
+
+Replies from the exchange that report an error (success False) are answers,
+not failures, and never open the circuit.
+'''
+class CircuitBreaker:
+    def __init__(self, errorThreshold=0.5, minRequests=10, window=30.0,
+                 openSeconds=10.0):
+        self.errorThreshold = errorThreshold
+        self.minRequests = minRequests
+        self.window = window
+        self.openSeconds = openSeconds
+        self.lock = threading.Lock()
+
+        # (time, failed) of every request in the window
+        self.outcomes = deque()
+        self.failures = 0
+        self.state = 'closed'
+        self.openUntil = 0
+
+    # Return True if a request may be sent now
+    def allow(self):
+        with self.lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'half-open' or time.monotonic() < self.openUntil:
+                return False
+
+            # Let one trial request through
+            self.state = 'half-open'
+            return True
+
+    # Record the outcome of a request that allow() let through
+    def record(self, success):
+        with self.lock:
+            now = time.monotonic()
+            if self.state == 'half-open':
+                if success:
+                    self.state = 'closed'
+                    self.outcomes.clear()
+                    self.failures = 0
+                else:
+                    self.open(now)
+                return
+            if self.state == 'open':
+                # Sent before the circuit opened, it changes nothing
+                return
+
+            self.outcomes.append((now, not success))
+            if not success:
+                self.failures += 1
+            while self.outcomes and self.outcomes[0][0] < now - self.window:
+                if self.outcomes.popleft()[1]:
+                    self.failures -= 1
+
+            if len(self.outcomes) >= self.minRequests and \
+               self.failures >= self.errorThreshold * len(self.outcomes):
+                self.open(now)
+
+    # Must hold the lock
+    def open(self, now):
+        self.state = 'open'
+        self.openUntil = now + self.openSeconds
+        self.outcomes.clear()
+        self.failures = 0
+
+    def get_state(self):
+        with self.lock:
+            if self.state == 'open' and time.monotonic() >= self.openUntil:
+                return 'half-open'
+            return self.state
+
+'''
+This class keeps the latency of the last 'samples' requests of one kind and
+returns a percentile of them, recomputed every 'every' samples so reading it
+costs nothing. Returns None until 'minSamples' have been seen.
+'''
+class LatencyTracker:
+    def __init__(self, samples=256, minSamples=20, every=16):
+        self.samples = deque(maxlen=samples)
+        self.minSamples = minSamples
+        self.every = every
+        self.lock = threading.Lock()
+        self.added = 0
+        self.sortedSamples = None
+
+    def add(self, seconds):
+        with self.lock:
+            self.samples.append(seconds)
+            self.added += 1
+            if self.added % self.every == 0 and \
+               len(self.samples) >= self.minSamples:
+                self.sortedSamples = sorted(self.samples)
+
+    def percentile(self, fraction):
+        sortedSamples = self.sortedSamples
+        if sortedSamples is None:
+            return None
+        index = min(len(sortedSamples) - 1, int(fraction * len(sortedSamples)))
+        return sortedSamples[index]
+
+'''
+This class guards the requests a wrapper sends to an exchange:
+
+    - Every command has its own CircuitBreaker. While a circuit is open the
+      request is not sent and CIRCUIT_OPEN is returned at once.
+    - The last successful reply of every command in 'staleCommands' is kept
+      per request. When the circuit of such a request is open, or sending it
+      failed, that reply is returned instead with 'stale' True and its 'age'
+      in seconds, as long as it is no older than 'maxStaleness'.
+    - Requests sent with hedge=True (idempotent public reads only) are sent a
+      second time if the first has not answered after the 'hedgeQuantile'
+      latency of that command, and the first answer wins. At most
+      'maxHedges' hedges are in flight so a slow exchange is not sent twice
+      the load. A hedged request fails after 'maxWait' seconds without a
+      reply, however many retries the transport still has left. Until a
+      command has enough latency samples to know when to hedge, its requests
+      are sent directly on the calling thread.
+
+Timeouts are set per command on the transport, see bittrexWrapper.Transport.
+'''
+class Guard:
+    def __init__(self, staleCommands=(), maxStaleness=300.0,
+                 hedgeQuantile=0.95, minHedgeDelay=0.02, maxHedges=4,
+                 maxWait=MAX_WAIT, hedgeWorkers=32, errorThreshold=0.5, minRequests=10,
+                 window=30.0, openSeconds=10.0):
+        self.staleCommands = frozenset(staleCommands)
+        self.maxStaleness = maxStaleness
+        self.hedgeQuantile = hedgeQuantile
+        self.minHedgeDelay = minHedgeDelay
+        self.maxHedges = maxHedges
+        self.maxWait = maxWait
+        self.breakerSettings = (errorThreshold, minRequests, window,
+                                openSeconds)
+        self.lock = threading.Lock()
+        self.breakers = {}
+        self.latencies = {}
+        self.lastGood = {}
+        self.hedgesInFlight = 0
+        self.executor = ThreadPoolExecutor(max_workers=hedgeWorkers)
+        self.stats = {'rejected': 0, 'stale': 0, 'hedged': 0, 'hedgeWins': 0}
+
+    # Return the breaker and latency tracker of a command, creating them once
+    def get_command(self, command):
+        breaker = self.breakers.get(command)
+        if breaker is None:
+            with self.lock:
+                if command not in self.breakers:
+                    self.latencies[command] = LatencyTracker()
+                    self.breakers[command] = \
+                        CircuitBreaker(*self.breakerSettings)
+                breaker = self.breakers[command]
+        return breaker, self.latencies[command]
+
+    def count(self, stat):
+        with self.lock:
+            self.stats[stat] += 1
+
+    '''
+    Call function(*args) to send 'command'. 'key' identifies the request for
+    its last good reply (None to keep none).
+    '''
+    def call(self, command, key, hedge, function, *args):
+        breaker, latency = self.get_command(command)
+        if not breaker.allow():
+            self.count('rejected')
+            return self.fallback(command, key, None)
+
+        try:
+            if hedge:
+                result = self.hedged(latency, function, args)
+            else:
+                result = self.timed(latency, function, args)
+        except Exception as error:
+            breaker.record(False)
+            return self.fallback(command, key, error)
+        breaker.record(True)
+
+        if key is not None and command in self.staleCommands and \
+           result.get('success') == True:
+            self.lastGood[key] = (time.time(), result)
+        return result
+
+    # Return the last good reply of a request marked as stale, otherwise
+    # raise the error or return CIRCUIT_OPEN
+    def fallback(self, command, key, error):
+        lastGood = None
+        if key is not None and command in self.staleCommands:
+            lastGood = self.lastGood.get(key)
+        if lastGood is not None:
+            age = time.time() - lastGood[0]
+            if age <= self.maxStaleness:
+                self.count('stale')
+                response = dict(lastGood[1])
+                response['stale'] = True
+                response['age'] = age
+                return response
+
+        if error is not None:
+            raise error
+        return dict(CIRCUIT_OPEN)
+
+    # Run a request and record its latency
+    def timed(self, latency, function, args):
+        startTime = time.perf_counter()
+        result = function(*args)
+        latency.add(time.perf_counter() - startTime)
+        return result
+
+    # Send a request, and again if it is slower than usual, return the first
+    # successful reply. Gives up after 'maxWait' seconds, the requests still
+    # running are left to finish in the background.
+    def hedged(self, latency, function, args):
+        delay = latency.percentile(self.hedgeQuantile)
+        if delay is None:
+            return self.timed(latency, function, args)
+
+        deadline = time.monotonic() + self.maxWait
+        first = self.executor.submit(self.timed, latency, function, args)
+        futures = [first]
+        try:
+            return first.result(timeout=min(max(delay, self.minHedgeDelay),
+                                            self.maxWait))
+        except FutureTimeout:
+            pass
+
+        with self.lock:
+            if self.hedgesInFlight < self.maxHedges:
+                self.hedgesInFlight += 1
+                self.stats['hedged'] += 1
+                second = self.executor.submit(self.timed, latency, function,
+                                              args)
+                second.add_done_callback(self.hedge_done)
+                futures.append(second)
+
+        error = None
+        try:
+            for future in as_completed(futures,
+                                       timeout=deadline - time.monotonic()):
+                try:
+                    result = future.result()
+                except Exception as futureError:
+                    error = futureError
+                    continue
+                if future is not first:
+                    self.count('hedgeWins')
+                return result
+        except FutureTimeout:
+            raise FutureTimeout('no reply in {0} seconds'.format(self.maxWait))
+        raise error
+
+    def hedge_done(self, future):
+        with self.lock:
+            self.hedgesInFlight -= 1
+
+    '''
+    Return the counters and the state of every circuit
+    Response:
+    {
+        'rejected': INT,
+        'stale': INT,
+        'hedged': INT,
+        'hedgeWins': INT,
+        'circuits': {COMMAND: 'closed' | 'open' | 'half-open'}
+    }
+    '''
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            breakers = dict(self.breakers)
+        stats['circuits'] = dict((command, breaker.get_state())
+                                 for command, breaker in breakers.items())
+        return stats
+
+    # Number of circuits that are not closed
+    def open_count(self):
+        return sum(1 for breaker in list(self.breakers.values())
+                   if breaker.get_state() != 'closed')
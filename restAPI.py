@@ -1,196 +1,615 @@
 # This file will contain the server that runs and takes GET and POST requests
 # Created by Izak Fritz 04-09-18
 # For the Stably team
-import time
+import atexit
+import os
 import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 
+from flask import Blueprint
 from flask import Flask
-from flask import jsonify
+from flask import Response
+from flask import g
 from flask import request
-from queue import Queue
 
 import bittrexWrapper
+import balanceLedger
+import exchangeRouter
+import fillJournal
+import leaderElection
+import metrics
+import orderBookEngine
+import orderPoller
+import orderStore
+import requestSigner
 import restAPIHelpers as helpers
-
-app = Flask(__name__)
-
-# Thread lock for concurrent requests
-exchangeLock = threading.Lock()
-
-# Order queue to continously check for filled orders
-orderQueue = Queue()
-
-# Declare an instance of a Bittrex wrapper
-wrapper = bittrexWrapper.Wrapper("keys.txt")
-
-# Continously checks for new orders
-@app.before_first_request
-def api_init():
-    def check_orders():
-        while True:
-            # TODO: acquire lock and check orders
-            exchangeLock.acquire()
-
-            # If queue is not empty get all orders and check on them
-            size = orderQueue.qsize()
-            for i in range(0, size):
-                orderUUID = orderQueue.get()
-                orderResponse = wrapper.get_order(orderUUID)
-                # If order is filled, print it out to a file
-                if orderResponse['isOpen'] == False:
-                    fiatTransacted = float('%.2f'%(orderResponse['price'] + orderResponse['commissionPaid']))
-                    helpers.output_to_file("orders.txt",
-                                           orderResponse['type'],
-                                           fiatTransacted,
-                                           orderResponse['timestamp'],
-                                           "Bittrex")
-                else:
-                    # Put the order back on the queue
-                    orderQueue.put(orderUUID)
-
-            exchangeLock.release()
-            time.sleep(10)
-
-    orderThread = threading.Thread(target=check_orders)
-    orderThread.start()
+from serialization import jsonify
+
+# Routes of the api, registered on the app by create_app()
+api = Blueprint('api', __name__)
+
+# No route takes a lock of its own, the wrapper, registry, book engine and
+# balance ledgers are all safe to share between threads. Orders reserve the
+# funds they spend in the ledger of each exchange, which checks and reserves
+# in one atomic step per currency.
+
+# Thread pool used to fetch several order books at once
+quoteExecutor = ThreadPoolExecutor(max_workers=8)
+
+# The objects below are shared by every route. They are built by
+# init_services() when the app is created, so importing this file reads no
+# keys and opens no files or connections.
+wrapper = None
+bookEngine = None
+router = None
+journal = None
+ordersStore = None
+pollers = {}
+ledgers = {}
+leader = None
+
+# Return a function that records an order the poller found closed
+def order_recorder(exchangeName):
+    def record_closed_order(orderResponse):
+        ledgers[exchangeName].settle(orderResponse)
+        fiatTransacted = float('%.2f'%(orderResponse['price'] + orderResponse['commissionPaid']))
+        journal.write(helpers.fill_record(orderResponse['type'],
+                                          fiatTransacted,
+                                          exchangeName,
+                                          orderResponse['timestamp']))
+
+        # The poller marks the order closed once this returns, so wait for
+        # the fill to be on disk. A failed write raises and the poller
+        # reports the order again later.
+        journal.flush()
+    return record_closed_order
+
+# Return the function a poller calls once it knows whether an order whose
+# placement went unanswered was placed, it moves the order's reservation to
+# the uuid found or gives the funds back
+def order_resolver(exchange):
+    def resolve_order(pendingUUID, orderUUID):
+        if orderUUID is None:
+            ledgers[exchange].release(pendingUUID)
+        else:
+            ledgers[exchange].assign(pendingUUID, orderUUID)
+    return resolve_order
+
+# Only one process polls orders, settles them and reconciles balances. Every
+# process can place orders, they only add them to the shared store.
+def start_order_tracking():
+    # Continously check for filled orders
+    for poller in pollers.values():
+        poller.start()
+
+    # Load the balances and keep them reconciled with the exchanges
+    for ledger in ledgers.values():
+        ledger.start()
+
+# Build the wrapper, book engine, router, store, ledgers and pollers
+def init_services():
+    global wrapper, bookEngine, router, journal, ordersStore, leader
+
+    # When running as several worker processes (gunicorn.conf.py sets
+    # EXCHANGE_ROUTER_SHARED_STATE) balances, reservations and request nonces
+    # are kept in the shared store instead of in each process, quotes are
+    # still served from each worker's own book engine
+    sharedState = os.environ.get('EXCHANGE_ROUTER_SHARED_STATE') == '1'
+
+    # Open orders of every exchange are kept in one store on disk, so they are
+    # picked up again after a restart and a split order can be followed across
+    # exchanges
+    ordersStore = orderStore.OrderStore("orders.db")
+
+    # Declare an instance of a Bittrex wrapper, its keys are read on first use
+    # The API url can be pointed at a local mockExchange.py for testing, and
+    # public responses can be reused for BITTREX_COALESCE_MS milliseconds
+    nonces = None
+    if sharedState:
+        nonces = requestSigner.NonceGenerator(ordersStore)
+    wrapper = bittrexWrapper.Wrapper("keys.txt",
+        baseURL=os.environ.get('BITTREX_API_URL', 'https://bittrex.com/api/v1.1/'),
+        coalesceTTL=float(os.environ.get('BITTREX_COALESCE_MS', 0)),
+        nonces=nonces)
+
+    # Local order book replicas, refreshed in the background. Every worker
+    # process refreshes its own replicas, so they split the BOOK_REFRESH_RATE
+    # requests per second the exchange allows for refreshes between them
+    workers = int(os.environ.get('EXCHANGE_ROUTER_WORKERS', 1))
+    bookEngine = orderBookEngine.OrderBookEngine(wrapper,
+        refreshRate=float(os.environ.get('BOOK_REFRESH_RATE', 1)) / workers)
+
+    # Exchanges the router quotes and trades on, add a Venue per exchange
+    router = exchangeRouter.ExchangeRouter([
+        exchangeRouter.Venue(wrapper, bookEngine),
+    ])
+
+    # Filled orders are written to orders.txt by a single background writer,
+    # whatever it still has queued is written when the process exits
+    journal = fillJournal.FillJournal("orders.txt")
+    atexit.register(journal.close)
+
+    # One poller per exchange watches placed orders until they are filled.
+    # One balance ledger per exchange holds the balances and the funds
+    # reserved by open orders, the pollers release them as orders close.
+    pollers.clear()
+    ledgers.clear()
+    for venue in router.venues:
+        if sharedState:
+            ledgers[venue.name] = balanceLedger.SharedBalanceLedger(
+                venue.adapter, ordersStore)
+        else:
+            ledgers[venue.name] = balanceLedger.BalanceLedger(venue.adapter,
+                                                              ordersStore)
+        pollers[venue.name] = orderPoller.OrderPoller(
+            venue.adapter, order_recorder(venue.name), ordersStore,
+            onUnknown=order_resolver(venue.name))
+
+    leader = leaderElection.LeaderElection("orders.lock", start_order_tracking)
+
+metrics.registry.gauge('poller_open_orders',
+                       lambda: sum(poller.size() for poller in pollers.values()),
+                       'Orders the pollers are still watching')
+
+metrics.registry.gauge('exchange_circuits_open',
+                       lambda: sum(venue.adapter.guard.open_count()
+                                   for venue in router.venues
+                                   if hasattr(venue.adapter, 'guard')),
+                       'Exchange commands failing fast after repeated errors')
+
+# Seconds taken by each startup phase of this process, see create_app()
+startupSeconds = {}
+metrics.registry.gauge('startup_seconds',
+                       lambda: sum(startupSeconds.values()),
+                       'Time from creating the app to being ready to serve')
+
+# Get every exchange ready and start the background threads, so the first
+# requests served find the keys loaded, the registries and ticker snapshots
+# filled and connections open
+def warm_up():
+    for venue in router.venues:
+        venue.adapter.warm_up()
+
+    # Become the order tracking process, or wait to take over from it
+    leader.start()
+
+    # Keep the order books that have been requested up to date
+    for venue in router.venues:
+        if venue.bookSource is not None:
+            venue.bookSource.start()
+
+'''
+Build the Flask app and everything it serves. With 'warmUp' (the default) the
+exchanges are warmed up before the app is returned, so a server only starts
+taking requests once it is ready for them. gunicorn loads the app in each
+worker before the worker accepts connections:
+
+    gunicorn -c gunicorn.conf.py "restAPI:create_app()"
+
+'restAPI:app' works too, see __getattr__ below.
+'''
+def create_app(warmUp=True):
+    startTime = time.perf_counter()
+    init_services()
+
+    app = Flask(__name__)
+    app.register_blueprint(api)
+    startupSeconds['create'] = time.perf_counter() - startTime
+
+    if warmUp:
+        startTime = time.perf_counter()
+        warm_up()
+        startupSeconds['warm-up'] = time.perf_counter() - startTime
+    return app
+
+# 'restAPI.app' is created the first time it is used instead of on import
+defaultApp = None
+defaultAppLock = threading.Lock()
+
+def __getattr__(name):
+    global defaultApp
+    if name != 'app':
+        raise AttributeError('module {0} has no attribute {1}'.format(
+            repr(__name__), repr(name)))
+    with defaultAppLock:
+        if defaultApp is None:
+            defaultApp = create_app()
+        return defaultApp
+
+# Time every request, routes call g.timer.mark() at the end of each stage,
+# under the route's own name, without the 'api.' of the blueprint
+@api.before_app_request
+def start_timer():
+    endpoint = request.endpoint or 'unknown'
+    g.timer = metrics.StageTimer(endpoint.split('.')[-1])
+
+# Record the request time, and send the stage breakdown as a Server-Timing
+# header when the client asks for it with 'X-Timing: 1'
+@api.after_app_request
+def finish_timer(response):
+    timer = g.get('timer')
+    if timer is not None:
+        timer.finish()
+        if request.headers.get('X-Timing') == '1':
+            response.headers['Server-Timing'] = timer.header()
+    return response
+
+# App route for the Prometheus metrics
+@api.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(metrics.registry.render(),
+                    mimetype='text/plain; version=0.0.4')
 
 # App route for the 'get-fill-price' api call
-@app.route('/api/v1.0/get-fill-price', methods=['GET'])
+@api.route('/api/v1.0/get-fill-price', methods=['GET'])
 def get_fill_price():
-    # Check that all three arguments are present, and only three are present
+    # Check that all three arguments are present, 'max-staleness' (seconds)
+    # is the only optional argument
     arguments = ['base-currency', 'counter-currency', 'quantity']
-
-    # Acquire exchange lock
-    exchangeLock.acquire()
+    optionalArguments = ['max-staleness']
 
     # Check that the number of arguments are correct
-    if not all(args in arguments for args in request.args) or not len(request.args) == 3:
-        exchangeLock.release()
+    if not all(args in arguments + optionalArguments for args in request.args) or \
+       not all(args in request.args for args in arguments):
         return jsonify({'success': False, 'message': 'invalid arguments'})
 
+    message, maxStaleness = helpers.check_max_staleness(request.args)
+    if message is not None:
+        return jsonify({'success': False, 'message': message})
+
     # Check for valid quantity
     if float(request.args['quantity']) < 0:
-        exchangeLock.release()
         return jsonify({'success': False, 'message': 'invalid quantity'})
 
-    # Check that the market is valid
-    elif not wrapper.is_valid_market(request.args['base-currency'],
-                                     request.args['counter-currency']):
-        exchangeLock.release()
+    # Check that the market is valid on at least one exchange
+    elif not router.is_valid_market(request.args['base-currency'],
+                                    request.args['counter-currency']):
         return jsonify({'success': False, 'message': 'invalid market'})
+    g.timer.mark('validate')
 
-    # Return fill price
+    # Return the best fill price across exchanges
     quantityToFill = float(request.args['quantity'])
-    formattedTicker = wrapper.format_ticker(request.args['base-currency'],
-                                            request.args['counter-currency'])
-    orderbookResponse = wrapper.get_orderbook(formattedTicker, "buy")
+    books, missing = router.get_orderbooks(request.args['base-currency'],
+                                           request.args['counter-currency'],
+                                           "buy", maxStaleness, quantityToFill)
+    g.timer.mark('orderbook')
+
+    quote = router.best_fill_price_from(books, missing, quantityToFill, "buy")
+    g.timer.mark('fill-price')
+    if quote['success'] == False:
+        return jsonify({'success': False, 'message': 'failed to get orderbook'})
+
+    return jsonify({'success': True, 'fill-price': quote['fill-price'],
+                    'exchange': quote['exchange'], 'stale': quote['stale']})
+
+# App route for the 'get-fill-prices' api call, quotes many markets and
+# quantities in one request. The body is a JSON list of objects with the
+# arguments of 'get-fill-price' plus an optional 'side' ('buy' or 'sell')
+@api.route('/api/v1.0/get-fill-prices', methods=['POST'])
+def get_fill_prices():
+    quotes = request.get_json(silent=True)
+    if not isinstance(quotes, list):
+        return jsonify({'success': False, 'message': 'invalid arguments'})
+    if len(quotes) > helpers.MAX_BATCH_QUOTES:
+        return jsonify({'success': False, 'message': 'too many quotes'})
+
+    # Validate every quote and collect the distinct books they need
+    results = [None] * len(quotes)
+    sides = [None] * len(quotes)
+    quantities = [None] * len(quotes)
+    books = {}
+    for i, quote in enumerate(quotes):
+        message, side, quantity = helpers.check_quote(quote)
+        if message is not None:
+            results[i] = {'success': False, 'message': message}
+            continue
+        sides[i] = side
+        quantities[i] = quantity
+
+        if not router.is_valid_market(quote['base-currency'],
+                                      quote['counter-currency']):
+            results[i] = {'success': False, 'message': 'invalid market'}
+            continue
+
+        books[(quote['base-currency'], quote['counter-currency'], side)] = None
+    g.timer.mark('validate')
+
+    # Fetch each distinct book once from every exchange, concurrently
+    futures = {}
+    for key in books:
+        futures[key] = quoteExecutor.submit(router.get_orderbooks, key[0],
+                                            key[1], key[2])
+    for key in futures:
+        books[key] = futures[key].result()
+    g.timer.mark('orderbook')
+
+    # Evaluate every quote against the shared snapshots
+    for i, quote in enumerate(quotes):
+        if results[i] is not None:
+            continue
+
+        side = sides[i]
+        venueBooks, missing = books[(quote['base-currency'],
+                                     quote['counter-currency'], side)]
+        best = router.best_fill_price_from(venueBooks, missing,
+                                           quantities[i], side)
+        if best['success'] == False:
+            results[i] = {'success': False, 'message': 'failed to get orderbook'}
+            continue
+
+        results[i] = {'success': True, 'fill-price': best['fill-price'],
+                      'exchange': best['exchange'], 'stale': best['stale']}
+    g.timer.mark('fill-price')
+
+    return jsonify({'success': True, 'quotes': results})
+
+# Most quantities one 'get-slippage-curve' call can ask for
+MAX_CURVE_POINTS = 10000
+
+# App route for the 'get-slippage-curve' api call, the fill price curve of a
+# market on every exchange for many quantities at once. Quantities are given
+# either as a comma separated list in 'quantities', or as 'points' evenly
+# spaced quantities up to 'max-quantity'. 'side' is the book side ('buy' by
+# default, as in 'get-fill-price').
+@api.route('/api/v1.0/get-slippage-curve', methods=['GET'])
+def get_slippage_curve():
+    arguments = ['base-currency', 'counter-currency']
+    optionalArguments = ['quantities', 'max-quantity', 'points', 'side',
+                         'max-staleness']
+
+    if not all(args in arguments + optionalArguments for args in request.args) or \
+       not all(args in request.args for args in arguments):
+        return jsonify({'success': False, 'message': 'invalid arguments'})
 
-    avgPrice = helpers.get_average_fill_price(orderbookResponse, quantityToFill)
+    message, maxStaleness = helpers.check_max_staleness(request.args)
+    if message is not None:
+        return jsonify({'success': False, 'message': message})
+
+    # Build the list of quantities, 'points' is checked before the list is
+    # built so a huge value is not materialised
+    try:
+        if 'quantities' in request.args:
+            quantities = [float(quantity) for quantity in
+                          request.args['quantities'].split(',')]
+        elif 'max-quantity' in request.args and 'points' in request.args:
+            maxQuantity = float(request.args['max-quantity'])
+            points = int(request.args['points'])
+            if not 0 < points <= MAX_CURVE_POINTS:
+                return jsonify({'success': False, 'message': 'invalid quantity'})
+            quantities = [maxQuantity * (i + 1) / points for i in range(points)]
+        else:
+            return jsonify({'success': False, 'message': 'invalid arguments'})
+    except ValueError:
+        return jsonify({'success': False, 'message': 'invalid quantity'})
+    if not quantities or len(quantities) > MAX_CURVE_POINTS or \
+       not all(0 <= quantity < float('inf') for quantity in quantities):
+        return jsonify({'success': False, 'message': 'invalid quantity'})
 
-    # Release lock and return
-    exchangeLock.release()
-    return jsonify({'success': True, 'fill-price': avgPrice})
+    side = request.args.get('side', 'buy')
+    if not (side == 'buy' or side == 'sell'):
+        return jsonify({'success': False, 'message': 'invalid side'})
+
+    if not router.is_valid_market(request.args['base-currency'],
+                                  request.args['counter-currency']):
+        return jsonify({'success': False, 'message': 'invalid market'})
+    g.timer.mark('validate')
+
+    # One snapshot of the book per exchange, deep enough for every quantity
+    books, missing = router.get_orderbooks(request.args['base-currency'],
+                                           request.args['counter-currency'],
+                                           side, maxStaleness, max(quantities))
+    g.timer.mark('orderbook')
+    if not books:
+        return jsonify({'success': False, 'message': 'failed to get orderbook'})
+
+    curves = {}
+    for name, orderbookResponse in books.items():
+        curves[name] = helpers.get_slippage_curve(orderbookResponse,
+                                                  quantities, side)
+    g.timer.mark('curve')
+
+    return jsonify({'success': True, 'curves': curves, 'missing': missing})
+
+# App route for the 'tickers' api call, the bid, ask, last price and volume of
+# every market (or only 'market') from the ticker snapshot
+@api.route('/api/v1.0/tickers', methods=['GET'])
+def get_tickers():
+    arguments = ['market']
+
+    if not all(args in arguments for args in request.args):
+        return jsonify({'success': False, 'message': 'invalid arguments'})
+
+    tickerResponse = wrapper.get_tickers()
+    g.timer.mark('tickers')
+    if tickerResponse['success'] == False:
+        return jsonify({'success': False, 'message': 'failed to get tickers'})
+
+    table = tickerResponse['tickers']
+    if 'market' in request.args:
+        if request.args['market'] not in table:
+            return jsonify({'success': False, 'message': 'invalid market'})
+        tickers = {request.args['market']: dict(table[request.args['market']])}
+    else:
+        tickers = dict((market, dict(ticker)) for market, ticker in table.items())
+
+    return jsonify({'success': True, 'tickers': tickers,
+                    'age': tickerResponse['age']})
 
 # App route for the 'get-currency-balance' api call
-@app.route('/api/v1.0/get-currency-balance', methods=['GET'])
+@api.route('/api/v1.0/get-currency-balance', methods=['GET'])
 def get_currency_balance():
     arguments = ['currency']
 
-    # Acquire exchange lock
-    exchangeLock.acquire()
-
     # Check that the argument currency is present, and that it is the only arg
     if not all(args in arguments for args in request.args) or not len(request.args) == 1:
         # Invalid arguments
-        exchangeLock.release()
         return jsonify({'success': False, 'message': 'invalid arguments'})
 
     # Check for valid currency
     if not wrapper.is_valid_currency(request.args['currency']):
-        exchangeLock.release()
         return jsonify({'success': False, 'message': 'invalid currency'})
+    g.timer.mark('validate')
 
     # Get currency balance from Bittrex
     balance = wrapper.get_balance(request.args['currency'])['balance']
+    g.timer.mark('balance')
 
-    # Release lock and return
-    exchangeLock.release()
     return jsonify({'success': True, 'balance': balance})
 
 # App route for the 'send-order' api call
-@app.route('/api/v1.0/send-order', methods=['POST'])
+@api.route('/api/v1.0/send-order', methods=['POST'])
 def send_order():
     arguments = ['base-currency', 'counter-currency', 'order-type', 'amount']
 
-    # Acquire exchange lock
-    exchangeLock.acquire()
-
     # Check that all four arguments are present, and only three are present
     if not all(args in arguments for args in request.form) or not len(request.form) == 4:
-        exchangeLock.release()
         return jsonify({'success': False, 'message': 'invalid arguments'})
 
-    # Check for valid amount
-    if float(request.form['amount']) < 0:
-        exchangeLock.release()
+    # Check for valid amount, an order of nothing (or nan) has no child orders
+    try:
+        quantity = float(request.form['amount'])
+    except ValueError:
+        return jsonify({'success': False, 'message': 'invalid amount'})
+    if not 0 < quantity < float('inf'):
         return jsonify({'success': False, 'message': 'invalid amount'})
 
     # Check for valid market
-    if not wrapper.is_valid_market(request.form['base-currency'],
-                                   request.form['counter-currency']):
-        exchangeLock.release()
+    if not router.is_valid_market(request.form['base-currency'],
+                                  request.form['counter-currency']):
         return jsonify({'success': False, 'message': 'invalid market'})
 
     # Check for valid order-type
     if not (request.form['order-type'] == 'buy' or request.form['order-type'] == 'sell'):
-        exchangeLock.release()
         return jsonify({'success': False, 'message': 'invalid order-type'})
-
-    # Get rate to send order at
-    quantity = float(request.form['amount'])
-    formattedTicker = wrapper.format_ticker(request.form['base-currency'],
-                                            request.form['counter-currency'])
-    orderbookResponse = wrapper.get_orderbook(formattedTicker, request.form['order-type'])
-    orderRate = helpers.get_rate(orderbookResponse, quantity, request.form['order-type'])
-
-    # Check that availble balance is high enough
-    if request.form['order-type'] == 'buy':
-        balance = wrapper.get_balance(request.form['counter-currency'])['balance']
-        # Check that balance of counter-currency * rate is greater than quantity needed
-        if balance * orderRate < quantity:
-            exchangeLock.release()
-            return jsonify({'success': False, 'message': 'insufficient balance'})
+    g.timer.mark('validate')
+
+    # Split the order across the best levels of every exchange's book
+    orderType = request.form['order-type']
+    split = router.split_order(request.form['base-currency'],
+                               request.form['counter-currency'],
+                               quantity, orderType)
+    g.timer.mark('orderbook')
+    if split['success'] == False:
+        return jsonify({'success': False, 'message': 'failed to get orderbook'})
+    children = split['children']
+
+    # The currency this order spends, only orders spending the same currency
+    # need to wait for each other
+    if orderType == 'buy':
+        spentCurrency = request.form['counter-currency']
     else:
-        balance = wrapper.get_balance(request.form['base-currency'])['balance']
-        # Check that balance is greater than quantity to sell
-        if balance < quantity:
-            exchangeLock.release()
+        spentCurrency = request.form['base-currency']
+
+    # Reserve the funds of every child order, each reservation only succeeds
+    # if the available balance on that exchange covers it
+    reservations = []
+    for child in children:
+        if orderType == 'buy':
+            # A buy spends quantity * rate of the counter-currency, plus the
+            # exchange's commission on it
+            required = child['quantity'] * child['rate'] * \
+                (1 + child['venue'].adapter.takerFee)
+        else:
+            # Check that balance is greater than quantity to sell
+            required = child['quantity']
+        reservationId = ledgers[child['exchange']].reserve(spentCurrency,
+                                                           required)
+        if reservationId is None:
+            for reserved, reservedId in zip(children, reservations):
+                ledgers[reserved['exchange']].release(reservedId)
             return jsonify({'success': False, 'message': 'insufficient balance'})
-
-    # All checks passed, place order
-    if request.form['order-type'] == 'buy':
-        apiResponse = wrapper.buy_limit(formattedTicker, quantity, orderRate)
-        # If order was successful add order to orderQueue and return
-        if apiResponse['success'] == True:
-            orderQueue.put(apiResponse['uuid'])
-            exchangeLock.release()
-            return jsonify({'success': True, 'message': 'order placed'})
+        reservations.append(reservationId)
+    g.timer.mark('balance')
+
+    # All checks passed, place the child orders at once
+    placed = []
+    for child in children:
+        exchange = child['venue'].adapter
+        if orderType == 'buy':
+            placeOrder = exchange.buy_limit
         else:
-            # Buy request failed
-            exchangeLock.release()
-            return jsonify({'success': False, 'message': 'failed to place order'})
-    else:
-        apiResponse = wrapper.sell_limit(formattedTicker, quantity, orderRate)
-        # If order was successful add order to orderQueue and return
+            placeOrder = exchange.sell_limit
+        placed.append(quoteExecutor.submit(placeOrder, child['market'],
+                                           child['quantity'], child['rate']))
+    apiResponses = []
+    for future in placed:
+        try:
+            apiResponses.append(future.result())
+        except Exception:
+            apiResponses.append({'success': False, 'unknown': False})
+    g.timer.mark('place')
+
+    # Watch every child that was placed as part of one parent order
+    orderId = str(uuid.uuid4())
+    childResults = []
+    for child, apiResponse, reservationId in zip(children, apiResponses,
+                                                 reservations):
         if apiResponse['success'] == True:
-            # Add order uuid to the orderQueue
-            orderQueue.put(apiResponse['uuid'])
-            exchangeLock.release()
-            return jsonify({'success': False, 'message': 'failed to place order'})
+            ledgers[child['exchange']].assign(reservationId,
+                                              apiResponse['uuid'])
+            pollers[child['exchange']].track(apiResponse['uuid'],
+                                             child['market'], orderType,
+                                             orderId)
+        elif apiResponse.get('unknown'):
+            # The order may have been placed, keep its funds reserved until
+            # the poller finds it on the exchange or gives up on it
+            pendingUUID = orderPoller.unknown_uuid()
+            ledgers[child['exchange']].assign(reservationId, pendingUUID)
+            pollers[child['exchange']].track_unknown(pendingUUID,
+                                                     child['market'],
+                                                     orderType, orderId,
+                                                     child['quantity'],
+                                                     child['rate'])
         else:
-            # Sell request failed
-            exchangeLock.release()
-            return jsonify({'success': True, 'message': 'order placed'})
+            ledgers[child['exchange']].release(reservationId)
+        childResults.append({'exchange': child['exchange'],
+                             'quantity': child['quantity'],
+                             'rate': child['rate'],
+                             'success': apiResponse['success'],
+                             'unknown': bool(apiResponse.get('unknown'))})
+
+    if any(apiResponse.get('unknown') for apiResponse in apiResponses):
+        # Follow the order with get-order-status, children that were never
+        # placed end up 'failed'
+        return jsonify({'success': False, 'message': 'order outcome unknown',
+                        'order-id': orderId,
+                        'children': childResults})
+    elif all(apiResponse['success'] == True for apiResponse in apiResponses):
+        return jsonify({'success': True, 'message': 'order placed',
+                        'order-id': orderId,
+                        'exchange': children[0]['exchange'],
+                        'children': childResults})
+    elif any(apiResponse['success'] == True for apiResponse in apiResponses):
+        # Some child orders were placed, report which so they can be handled
+        return jsonify({'success': False, 'message': 'order partially placed',
+                        'order-id': orderId,
+                        'children': childResults})
+    else:
+        # Order request failed
+        return jsonify({'success': False, 'message': 'failed to place order'})
+
+# App route for the 'get-order-status' api call
+@api.route('/api/v1.0/get-order-status', methods=['GET'])
+def get_order_status():
+    arguments = ['order-id']
+
+    # Check that order-id is present, and that it is the only arg
+    if not all(args in arguments for args in request.args) or not len(request.args) == 1:
+        return jsonify({'success': False, 'message': 'invalid arguments'})
+
+    children = ordersStore.get_children(request.args['order-id'])
+    if not children:
+        return jsonify({'success': False, 'message': 'unknown order'})
+
+    isOpen = any(child['status'] == 'open' for child in children)
+    return jsonify({'success': True,
+                    'status': 'open' if isOpen else 'closed',
+                    'children': [{'uuid': child['uuid'],
+                                  'exchange': child['exchange'],
+                                  'status': child['status']}
+                                 for child in children]})
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0')
+    create_app().run(host='0.0.0.0')
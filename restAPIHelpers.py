@@ -5,23 +5,104 @@
 import json
 import time
 
+import depthIndex
+
+# Most quotes one 'get-fill-prices' call can ask for
+MAX_BATCH_QUOTES = 1000
+
 # Define functions below:
 
-# Take the order information and output to file in json format
-def output_to_file(file, type, fiatTransacted, exchange, timestamp):
-    data = {'type': type, 
+'''
+Check one entry of a 'get-fill-prices' body. Entries are decoded from JSON so
+any value can have any type.
+Response:
+(
+    STRING,     error message, None if the quote is valid
+    STRING,     side, 'buy' unless given
+    FLOAT       quantity
+)
+'''
+def check_quote(quote):
+    arguments = ['base-currency', 'counter-currency', 'quantity']
+    optionalArguments = ['side']
+
+    if not isinstance(quote, dict) or \
+       not all(args in arguments + optionalArguments for args in quote) or \
+       not all(args in quote for args in arguments):
+        return 'invalid arguments', None, None
+
+    if not isinstance(quote['base-currency'], str) or \
+       not isinstance(quote['counter-currency'], str):
+        return 'invalid market', None, None
+
+    side = quote.get('side', 'buy')
+    if not (side == 'buy' or side == 'sell'):
+        return 'invalid side', None, None
+
+    # float() takes numbers and numeric strings, not null or true/false
+    if isinstance(quote['quantity'], bool):
+        return 'invalid quantity', None, None
+    try:
+        quantity = float(quote['quantity'])
+    except (TypeError, ValueError):
+        return 'invalid quantity', None, None
+    if not 0 <= quantity < float('inf'):
+        return 'invalid quantity', None, None
+
+    return None, side, quantity
+
+'''
+Parse the optional 'max-staleness' argument of a request, the oldest book in
+seconds a quote may use.
+Response: (
+    STRING,     error message, None if the argument is valid or not given
+    FLOAT       max staleness, None if not given
+)
+'''
+def check_max_staleness(args):
+    if 'max-staleness' not in args:
+        return None, None
+    try:
+        maxStaleness = float(args['max-staleness'])
+    except (TypeError, ValueError):
+        return 'invalid arguments', None
+    if not 0 <= maxStaleness < float('inf'):
+        return 'invalid arguments', None
+    return None, maxStaleness
+
+# Build the record written for a filled order
+def fill_record(type, fiatTransacted, exchange, timestamp):
+    return {'type': type,
             'fiatTransacted': fiatTransacted,
             'timestamp': timestamp,
             'exchange': exchange}
 
+# Take the order information and output to file in json format
+def output_to_file(file, type, fiatTransacted, exchange, timestamp):
+    data = fill_record(type, fiatTransacted, exchange, timestamp)
+
     openFile = open(file, 'a')
     json.dump(data, openFile)
     openFile.write("\n")
     openFile.close()
 
+# Return the depth index of a response, None if it has none. Compact books
+# (Wrapper.get_orderbook(..., compact=True)) always carry one.
+def get_index(requestResponse):
+    index = requestResponse.get('index')
+    if index is None and hasattr(requestResponse['book'], 'get_index'):
+        index = requestResponse['book'].get_index()
+    return index
+
 # Function to get average fill price based on a Bittrex book
-# Requires a Bittrex API respose for getorderbook
+# Requires a Bittrex API respose for getorderbook, if the response carries a
+# prebuilt depth 'index' or a compact book the answer comes from a binary
+# search instead
 def get_average_fill_price(requestResponse, quantity):
+    index = get_index(requestResponse)
+    if index is not None:
+        return index.fill_price(quantity)
+
     quantityToFill = quantity
     avgPrice = 0
     sumFilled = 0
@@ -45,11 +126,30 @@ def get_average_fill_price(requestResponse, quantity):
 
     return avgPrice
 
+# Function to get the fill price, worst price, limit rate and slippage for a
+# list of quantities at once, see depthIndex.DepthIndex.slippage_curve
+def get_slippage_curve(requestResponse, quantities, marketSide):
+    index = get_index(requestResponse)
+    if index is None:
+        index = depthIndex.DepthIndex(requestResponse['book'])
+    return index.slippage_curve(quantities, marketSide)
+
+# Function to get the total quantity on one side of a book
+def get_book_depth(requestResponse):
+    index = get_index(requestResponse)
+    if index is not None:
+        return index.total_quantity()
+    return sum(float(order['Quantity']) for order in requestResponse['book'])
+
 # Function to calculate what our ask price should be for a sell and what our
 # bid price should be for a buy. Due to the nature of limit orders, if we place
 # an ask lower than the highest bid, we will get filled at that bid price.
 # Therefore we place a bid/ask deep enough into the book to get fulled filled.
 def get_rate(requestResponse, quantity, marketSide):
+    index = get_index(requestResponse)
+    if index is not None:
+        return index.rate(quantity, marketSide)
+
     multiplicationFactor = 1.005 if marketSide == 'buy' else .995
     quantityToFill = quantity
     sumFilled = 0
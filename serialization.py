@@ -0,0 +1,173 @@
+# This file contains the JSON encoding and decoding used for exchange replies
+# and API responses
+
+import codecs
+import json
+import re
+
+from flask import Response
+
+# Fast JSON libraries are optional, the fastest one installed is used and the
+# standard library otherwise
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+# Return the names of the backends that can be used, fastest first
+def available_backends():
+    backends = []
+    if orjson is not None:
+        backends.append('orjson')
+    if ujson is not None:
+        backends.append('ujson')
+    backends.append('json')
+    return backends
+
+# The backend in use, see set_backend()
+backend = available_backends()[0]
+
+# Choose the backend used by loads() and dumps()
+def set_backend(name):
+    global backend
+    if name not in available_backends():
+        raise ValueError('JSON backend not installed: ' + str(name))
+    backend = name
+
+'''
+Decode a JSON document given as bytes or str.
+
+'objectHook' works as in json.loads: it is called with every decoded object,
+innermost first, and its return value is used in place of the object. The fast
+backends have no hooks, so with one of them the document is decoded first and
+the hook is applied to the result in the same order.
+'''
+def loads(data, objectHook=None):
+    if backend == 'orjson':
+        obj = orjson.loads(data)
+    elif backend == 'ujson':
+        obj = ujson.loads(data)
+    else:
+        return json.loads(data, object_hook=objectHook)
+
+    if objectHook is not None:
+        obj = apply_hook(obj, objectHook)
+    return obj
+
+# Apply an object_hook to a decoded document, innermost objects first
+def apply_hook(obj, objectHook):
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            if isinstance(value, (dict, list)):
+                obj[key] = apply_hook(value, objectHook)
+        return objectHook(obj)
+    if isinstance(obj, list):
+        for i, value in enumerate(obj):
+            if isinstance(value, (dict, list)):
+                obj[i] = apply_hook(value, objectHook)
+    return obj
+
+# Encode an object as JSON bytes, NumPy scalars are encoded as numbers
+def dumps(obj):
+    if backend == 'orjson':
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+    if backend == 'ujson':
+        return ujson.dumps(obj).encode('utf-8')
+    return json.dumps(obj, default=to_builtin).encode('utf-8')
+
+# Same as dumps(), as a str
+def dumps_text(obj):
+    return dumps(obj).decode('utf-8')
+
+# Convert values the standard library can not encode
+def to_builtin(value):
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    raise TypeError(repr(value) + ' is not JSON serializable')
+
+# Drop in replacement for flask.jsonify that encodes with the fast backend
+def jsonify(obj):
+    return Response(dumps(obj), mimetype='application/json')
+
+'''
+This class decodes the items of one array in a JSON document as the document
+arrives, so a reader can stop once it has read as many items as it needs
+instead of receiving and decoding the whole document.
+
+Chunks of bytes are passed to feed(), which returns the items of the array
+under 'key' that were completed by that chunk. 'done' is True once the closing
+bracket has been read. If the document has no such array (for example a failed
+API call with 'result': null) no items are returned and text() holds
+everything fed so far so it can be decoded in full.
+
+Usage:
+    decoder = ArrayDecoder('result')
+    for chunk in response.iter_content(16384):
+        for level in decoder.feed(chunk):
+            ...
+        if decoder.done:
+            break
+'''
+class ArrayDecoder:
+    def __init__(self, key='result', objectHook=None):
+        self.start = re.compile(r'"' + re.escape(key) + r'"\s*:\s*\[')
+        self.textDecoder = codecs.getincrementaldecoder('utf-8')()
+        self.jsonDecoder = json.JSONDecoder(object_hook=objectHook)
+        self.buffer = ''
+        self.position = 0
+        self.inArray = False
+        self.done = False
+        self.bytesRead = 0
+
+    # Everything fed so far, while the array has not been found
+    def text(self):
+        return self.buffer
+
+    def feed(self, chunk):
+        self.bytesRead += len(chunk)
+        self.buffer += self.textDecoder.decode(chunk)
+        items = []
+        if self.done:
+            return items
+
+        if not self.inArray:
+            match = self.start.search(self.buffer)
+            if match is None:
+                return items
+            self.inArray = True
+            self.position = match.end()
+
+        buffer = self.buffer
+        while True:
+            # Skip to the start of the next item
+            position = self.position
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if position >= len(buffer):
+                break
+            if buffer[position] == ']':
+                self.done = True
+                position += 1
+                self.position = position
+                break
+
+            try:
+                item, end = self.jsonDecoder.raw_decode(buffer, position)
+            except ValueError:
+                # The item is not complete yet
+                break
+            if end >= len(buffer) and not isinstance(item, (dict, list, tuple)):
+                # A number or literal may continue in the next chunk
+                break
+            items.append(item)
+            self.position = end
+
+        # Drop the text that has been decoded
+        self.buffer = buffer[self.position:]
+        self.position = 0
+        return items
@@ -0,0 +1,86 @@
+# This file contains the layer that merges identical concurrent requests
+
+import threading
+import time
+
+'''
+This class makes sure only one call for a given key is in flight at a time.
+The first caller for a key runs the function, every caller that arrives while
+it is running waits for it and gets the same result (or the same exception).
+
+With 'ttl' (milliseconds) above 0 a result is also reused for callers that
+arrive within 'ttl' of it finishing, so a burst that arrives just after a call
+completes does not start another one. Only successful results are kept.
+
+Results are shared between callers and must not be modified. get_stats()
+returns how many calls were sent, merged into a call in flight, or reused.
+
+Usage:
+    flight = SingleFlight(ttl=250)
+    response = flight.do(('getorderbook', 'ETH-USDT'), fetch)
+'''
+class SingleFlight:
+    def __init__(self, ttl=0):
+        self.ttl = ttl / 1000.0
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.results = {}
+        self.stats = {'sent': 0, 'merged': 0, 'reused': 0}
+
+    def do(self, key, function, *args):
+        with self.lock:
+            # Reuse a recent result
+            if self.ttl > 0:
+                cached = self.results.get(key)
+                if cached is not None:
+                    if cached[0] > time.monotonic():
+                        self.stats['reused'] += 1
+                        return cached[1]
+                    del self.results[key]
+
+            # Join a call that is already in flight
+            call = self.calls.get(key)
+            if call is not None:
+                self.stats['merged'] += 1
+                leader = False
+            else:
+                self.stats['sent'] += 1
+                leader = True
+                call = Call()
+                self.calls[key] = call
+
+        if not leader:
+            return call.wait()
+
+        try:
+            call.result = function(*args)
+        except BaseException as error:
+            call.error = error
+        with self.lock:
+            del self.calls[key]
+            if self.ttl > 0 and call.error is None and \
+               is_success(call.result):
+                self.results[key] = (time.monotonic() + self.ttl, call.result)
+        call.done.set()
+        return call.wait()
+
+    def get_stats(self):
+        with self.lock:
+            return dict(self.stats)
+
+# One call in flight, shared by everyone waiting on the same key
+class Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+    def wait(self):
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+# Failed API responses are never reused
+def is_success(result):
+    return not isinstance(result, dict) or result.get('success') == True
@@ -0,0 +1,117 @@
+# This file contains the in-memory snapshot of every market's ticker
+
+import threading
+import time
+from types import MappingProxyType
+
+'''
+This class keeps the bid, ask, last price and volume of every market in memory.
+The whole table is loaded with one 'getmarketsummaries' call and refreshed by
+a background thread every 'interval' seconds, so any number of ticker lookups
+cost one exchange request per interval.
+
+Each refresh builds a new table and swaps it in with a single assignment. The
+table and its rows are read-only views, so readers never take a lock and never
+see a table that is half updated.
+
+If the snapshot has never loaded successfully the lookups return None so the
+caller can fall back to asking the exchange directly.
+'''
+class TickerSnapshot:
+    def __init__(self, wrapper, interval=5.0, retryInterval=1.0):
+        self.wrapper = wrapper
+        self.interval = interval
+        self.retryInterval = retryInterval
+        self.table = None
+        self.lastRefresh = 0
+        self.refreshLock = threading.Lock()
+        self.startLock = threading.Lock()
+        self.refreshThread = None
+
+    # Download every market summary and swap in the new table
+    def refresh(self):
+        with self.refreshLock:
+            response = self.wrapper.process_command('getmarketsummaries',
+                                                    'public')
+            return self.load(response)
+
+    # Build the table from a 'getmarketsummaries' API response
+    def load(self, summaryResponse):
+        if not summaryResponse['success']:
+            return False
+
+        table = {}
+        for summary in summaryResponse['result']:
+            table[summary['MarketName']] = MappingProxyType({
+                'bid': to_float(summary.get('Bid')),
+                'ask': to_float(summary.get('Ask')),
+                'last': to_float(summary.get('Last')),
+                'volume': to_float(summary.get('Volume')),
+                'baseVolume': to_float(summary.get('BaseVolume'))})
+
+        # Assigning the new table is atomic, readers never need the lock
+        self.table = MappingProxyType(table)
+        self.lastRefresh = time.time()
+        return True
+
+    # Load the table once and start refreshing it in the background
+    def start(self):
+        # Cheap check first so lookups do not contend on the lock
+        if self.refreshThread is not None:
+            return
+
+        with self.startLock:
+            if self.refreshThread is not None:
+                return
+
+            try:
+                self.refresh()
+            except Exception:
+                pass
+
+            self.refreshThread = threading.Thread(target=self.refresh_loop,
+                                                  daemon=True)
+            self.refreshThread.start()
+
+    # Refresh every interval, retry sooner while nothing has been loaded
+    def refresh_loop(self):
+        while True:
+            if self.table is None:
+                time.sleep(min(self.interval, self.retryInterval))
+            else:
+                time.sleep(self.interval)
+
+            try:
+                self.refresh()
+            except Exception:
+                # Keep serving the last good table, try again next time
+                pass
+
+    # Seconds since the table was last loaded
+    def age(self):
+        return time.time() - self.lastRefresh
+
+    # Return the read-only table of every market, None if not loaded yet
+    def get_all(self):
+        return self.table
+
+    # Return the read-only row of one market, None if the table is not loaded
+    # or has no such market
+    def get(self, market):
+        table = self.table
+        if table is None:
+            return None
+        return table.get(market)
+
+    # Return True/False if the market exists, None if not loaded yet
+    def has_market(self, market):
+        table = self.table
+        if table is None:
+            return None
+        return market in table
+
+# Summaries of inactive markets can have null prices
+def to_float(value):
+    if value is None:
+        return None
+    return float(value)
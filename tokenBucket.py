@@ -0,0 +1,45 @@
+# This file contains the token bucket used to stay under exchange rate limits
+
+import threading
+import time
+
+'''
+This class is a thread safe token bucket. Tokens are added at 'rate' per
+second up to 'capacity', and every request to the exchange takes one. When the
+bucket is empty acquire() sleeps until a token is available, so callers are
+spread out to the exchange's limit instead of being rejected by it.
+'''
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.lastFill = time.monotonic()
+        self.lock = threading.Lock()
+
+    # Add the tokens earned since the last call, must hold the lock
+    def fill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity,
+                          self.tokens + (now - self.lastFill) * self.rate)
+        self.lastFill = now
+
+    # Take tokens without waiting, return True if they were available
+    def try_acquire(self, tokens=1):
+        with self.lock:
+            self.fill()
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return True
+            return False
+
+    # Take tokens, waiting until they are available
+    def acquire(self, tokens=1):
+        while True:
+            with self.lock:
+                self.fill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                waitTime = (tokens - self.tokens) / self.rate
+            time.sleep(waitTime)